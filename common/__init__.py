@@ -0,0 +1,5 @@
+"""Helpers shared by the runners, servers and clients of every part.
+
+Each part directory is still run from its own working directory; scripts
+add the repository root to ``sys.path`` and import from here.
+"""
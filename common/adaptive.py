@@ -0,0 +1,88 @@
+"""Adaptive repetition count for sweep points.
+
+Instead of a fixed number of runs per point, keep repeating until the 95%
+confidence interval of the point's metric is narrow enough, or a cap is
+hit. Configured from config.json:
+
+    "ci_target_abs": 0.01,   # stop when CI half-width <= 0.01 (metric units)
+    "ci_target_rel": 0.05,   # ... or <= 5% of the mean
+    "min_runs": 3,
+    "max_runs": 20
+
+With neither target set the runner keeps its old fixed count.
+"""
+import math
+
+# two-sided 95% Student t critical values by degrees of freedom
+_T975 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365,
+         8: 2.306, 9: 2.262, 10: 2.228, 11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145,
+         15: 2.131, 16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093, 20: 2.086,
+         25: 2.060, 30: 2.042, 40: 2.021, 60: 2.000, 120: 1.980}
+
+
+def t975(df):
+    """Two-sided 95% t critical value (conservative between table rows)."""
+    if df < 1:
+        return float("inf")
+    if df > 120:
+        return 1.96
+    return _T975[max(d for d in _T975 if d <= df)]
+
+
+def ci95(values):
+    """(mean, half-width of the 95% t interval); half-width is inf for n < 2."""
+    n = len(values)
+    if n == 0:
+        return float("nan"), float("inf")
+    mean = sum(values) / n
+    if n < 2:
+        return mean, float("inf")
+    var = sum((v - mean) ** 2 for v in values) / (n - 1)
+    return mean, t975(n - 1) * math.sqrt(var / n)
+
+
+class AdaptiveRepeats:
+    def __init__(self, min_runs=3, max_runs=20, target_abs=None, target_rel=None):
+        self.min_runs = min_runs
+        self.max_runs = max(max_runs, min_runs)
+        self.target_abs = target_abs
+        self.target_rel = target_rel
+
+    @classmethod
+    def from_config(cls, config, default_runs):
+        """Build from config keys; fixed `default_runs` if no target is set."""
+        def get(key, conv):
+            val = config.get(key)
+            return conv(val) if val not in (None, "") else None
+        target_abs = get("ci_target_abs", float)
+        target_rel = get("ci_target_rel", float)
+        if target_abs is None and target_rel is None:
+            return cls(default_runs, default_runs)
+        return cls(get("min_runs", int) or 3, get("max_runs", int) or 20, target_abs, target_rel)
+
+    @property
+    def adaptive(self):
+        return self.target_abs is not None or self.target_rel is not None
+
+    def done(self, values, attempts=None):
+        """True once `values` meet the target, or after max_runs attempts.
+
+        `attempts` counts runs including failed ones (default len(values)).
+        """
+        attempts = len(values) if attempts is None else attempts
+        if attempts >= self.max_runs:
+            return True
+        if len(values) < self.min_runs:
+            return False
+        if not self.adaptive:
+            return True
+        mean, half = ci95(values)
+        if self.target_abs is not None and half <= self.target_abs:
+            return True
+        if self.target_rel is not None and mean and half <= self.target_rel * abs(mean):
+            return True
+        return False
+
+    def describe(self, values):
+        mean, half = ci95(values)
+        return f"n={len(values)} mean={mean:.4g} ±{half:.3g}"
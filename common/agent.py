@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""Pre-warmed client agent, one per Mininet host.
+
+Starting ``python3 client.py`` for every run puts interpreter startup and
+imports inside the measured interval, and that cost differs between hosts.
+Instead the runner starts one agent per host, once per sweep:
+
+    proc = host.popen("python3 ../common/agent.py client.py",
+                      stdin=PIPE, stdout=PIPE, stderr=STDOUT)
+    agent = AgentHandle(proc, name="client1")
+    agent.wait_ready()
+
+The agent imports client.py (as a module, so its ``__main__`` block does
+not run) and prints ``READY``. Then it reads JSON commands from stdin, one
+per line, and answers each with one JSON line on stdout:
+
+    {"cmd": "prepare", "argv": ["--batch-size", "4", "--client-id", "rogue"],
+     "stdout": "logs/rogue.log"}
+        -> {"ok": true, "ready": true}
+    {"cmd": "go", "at": 81234.5}
+        -> {"ok": true, "start_mono": 81234.50001, "finish_mono": 81238.21,
+            "elapsed_s": 3.71, "result": {"words": 20000, "bytes": 131072, ...}}
+    {"cmd": "run", ...}          (prepare + go immediately)
+    {"cmd": "exit"}
+
+``prepare`` calls the client's ``prepare(argv)`` (parse arguments, connect
+to the server) if it has one; the download itself starts on ``go``. This
+is the start barrier: the runner prepares every agent, waits for all of
+them to report ready, then broadcasts ``go`` with a common start time
+``at`` on CLOCK_MONOTONIC. Mininet hosts are network namespaces of one
+kernel, so that clock is shared: agents start as close to ``at`` as the
+scheduler allows (the runner prints the measured skew), and completion
+times are taken on the same clock.
+
+``result`` is whatever dict the client's run function returned, the same
+structured result a client started on its own prints (see resultchan.py);
+a result with an ``error`` makes the reply not ok. ``collect_replies``
+reads the replies of many agents at once, so an agent that dies or
+overruns is reported as soon as that is known.
+
+The client's prints go to ``stdout`` (default /dev/null). Anything else
+the client writes to fd 1 is sent to /dev/null too, so it cannot corrupt
+the control channel.
+"""
+import contextlib
+import importlib.util
+import json
+import os
+import select
+import selectors
+import sys
+import time
+import traceback
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.wordcount import reset_peak_rss
+
+READY_LINE = "READY"
+
+
+def load_client(path):
+    spec = importlib.util.spec_from_file_location("client", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Job:
+    """One prepared download, waiting for the start signal."""
+
+    def __init__(self, module, msg):
+        self.out_path = msg.get("stdout") or os.devnull
+        d = os.path.dirname(self.out_path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.out = open(self.out_path, "w")
+        argv = msg.get("argv", [])
+        reset_peak_rss()            # the run's own peak RSS, not the agent's so far
+        try:
+            with self._redirect():
+                if hasattr(module, "prepare"):
+                    self.fn = module.prepare(argv)
+                else:
+                    self.fn = lambda: module.main(argv)
+        except BaseException:
+            self.out.close()
+            raise
+
+    def _redirect(self):
+        stack = contextlib.ExitStack()
+        stack.enter_context(contextlib.redirect_stdout(self.out))
+        stack.enter_context(contextlib.redirect_stderr(self.out))
+        return stack
+
+    def cancel(self):
+        self.out.close()
+
+    def go(self, at=None):
+        if at is not None:
+            wait_until(at)
+        try:
+            with self._redirect():
+                start = time.monotonic()
+                result = self.fn()
+                finish = time.monotonic()
+        finally:
+            self.out.close()
+        reply = {"ok": True, "start_mono": start, "finish_mono": finish,
+                 "elapsed_s": finish - start}
+        if isinstance(result, dict):
+            reply["result"] = result
+            if result.get("error"):
+                reply["ok"] = False
+                reply["error"] = result["error"]
+        return reply
+
+
+def wait_until(at):
+    """Sleep until monotonic time `at`, spinning for the last 200 us."""
+    while True:
+        remaining = at - time.monotonic()
+        if remaining <= 0:
+            return
+        if remaining > 0.0003:
+            time.sleep(remaining - 0.0002)
+
+
+def handle(module, msg, state):
+    cmd = msg.get("cmd")
+    if cmd == "prepare":
+        stale = state.pop("job", None)
+        if stale is not None:          # a previous barrier was abandoned
+            stale.cancel()
+        state["job"] = Job(module, msg)
+        return {"ok": True, "ready": True}
+    if cmd == "go":
+        job = state.pop("job", None)
+        if job is None:
+            return {"ok": False, "error": "go without prepare"}
+        return job.go(msg.get("at"))
+    if cmd == "run":
+        return Job(module, msg).go()
+    return {"ok": False, "error": f"unknown command {cmd!r}"}
+
+
+def serve(client_path):
+    # keep the real stdout for replies; point fd 1 at /dev/null for strays
+    ctl = os.fdopen(os.dup(1), "w", buffering=1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    sys.stdout = open(os.devnull, "w")
+
+    module = load_client(client_path)
+    ctl.write(READY_LINE + "\n")
+
+    state = {}
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            msg = json.loads(line)
+            if msg.get("cmd") == "exit":
+                break
+            reply = handle(module, msg, state)
+        except SystemExit as e:          # argparse errors end up here
+            reply = {"ok": False, "error": f"client exited with {e.code}"}
+        except Exception as e:
+            reply = {"ok": False, "error": f"{type(e).__name__}: {e}",
+                     "traceback": traceback.format_exc()}
+        ctl.write(json.dumps(reply) + "\n")
+
+
+class AgentHandle:
+    """Runner side of one agent process (started with stdin/stdout pipes)."""
+
+    def __init__(self, proc, name=""):
+        self.proc = proc
+        self.name = name
+        self._buf = b""
+
+    def _readline(self, timeout):
+        fd = self.proc.stdout.fileno()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while b"\n" not in self._buf:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise RuntimeError(f"agent {self.name}: no reply after {timeout}s")
+            readable, _, _ = select.select([fd], [], [], remaining)
+            if not readable:
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise RuntimeError(f"agent {self.name} exited: {self._buf.decode(errors='replace')!r}")
+            self._buf += chunk
+        line, self._buf = self._buf.split(b"\n", 1)
+        return line.decode().strip()
+
+    @property
+    def alive(self):
+        return self.proc.poll() is None
+
+    def wait_ready(self, timeout=30.0):
+        while self._readline(timeout) != READY_LINE:
+            pass
+
+    def send(self, **msg):
+        self.proc.stdin.write((json.dumps(msg) + "\n").encode())
+        self.proc.stdin.flush()
+
+    def reply(self, timeout=None):
+        return json.loads(self._readline(timeout))
+
+    def run(self, argv, stdout=None):
+        """Start a download; collect the result later with reply()."""
+        self.send(cmd="run", argv=[str(a) for a in argv], stdout=stdout)
+
+    def prepare(self, argv, stdout=None):
+        """Set up a download to start on go(); collect readiness with reply()."""
+        self.send(cmd="prepare", argv=[str(a) for a in argv], stdout=stdout)
+
+    def go(self, at):
+        self.send(cmd="go", at=at)
+
+    def close(self, timeout=5.0):
+        """Ask the agent to exit (kill it if it does not)."""
+        try:
+            self.send(cmd="exit")
+            self.proc.stdin.close()
+            self.proc.wait(timeout=timeout)
+        except Exception:
+            self.proc.kill()
+            self.proc.wait()
+
+
+def collect_replies(agents, timeout=None, on_reply=None):
+    """One reply from each agent, read concurrently, in agent order.
+
+    An agent that exits gets {"ok": False, "error": "agent exited ..."} as
+    soon as its pipe closes, and one with no reply after `timeout` seconds
+    is killed and gets {"ok": False, "error": "no reply ..."}; neither
+    holds up the others. Check ``alive`` before reusing the agents.
+    on_reply(agent, reply) is called as each reply arrives.
+    """
+    replies = {}
+
+    def finish(agent, reply):
+        replies[agent] = reply
+        if on_reply:
+            on_reply(agent, reply)
+
+    sel = selectors.DefaultSelector()
+    for agent in agents:
+        if b"\n" in agent._buf:           # already buffered by an earlier read
+            finish(agent, agent.reply())
+        else:
+            sel.register(agent.proc.stdout.fileno(), selectors.EVENT_READ, agent)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while len(replies) < len(agents):
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            break
+        for key, _ in sel.select(remaining):
+            agent = key.data
+            chunk = os.read(key.fd, 65536)
+            if not chunk:
+                sel.unregister(key.fd)
+                finish(agent, {"ok": False, "error": f"agent {agent.name} exited: "
+                                                     f"{agent._buf.decode(errors='replace')!r}"})
+                continue
+            agent._buf += chunk
+            if b"\n" in agent._buf:
+                sel.unregister(key.fd)
+                finish(agent, agent.reply())
+    for agent in agents:
+        if agent not in replies:
+            agent.proc.kill()
+            agent.proc.wait()
+            finish(agent, {"ok": False, "error": f"agent {agent.name}: no reply after {timeout}s"})
+    sel.close()
+    return [replies[agent] for agent in agents]
+
+
+def start_together(agents, jobs, margin=0.005, timeout=30.0, run_timeout=None, on_reply=None):
+    """Start barrier: prepare every agent, then start all at one instant.
+
+    `jobs` is a list of (argv, stdout) per agent. Returns the common start
+    time (CLOCK_MONOTONIC) and the agents' replies, in order (see
+    collect_replies for `run_timeout` and `on_reply`). Raises RuntimeError
+    if an agent fails to prepare.
+    """
+    for agent, (argv, stdout) in zip(agents, jobs):
+        agent.prepare(argv, stdout)
+    for agent, reply in zip(agents, collect_replies(agents, timeout)):
+        if not reply.get("ok"):
+            raise RuntimeError(f"agent {agent.name} not ready: {reply.get('error')}")
+    # leave enough time for every go line to be written and read
+    t_go = time.monotonic() + margin + 0.0002 * len(agents)
+    for agent in agents:
+        agent.go(t_go)
+    return t_go, collect_replies(agents, run_timeout, on_reply)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: agent.py CLIENT_SCRIPT")
+    serve(sys.argv[1])
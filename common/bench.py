@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+"""Benchmarks of the request-handling hot path of every server variant.
+
+micro   in-process timings (ns per request) of each server's own request
+        handler, imported from its server file against a synthetic corpus:
+
+          part2, part3_new, part4  build_response("p,k")
+          part3                    handle_request("p,k")
+          p3                       line split + FCFSWordServer._handle_request
+
+        plus the stages they are made of, independent of any server:
+
+          parse       "p,k" -> (p, k)
+          slice_join  ",".join(words[p:p+k]) + "\\n"
+          frame       cut the request lines out of a pipelined receive
+                      buffer and encode the response, as p3/part3 do
+
+        swept over k and the corpus size. part1 is C++ and only appears in
+        the macro benchmark.
+macro   each server started on loopback in a scratch directory and driven by
+        loadgen.py with a fixed client mix (one greedy client with c=10 and
+        nine with c=1; part1 serves one connection at a time, so it gets
+        four c=1 clients). part3_new_udp and part4_udp are the same servers
+        taking the requests as datagrams (datagram.py) instead of one TCP
+        connection each. With --macro-transports tcp unix every Python
+        TCP variant is run a second time over its Unix socket (unixsock.py),
+        which leaves the protocol and scheduler cost without the TCP/IP
+        stack. Reported per run: requests/s, bytes/s, p50/p99
+        request latency (loadgen, includes the connect for one-connection-
+        per-request servers) and server CPU per request (utime+stime from
+        /proc/<pid>/stat).
+clients one client downloading a large file from its own server (part1,
+        part3 with "repeat_words", part4), for the streaming word counts:
+        completion time and the client's peak RSS per repeat factor. Not
+        part of "all".
+classes a mixed load of greedy bulk clients and interactive clients tagged
+        prio=1 with a deadline (scheduling.py) against part3, p3 and part4
+        under each of --class-policies: per-class request latency
+        p50/p99/p999 and deadline misses (loadgen), and the server's
+        per-class queue wait p50/p99/p999 ("classes" stats command). Each
+        class sends from its own loopback address, since part4 queues
+        per client IP. Not part of "all".
+
+Every measurement is repeated and all samples are kept, keyed by variant
+and parameters, in one JSON report; regression.py compares a report with a
+stored baseline:
+
+    python3 bench.py micro --k 1 10 100 --words 1000 100000
+    python3 bench.py macro --variants part3 p3 part4 --repeats 5
+    python3 bench.py macro --variants part4 --macro-transports tcp unix
+    python3 bench.py all --out bench.json
+    python3 bench.py clients --repeat-words 1 10 100
+    python3 bench.py classes --class-policies fcfs prio edf
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.readiness import wait_ready, stop
+from common.resultchan import parse as parse_result
+from common.scheduling import POLICIES
+from common.stats import query
+
+ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+LOADGEN = os.path.join(ROOT, "common", "loadgen.py")
+
+# variant -> (server file, loadgen protocol)
+SERVERS = {
+    "part1": ("part1/server.cpp", "persistent"),
+    "part2": ("part2/server.py", "conn"),
+    "part3": ("part3/server.py", "persistent"),
+    "p3": ("p3/server_part3_fcfs.py", "persistent"),
+    "part3_new": ("part3_new/server.py", "conn"),
+    "part4": ("part4/server.py", "conn"),
+    "part3_new_udp": ("part3_new/server.py", "udp"),
+    "part4_udp": ("part4/server.py", "udp"),
+}
+# Python servers with their own request handler (the udp variants share theirs)
+MICRO_VARIANTS = [v for v in SERVERS if v != "part1" and SERVERS[v][1] != "udp"]
+CLIENTS = {"part1": "part1/client.cpp", "part3": "part3/client.py", "part4": "part4/client.py"}
+MIX = ["rogue:1:c=10", "normal:9:c=1"]
+SEQUENTIAL_MIX = ["client:4:c=1"]       # part1: one connection at a time, backlog 5
+# classes: the servers with priority scheduling, and the mixed load they get
+# (one loopback address per class: part4 queues per client IP)
+CLASS_VARIANTS = ["part3", "p3", "part4"]
+CLASS_MIX = ["bulk:2:c=50,src=127.0.0.2",
+             "interactive:8:c=1,prio=1,deadline_ms=2,src=127.0.0.3"]
+
+
+def make_corpus(path, n, repeat=1):
+    """n distinct short words on one comma-separated line, `repeat` times over."""
+    with open(path, "w") as f:
+        f.write(",".join([f"w{i}" for i in range(n)] * repeat))
+
+
+def write_config(path, port, extra=None):
+    """Config every server can read: indented JSON is also what the
+    one-key-per-line parsers (part1, part2, part3) expect."""
+    config = {"server_ip": "127.0.0.1", "port": port, "server_port": port,
+              "filename": "words.txt", "k": 10, "p": 0, "proc_ms": 0}
+    config.update(extra or {})
+    with open(path, "w") as f:
+        json.dump(config, f, indent=2)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def summary(samples):
+    return {"median": statistics.median(samples), "min": min(samples), "max": max(samples)}
+
+
+# --- micro -------------------------------------------------------------------
+
+def load_handler(variant, n):
+    """The variant's request handler, str -> str, over the corpus in cwd."""
+    path = os.path.join(ROOT, SERVERS[variant][0])
+    spec = importlib.util.spec_from_file_location(f"bench_{variant}_{n}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)       # loads config.json / words.txt from cwd
+    if variant == "p3":
+        server = module.FCFSWordServer()
+
+        def handler(line):
+            p_str, k_str = line.split(",", 1)
+            return server._handle_request(int(p_str.strip()), int(k_str.strip()))
+        return handler
+    if variant == "part3":
+        return module.handle_request
+    return module.build_response
+
+
+def stage_benches(words):
+    def parse(line):
+        p, k = map(int, line.split(","))
+        return p, k
+
+    def slice_join(line):
+        p, k = parse(line)
+        return ",".join(words[p:p + k]) + "\n"
+
+    def frame(line):
+        buf = bytearray((line + "\n").encode() * 10)
+        while True:
+            nl = buf.find(b"\n")
+            if nl == -1:
+                break
+            req = buf[:nl].decode(errors="ignore").strip()
+            del buf[:nl + 1]
+        return (req + "\n").encode() * 10
+
+    return {"parse": parse, "slice_join": slice_join, "frame": frame}
+
+
+def time_ns_per_op(fn, lines, repeats, min_s=0.05):
+    """Per-op time of fn over `lines`, `repeats` samples of at least min_s each."""
+    number = len(lines)
+    while True:
+        t0 = time.perf_counter_ns()
+        for _ in range(number // len(lines)):
+            for line in lines:
+                fn(line)
+        elapsed = time.perf_counter_ns() - t0
+        if elapsed >= min_s * 1e9:
+            break
+        number *= 2
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter_ns()
+        for _ in range(number // len(lines)):
+            for line in lines:
+                fn(line)
+        samples.append((time.perf_counter_ns() - t0) / number)
+    return samples
+
+
+def run_micro(args):
+    results = []
+    cwd = os.getcwd()
+    for n in args.words:
+        with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+            make_corpus(os.path.join(tmp, "words.txt"), n)
+            write_config(os.path.join(tmp, "config.json"), 0)
+            os.chdir(tmp)
+            try:
+                benches = stage_benches([f"w{i}" for i in range(n)])
+                for variant in args.variants:
+                    if variant in MICRO_VARIANTS:
+                        benches[variant] = load_handler(variant, n)
+                for name, fn in benches.items():
+                    for k in args.k:
+                        # 64 requests walking through the corpus, wrapping at the end
+                        lines = [f"{(i * k) % n},{k}" for i in range(64)]
+                        samples = time_ns_per_op(fn, lines, args.repeats)
+                        stats = summary(samples)
+                        results.append({"key": f"micro/{name}/words={n}/k={k}", "bench": name,
+                                        "words": n, "k": k, "metric": "ns_per_op",
+                                        "samples": samples, **stats})
+                        print(f"micro {name:>10} words={n:<7} k={k:<5} "
+                              f"{stats['median']:10.0f} ns/op", flush=True)
+            finally:
+                os.chdir(cwd)
+    return results
+
+
+# --- macro -------------------------------------------------------------------
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def build_part1(tmp, name="server"):
+    """Compile the C++ server (or client) with the flags of part1/Makefile."""
+    target = os.path.join(tmp, name)
+    subprocess.run(["make", "-s", "-C", os.path.join(ROOT, "part1"), target,
+                    f"{name.upper()}={target}"], check=True)
+    return target
+
+
+def macro_once(variant, args, tmp, transport="tcp"):
+    """One loadgen run against a fresh server; returns (metrics, client mix)."""
+    port = free_port()
+    extra = {"k": args.macro_k}
+    if SERVERS[variant][1] == "udp":
+        extra["udp_port"] = free_port()     # requests go there, the TCP port stays unused
+    unix = []
+    if transport == "unix":
+        extra["unix_socket"] = os.path.join(tmp, "server.sock")
+        unix = ["--unix", extra["unix_socket"]]
+    write_config(os.path.join(tmp, "config.json"), port, extra)
+    if variant == "part1":
+        cmd = [os.path.join(tmp, "server")]
+    else:
+        cmd = [sys.executable, os.path.join(ROOT, SERVERS[variant][0])]
+    mix = SEQUENTIAL_MIX if variant == "part1" else MIX
+    proc = subprocess.Popen(cmd, cwd=tmp, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    try:
+        wait_ready(proc)
+        cpu0 = cpu_seconds(proc.pid)
+        out = os.path.join(tmp, "summary.json")
+        subprocess.run([sys.executable, LOADGEN, "--host", "127.0.0.1",
+                        "--port", str(extra.get("udp_port", port)),
+                        "--proto", SERVERS[variant][1], *unix,
+                        "--format", "none", "--summary", out,
+                        *(a for g in mix for a in ("--group", g))],
+                       cwd=tmp, check=True, stdout=subprocess.DEVNULL, timeout=args.timeout)
+        cpu = cpu_seconds(proc.pid) - cpu0
+    finally:
+        stop(proc)
+    with open(out) as f:
+        s = json.load(f)
+    if s["failed"] or s["unfinished"]:
+        raise RuntimeError(f"{variant}: {s['failed']} clients failed, {s['unfinished']} unfinished")
+    return {"requests_per_s": s["requests_per_s"], "bytes_per_s": s["bytes_per_s"],
+            "p50_ms": s["latency_ms"]["p50"], "p99_ms": s["latency_ms"]["p99"],
+            "cpu_us_per_request": 1e6 * cpu / max(s["requests"], 1)}, mix
+
+
+def macro_runs(args):
+    """(variant, transport) pairs of the macro benchmark: the Unix socket only
+    for the Python servers over TCP."""
+    for transport in getattr(args, "macro_transports", ["tcp"]):   # older baselines: tcp
+        for variant in args.variants:
+            if transport == "unix" and (variant == "part1" or SERVERS[variant][1] == "udp"):
+                continue
+            yield variant, transport
+
+
+def run_macro(args):
+    results = []
+    for variant, transport in macro_runs(args):
+        with tempfile.TemporaryDirectory(prefix=f"bench-{variant}-") as tmp:
+            make_corpus(os.path.join(tmp, "words.txt"), args.macro_words)
+            if variant == "part1":
+                build_part1(tmp)
+            runs = []
+            for _ in range(args.repeats):
+                metrics, mix = macro_once(variant, args, tmp, transport)
+                runs.append(metrics)
+            name = variant if transport == "tcp" else f"{variant}/{transport}"
+            entry = {"key": f"macro/{name}/words={args.macro_words}/k={args.macro_k}",
+                     "variant": variant, "proto": SERVERS[variant][1], "transport": transport,
+                     "mix": mix, "words": args.macro_words, "k": args.macro_k, "runs": runs,
+                     "median": {m: statistics.median(r[m] for r in runs) for m in runs[0]}}
+            results.append(entry)
+            med = entry["median"]
+            print(f"macro {variant:>13} {transport:>4} {med['requests_per_s']:9.0f} req/s "
+                  f"{med['bytes_per_s'] / 1e6:7.2f} MB/s p99 {med['p99_ms']:7.2f} ms "
+                  f"{med['cpu_us_per_request']:7.1f} us CPU/req", flush=True)
+    return results
+
+
+# --- clients -----------------------------------------------------------------
+
+def client_once(variant, args, tmp, repeat):
+    """Download the whole file with one client; returns its time and peak RSS."""
+    port = free_port()
+    extra = {"k": args.client_k}
+    if variant == "part3":
+        extra["repeat_words"] = repeat      # the server repeats the corpus itself
+    write_config(os.path.join(tmp, "config.json"), port, extra)
+    if variant == "part1":
+        server, client = [os.path.join(tmp, "server")], [os.path.join(tmp, "client")]
+    else:
+        server = [sys.executable, os.path.join(ROOT, SERVERS[variant][0])]
+        client = [sys.executable, os.path.join(ROOT, CLIENTS[variant])]
+    proc = subprocess.Popen(server, cwd=tmp, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    try:
+        wait_ready(proc)
+        t0 = time.monotonic()
+        out = subprocess.run(client, cwd=tmp, capture_output=True, text=True, check=True,
+                             timeout=args.timeout).stdout
+        wall_ms = 1000.0 * (time.monotonic() - t0)
+    finally:
+        stop(proc)
+    result = parse_result(out)
+    return {"elapsed_ms": result["elapsed_ms"], "wall_ms": wall_ms,
+            "peak_rss_kb": result["peak_rss_kb"]}
+
+
+def run_clients(args):
+    results = []
+    for variant in (v for v in args.variants if v in CLIENTS):
+        for repeat in args.repeat_words:
+            with tempfile.TemporaryDirectory(prefix=f"bench-{variant}-") as tmp:
+                make_corpus(os.path.join(tmp, "words.txt"), args.client_words,
+                            1 if variant == "part3" else repeat)
+                if variant == "part1":
+                    build_part1(tmp)
+                    build_part1(tmp, "client")
+                runs = [client_once(variant, args, tmp, repeat) for _ in range(args.repeats)]
+            total = args.client_words * repeat
+            entry = {"key": f"clients/{variant}/words={total}/k={args.client_k}",
+                     "variant": variant, "words": total, "repeat_words": repeat,
+                     "k": args.client_k, "runs": runs,
+                     "median": {m: statistics.median(r[m] for r in runs) for m in runs[0]}}
+            results.append(entry)
+            med = entry["median"]
+            print(f"clients {variant:>5} words={total:<9} {med['elapsed_ms']:9.1f} ms "
+                  f"peak RSS {med['peak_rss_kb'] / 1024:7.1f} MB", flush=True)
+    return results
+
+
+# --- classes -----------------------------------------------------------------
+
+def classes_once(variant, policy, args, tmp):
+    """One mixed-load run; returns per-class metrics."""
+    port = free_port()
+    sock = os.path.join(tmp, "stats.sock")
+    write_config(os.path.join(tmp, "config.json"), port,
+                 {"k": args.macro_k, "scheduler": policy, "stats_socket": sock})
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, SERVERS[variant][0])], cwd=tmp,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    try:
+        wait_ready(proc)
+        out = os.path.join(tmp, "summary.json")
+        subprocess.run([sys.executable, LOADGEN, "--host", "127.0.0.1", "--port", str(port),
+                        "--proto", SERVERS[variant][1], "--format", "none", "--summary", out,
+                        *(a for g in CLASS_MIX for a in ("--group", g))],
+                       cwd=tmp, check=True, stdout=subprocess.DEVNULL, timeout=args.timeout)
+        classes = query(sock, "classes")
+    finally:
+        stop(proc)
+    with open(out) as f:
+        s = json.load(f)
+    if s["failed"] or s["unfinished"]:
+        raise RuntimeError(f"{variant}: {s['failed']} clients failed, {s['unfinished']} unfinished")
+    metrics = {}
+    for name, g in s["groups"].items():
+        for q in ("p50", "p99", "p999"):
+            metrics[f"{name}_{q}_ms"] = g["latency_ms"][q]
+        if "missed" in g:
+            metrics[f"{name}_missed_pct"] = 100.0 * g["missed"] / max(g["requests"], 1)
+        c = classes.get(str(g["prio"]), {})
+        for q in ("p50", "p99", "p999"):
+            metrics[f"{name}_queue_{q}_ms"] = c.get(f"{q}_wait_ms", float("nan"))
+    return metrics
+
+
+def run_classes(args):
+    results = []
+    for variant in (v for v in args.variants if v in CLASS_VARIANTS):
+        for policy in args.class_policies:
+            with tempfile.TemporaryDirectory(prefix=f"bench-{variant}-") as tmp:
+                make_corpus(os.path.join(tmp, "words.txt"), args.macro_words)
+                runs = [classes_once(variant, policy, args, tmp) for _ in range(args.repeats)]
+            entry = {"key": f"classes/{variant}/{policy}/words={args.macro_words}/k={args.macro_k}",
+                     "variant": variant, "policy": policy, "mix": CLASS_MIX,
+                     "words": args.macro_words, "k": args.macro_k, "runs": runs,
+                     "median": {m: statistics.median(r[m] for r in runs) for m in runs[0]}}
+            results.append(entry)
+            med = entry["median"]
+            print(f"classes {variant:>5} {policy:>4} "
+                  + " ".join(f"{g}: p99 {med[f'{g}_p99_ms']:7.2f} ms" for g in ("bulk", "interactive"))
+                  + f" missed {med['interactive_missed_pct']:5.1f}%", flush=True)
+    return results
+
+
+def machine_info():
+    try:
+        rev = subprocess.run(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+                             capture_output=True, text=True).stdout.strip()
+    except OSError:
+        rev = ""
+    return {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "git": rev, "host": platform.node(),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count()}
+
+
+SUITE_OPTIONS = ("what", "variants", "repeats", "k", "words", "macro_words", "macro_k",
+                 "macro_transports", "timeout", "client_words", "repeat_words", "client_k",
+                 "class_policies")
+
+
+def add_suite_options(ap):
+    """The options that define a suite run (shared with regression.py)."""
+    ap.add_argument("--variants", nargs="+", choices=list(SERVERS), default=list(SERVERS))
+    ap.add_argument("--repeats", type=int, default=5, help="samples per measurement")
+    ap.add_argument("--k", type=int, nargs="+", default=[1, 10, 100, 1000], help="micro: k values")
+    ap.add_argument("--words", type=int, nargs="+", default=[1000, 100000],
+                    help="micro: corpus sizes")
+    ap.add_argument("--macro-words", type=int, default=5000, help="macro: corpus size")
+    ap.add_argument("--macro-k", type=int, default=10, help="macro: k of every client")
+    ap.add_argument("--macro-transports", nargs="+", choices=["tcp", "unix"], default=["tcp"],
+                    help="macro: run the Python TCP servers over these transports")
+    ap.add_argument("--timeout", type=float, default=300.0,
+                    help="macro/clients: limit per loadgen or client run (s)")
+    ap.add_argument("--client-words", type=int, default=10000, help="clients: distinct words")
+    ap.add_argument("--repeat-words", type=int, nargs="+", default=[1, 10, 100],
+                    help="clients: corpus repeat factors")
+    ap.add_argument("--client-k", type=int, default=1000, help="clients: k")
+    ap.add_argument("--class-policies", nargs="+", choices=POLICIES, default=["fcfs", "prio", "edf"],
+                    help="classes: scheduling policies to compare")
+
+
+def run_suite(args):
+    """Run args.what (micro, macro, all, clients or classes) and return the report."""
+    report = {"machine": machine_info(), "repeats": args.repeats,
+              "options": {name: getattr(args, name) for name in SUITE_OPTIONS},
+              "micro": [], "macro": []}
+    if args.what in ("micro", "all"):
+        report["micro"] = run_micro(args)
+    if args.what in ("macro", "all"):
+        report["macro"] = run_macro(args)
+    if args.what == "clients":
+        report["clients"] = run_clients(args)
+    if args.what == "classes":
+        report["classes"] = run_classes(args)
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("what", choices=["micro", "macro", "all", "clients", "classes"])
+    add_suite_options(ap)
+    ap.add_argument("--out", default="bench.json", help="JSON report")
+    args = ap.parse_args()
+
+    report = run_suite(args)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Gathered writes for coalesced responses.
+
+When the head of a server's queue holds several requests from the same
+connection in a row (a greedy client's pipelined burst), the worker can
+serve them back to back and hand all responses to the kernel in one
+``sendmsg`` instead of one ``sendall`` each. Only consecutive head items
+are taken, so the scheduling order does not change. Servers enable this
+with ``"coalesce_us"`` in config.json: the time budget, counted from the
+first response of a batch, within which further head items for the same
+socket may still be added (checked before each one is taken).
+"""
+import select
+
+IOV_MAX = 1024
+
+
+def sendmsg_all(sock, chunks):
+    """Send every chunk in order with as few sendmsg calls as possible.
+
+    Works for blocking and non-blocking sockets (waits for writability).
+    Returns the number of sendmsg calls made.
+    """
+    views = [memoryview(c) for c in chunks if len(c)]
+    calls = 0
+    i = 0
+    while i < len(views):
+        try:
+            n = sock.sendmsg(views[i:i + IOV_MAX])
+        except (BlockingIOError, InterruptedError):
+            select.select([], [sock], [])
+            continue
+        calls += 1
+        while i < len(views) and n >= len(views[i]):
+            n -= len(views[i])
+            i += 1
+        if n:
+            views[i] = views[i][n:]
+    return calls
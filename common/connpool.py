@@ -0,0 +1,110 @@
+"""A client's pool of persistent connections to a one-request-per-connection server.
+
+The part4 client used to open ``c`` connections every round, send one
+request on each, read one response and close them all: a handshake (and a
+TIME_WAIT socket) per request. With ``"keep_alive": 1`` in config.json the
+server keeps a connection open after its response and reads the next
+request from it, and the client keeps its ``c`` connections in a
+ConnectionPool across rounds instead.
+
+A pooled connection still carries one request at a time, and a client
+still has ``c`` requests outstanding per round, all from the same address:
+the server's per-client queues see exactly what they saw with fresh
+connections, so scheduling and fairness are unchanged.
+
+If the server closes a reused connection anyway (no keep_alive, or it was
+restarted), ``exchange`` reconnects once and sends the request again, and
+from then on the pool closes every connection after its response, as the
+client did without a pool.
+
+The pool counts its connects and the time they took, so the handshake time
+saved by reuse can be reported: the reused requests times the mean connect
+time.
+"""
+import time
+
+
+class ConnectionPool:
+    def __init__(self, addr, size, connect):
+        self.addr = addr
+        self.connect = connect          # connect(addr) -> socket, e.g. with retry
+        self.conns = [None] * size
+        self.used = [False] * size      # conns[i] already completed a request
+        self.connects = 0
+        self.connect_ns = 0
+        self.reused = 0                 # requests sent on an already used connection
+        self.reconnects = 0             # reused connections the server had closed
+        self.keep = True                # False once the server closed a reused connection
+
+    def get(self, i):
+        """Connection i, opened if it is not open yet."""
+        conn = self.conns[i]
+        if conn is None:
+            t0 = time.perf_counter_ns()
+            conn = self.connect(self.addr)
+            self.connect_ns += time.perf_counter_ns() - t0
+            self.connects += 1
+            self.conns[i] = conn
+            self.used[i] = False
+        return conn
+
+    def send(self, i, request):
+        """Send one request line (bytes) on connection i."""
+        conn = self.get(i)
+        if self.used[i]:
+            self.reused += 1
+        try:
+            conn.sendall(request)
+        except OSError:
+            if not self.reopen(i):
+                raise                   # a new connection failed: not a stale one
+            self.conns[i].sendall(request)
+
+    def exchange(self, i, request, recv_line):
+        """The response to `request`, already sent on connection i.
+
+        An empty response on a reused connection means the server had
+        closed it: send the request again on a new connection.
+        """
+        try:
+            response = recv_line(self.conns[i])
+        except OSError:
+            response = b""
+        if not response and self.reopen(i):
+            self.keep = False
+            self.conns[i].sendall(request)
+            response = recv_line(self.conns[i])
+        if response:
+            self.used[i] = True         # a full round trip: reusable from now on
+        return response
+
+    def done(self, i):
+        """The response on connection i was read: keep it for the next request, or close it."""
+        if not self.keep:
+            self.discard(i)
+
+    def reopen(self, i):
+        """Replace a reused connection the server closed; False if it was new."""
+        if not self.used[i] or self.conns[i] is None:
+            return False
+        self.discard(i)
+        self.reconnects += 1
+        self.get(i)
+        return True
+
+    def discard(self, i):
+        conn = self.conns[i]
+        if conn is not None:
+            conn.close()
+            self.conns[i] = None
+
+    def close(self):
+        for i in range(len(self.conns)):
+            self.discard(i)
+
+    def counters(self):
+        connect_ms = self.connect_ns / 1e6
+        mean_ms = connect_ms / self.connects if self.connects else 0.0
+        return {"connects": self.connects, "connect_ms": connect_ms, "reused": self.reused,
+                "reconnects": self.reconnects,
+                "handshake_saved_ms": (self.reused - self.reconnects) * mean_ms}
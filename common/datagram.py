@@ -0,0 +1,249 @@
+"""UDP transport for the one-request-per-connection servers (part3_new, part4).
+
+Over TCP every "p,k" request of those servers pays a handshake and a
+teardown for one short line each way. With ``udp_port`` in config.json the
+server also answers requests sent as datagrams, one request per datagram:
+
+    request    b"<id> <p>,<k>[<tags>]\\n"   (tags: see scheduling.split_tags)
+    response   b"<id> <i>/<n> " + fragment i of n of the response line
+
+``id`` is chosen by the client and echoed back. A response that fits in
+one datagram (``udp_payload`` bytes, default 1400 so it stays under a
+1500-byte MTU with the IP and UDP headers) comes back as the single
+fragment 1/1; longer ones are split and reassembled by the client.
+
+The server side (``serve_udp``) hands each request to the server's own
+queue with a DatagramReply in place of the connection, so the scheduler and
+worker code are the same for both transports and requests are still
+attributed to the client's IP. Answers are kept for a while, keyed by
+(client address, id): a retransmitted request that was already answered
+gets the same answer again without being queued, and one that is still
+queued is dropped.
+
+The client side (``UdpClient``, and ``Exchange`` for loadgen's asyncio
+client) sends a burst of requests, retransmits the unanswered ones after a
+timeout that doubles on every retry (``udp_timeout_ms``, default 200;
+``udp_retries``, default 8) and ignores answers it already has.
+"""
+import collections
+import socket
+import threading
+import time
+
+MAX_PAYLOAD = 1400
+
+
+def encode_request(rid, p, k, tags=b""):
+    return b"%d %d,%d%s\n" % (rid, p, k, tags)
+
+
+def parse_request(datagram):
+    """(id, "p,k") of a request datagram; ValueError if it has no id."""
+    head, _, data = datagram.partition(b" ")
+    return int(head), data.decode(errors="replace").strip()
+
+
+def fragments(rid, payload, max_payload=MAX_PAYLOAD):
+    chunks = [payload[i:i + max_payload] for i in range(0, len(payload), max_payload)] or [b""]
+    n = len(chunks)
+    return [b"%d %d/%d " % (rid, i + 1, n) + chunk for i, chunk in enumerate(chunks)]
+
+
+def parse_response(datagram):
+    """(id, i, n, chunk) of a response datagram; ValueError if malformed."""
+    rid, frag, chunk = datagram.split(b" ", 2)
+    i, n = frag.split(b"/")
+    return int(rid), int(i), int(n), chunk
+
+
+# --- server side -------------------------------------------------------------
+
+class DatagramReply:
+    """Takes the place of a client connection in the server's request queue."""
+
+    def __init__(self, endpoint, addr, rid):
+        self.endpoint = endpoint
+        self.addr = addr
+        self.rid = rid
+
+    def send(self, payload):
+        self.endpoint.reply(self.addr, self.rid, payload)
+        return len(payload)
+
+    def close(self):
+        pass
+
+
+class UdpEndpoint:
+    def __init__(self, sock, enqueue, stats, max_payload=MAX_PAYLOAD, remember=4096):
+        self.sock = sock
+        self.enqueue = enqueue          # enqueue(conn, client_id, data), as for TCP
+        self.stats = stats
+        self.max_payload = max_payload
+        self.remember = remember
+        self.answered = collections.OrderedDict()   # (addr, id) -> response datagrams
+        self.queued = set()                          # (addr, id) waiting for the worker
+        self.lock = threading.Lock()
+        self.received = 0
+        self.duplicates = 0
+        self.resent = 0
+
+    def reply(self, addr, rid, payload):
+        datagrams = fragments(rid, payload, self.max_payload)
+        with self.lock:
+            self.queued.discard((addr, rid))
+            self.answered[(addr, rid)] = datagrams
+            if len(self.answered) > self.remember:
+                self.answered.popitem(last=False)
+        for d in datagrams:
+            self.sock.sendto(d, addr)
+
+    def serve(self):
+        while True:
+            datagram, addr = self.sock.recvfrom(65535)
+            self.received += 1
+            try:
+                rid, data = parse_request(datagram)
+            except ValueError:
+                continue
+            key = (addr, rid)
+            with self.lock:
+                datagrams = self.answered.get(key)
+                duplicate = datagrams is not None or key in self.queued
+                if not duplicate:
+                    self.queued.add(key)
+            if duplicate:
+                self.duplicates += 1
+                if datagrams:
+                    self.resent += 1
+                    for d in datagrams:
+                        self.sock.sendto(d, addr)
+                continue
+            self.stats.on_accept()       # closed by the worker like a connection
+            self.enqueue(DatagramReply(self, addr, rid), addr[0], data)
+
+    def counters(self):
+        return {"received": self.received, "duplicates": self.duplicates,
+                "resent": self.resent, "queued": len(self.queued)}
+
+
+def serve_udp(config, enqueue, stats):
+    """Start answering datagram requests if config.json sets udp_port."""
+    port = int(config.get("udp_port", 0) or 0)
+    if not port:
+        return None
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    sock.bind((str(config.get("server_ip", "0.0.0.0")), port))
+    endpoint = UdpEndpoint(sock, enqueue, stats, int(config.get("udp_payload", MAX_PAYLOAD)))
+    stats.commands["udp"] = lambda args: endpoint.counters()
+    threading.Thread(target=endpoint.serve, daemon=True).start()
+    print(f"Server listening on udp {sock.getsockname()[0]}:{port}")
+    return endpoint
+
+
+# --- client side -------------------------------------------------------------
+
+class Exchange:
+    """One burst of requests: ids, retransmission, reassembly and duplicates."""
+
+    def __init__(self, requests, first_id, timeout, retries, tags=b""):
+        self.ids = list(range(first_id, first_id + len(requests)))
+        self.pending = {rid: encode_request(rid, p, k, tags)
+                        for rid, (p, k) in zip(self.ids, requests)}
+        self.timeout = timeout          # seconds until the next retransmission
+        self.retries = retries
+        self.tries = 0
+        self.parts = {}                 # id -> {i: chunk} of partly received responses
+        self.responses = {}             # id -> response line
+        self.done_at = {}               # id -> perf_counter_ns when it completed
+        self.retransmits = 0
+        self.duplicates = 0
+
+    @property
+    def done(self):
+        return not self.pending
+
+    def datagrams(self):
+        return list(self.pending.values())
+
+    def received(self, datagram):
+        try:
+            rid, i, n, chunk = parse_response(datagram)
+        except ValueError:
+            return
+        if rid not in self.pending:
+            self.duplicates += 1
+            return
+        parts = self.parts.setdefault(rid, {})
+        parts[i] = chunk
+        if len(parts) == n:
+            self.responses[rid] = b"".join(parts[j] for j in range(1, n + 1))
+            self.done_at[rid] = time.perf_counter_ns()
+            del self.parts[rid], self.pending[rid]
+
+    def timed_out(self):
+        """Datagrams to send again; TimeoutError once the retries are used up."""
+        self.tries += 1
+        if self.tries > self.retries:
+            raise TimeoutError(f"no answer to {len(self.pending)} requests "
+                               f"after {self.retries} retransmissions")
+        self.timeout *= 2
+        self.retransmits += len(self.pending)
+        return self.datagrams()
+
+    def results(self):
+        return [self.responses[rid] for rid in self.ids]
+
+
+class UdpClient:
+    """Blocking client: fetch() a burst of (p, k) requests, responses in order."""
+
+    def __init__(self, addr, timeout_ms=200, retries=8):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.connect(addr)
+        self.timeout = timeout_ms / 1000.0
+        self.retries = retries
+        self.next_id = 1
+        self.retransmits = 0
+        self.duplicates = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls((config["server_ip"], int(config["udp_port"])),
+                   int(config.get("udp_timeout_ms", 200)), int(config.get("udp_retries", 8)))
+
+    def fetch(self, requests, done_at=None, tags=b""):
+        """Response lines to `requests`; `done_at` gets their completion times (ns)."""
+        ex = Exchange(requests, self.next_id, self.timeout, self.retries, tags)
+        self.next_id += len(requests)
+        try:
+            for d in ex.datagrams():
+                self.sock.send(d)
+            deadline = time.monotonic() + ex.timeout
+            while not ex.done:
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    try:
+                        self.sock.settimeout(remaining)
+                        ex.received(self.sock.recv(65535))
+                        continue
+                    except socket.timeout:
+                        pass
+                    except ConnectionRefusedError:    # ICMP port unreachable: server not up yet
+                        time.sleep(max(0.0, deadline - time.monotonic()))
+                for d in ex.timed_out():
+                    self.sock.send(d)
+                deadline = time.monotonic() + ex.timeout
+        finally:
+            self.retransmits += ex.retransmits
+            self.duplicates += ex.duplicates
+        if done_at is not None:
+            done_at.extend(ex.done_at[rid] for rid in ex.ids)
+        return ex.results()
+
+    def close(self):
+        self.sock.close()
+
+    def counters(self):
+        return {"retransmits": self.retransmits, "duplicates": self.duplicates}
@@ -0,0 +1,173 @@
+"""Low-overhead HDR-style latency histograms.
+
+Values are non-negative integers (we use microseconds). Buckets are
+log-linear like HdrHistogram: exact below ``2**sub_bits`` and then
+``2**(sub_bits-1)`` linear sub-buckets per power of two, so the relative
+error stays below ``2**-(sub_bits-1)`` (~0.8% for the default 8 bits)
+whatever the range. Counts are kept in a sparse dict, so recording is a
+few integer ops plus one dict update and histograms from many processes
+merge by adding counts.
+
+Run ``python3 hdr.py --bench`` to measure the per-record overhead.
+"""
+import json
+import math
+import time
+
+
+class Histogram:
+    def __init__(self, sub_bits=8):
+        self.sub_bits = sub_bits
+        self.sub_count = 1 << sub_bits
+        self.half = self.sub_count >> 1
+        self.counts = {}
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.sum = 0
+
+    # --- bucket mapping ---
+    def _index(self, value):
+        if value < self.sub_count:
+            return value
+        shift = value.bit_length() - self.sub_bits
+        return self.sub_count + (shift - 1) * self.half + ((value >> shift) - self.half)
+
+    def _value(self, index):
+        """Highest value that maps to `index`."""
+        if index < self.sub_count:
+            return index
+        shift, sub = divmod(index - self.sub_count, self.half)
+        shift += 1
+        return ((sub + self.half) << shift) + (1 << shift) - 1
+
+    # --- recording ---
+    def record(self, value, count=1):
+        value = int(value)
+        if value < 0:
+            value = 0
+        idx = self._index(value)
+        self.counts[idx] = self.counts.get(idx, 0) + count
+        self.total += count
+        self.sum += value * count
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def merge(self, other):
+        if other.sub_bits != self.sub_bits:
+            raise ValueError("cannot merge histograms with different precision")
+        for idx, n in other.counts.items():
+            self.counts[idx] = self.counts.get(idx, 0) + n
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        return self
+
+    # --- queries ---
+    def percentile(self, q):
+        """Value at percentile q (0-100); 0 for an empty histogram."""
+        if self.total == 0:
+            return 0
+        target = max(1, math.ceil(q / 100.0 * self.total))
+        seen = 0
+        for idx in sorted(self.counts):
+            seen += self.counts[idx]
+            if seen >= target:
+                return min(self._value(idx), self.max)
+        return self.max
+
+    def values(self):
+        """Every recorded value in ascending order, as its bucket's highest value (within min..max)."""
+        for idx in sorted(self.counts):
+            v = min(max(self._value(idx), self.min), self.max)
+            for _ in range(self.counts[idx]):
+                yield v
+
+    def mean(self):
+        return self.sum / self.total if self.total else 0.0
+
+    def summary(self, scale=1.0):
+        """p50/p99/p999/max/mean/count, values divided by `scale`."""
+        return {
+            "count": self.total,
+            "mean": self.mean() / scale,
+            "p50": self.percentile(50) / scale,
+            "p99": self.percentile(99) / scale,
+            "p999": self.percentile(99.9) / scale,
+            "max": self.max / scale,
+        }
+
+    # --- persistence ---
+    def to_dict(self):
+        return {"sub_bits": self.sub_bits, "total": self.total, "sum": self.sum,
+                "min": self.min, "max": self.max,
+                "counts": {str(k): v for k, v in self.counts.items()}}
+
+    @classmethod
+    def from_dict(cls, d):
+        h = cls(d["sub_bits"])
+        h.counts = {int(k): v for k, v in d["counts"].items()}
+        h.total, h.sum, h.min, h.max = d["total"], d["sum"], d["min"], d["max"]
+        return h
+
+
+def dump(path, hists):
+    """Write a nested dict of Histograms (e.g. {kind: {key: Histogram}}) as JSON."""
+    def enc(obj):
+        if isinstance(obj, Histogram):
+            return obj.to_dict()
+        return {k: enc(v) for k, v in obj.items()}
+    with open(path, "w") as f:
+        json.dump(enc(hists), f)
+
+
+def load(path):
+    """Inverse of dump()."""
+    def dec(obj):
+        if "counts" in obj and "sub_bits" in obj:
+            return Histogram.from_dict(obj)
+        return {k: dec(v) for k, v in obj.items()}
+    with open(path) as f:
+        return dec(json.load(f))
+
+
+def merge_all(hists):
+    """Merge an iterable of Histograms into a new one."""
+    out = None
+    for h in hists:
+        out = Histogram(h.sub_bits).merge(h) if out is None else out.merge(h)
+    return out if out is not None else Histogram()
+
+
+def bench(n=200000):
+    """Measure the cost of timestamping and recording one value."""
+    h = Histogram()
+    clock = time.perf_counter_ns
+    t0 = clock()
+    for _ in range(n):
+        clock()
+    t_clock = (clock() - t0) / n
+    values = [(i * 7919) % 50000 for i in range(n)]
+    t0 = clock()
+    for v in values:
+        pass
+    t_loop = (clock() - t0) / n
+    t0 = clock()
+    for v in values:
+        h.record(v)
+    t_record = (clock() - t0) / n - t_loop
+    # server instrumentation = 3 timestamps + 3 records per request
+    print(f"perf_counter_ns: {t_clock:.0f} ns, record(): {t_record:.0f} ns, "
+          f"per-request server overhead ~{(3 * t_clock + 3 * t_record) / 1000:.2f} us")
+
+
+if __name__ == "__main__":
+    import sys
+    if "--bench" in sys.argv:
+        bench()
+    else:
+        print(__doc__)
@@ -0,0 +1,94 @@
+"""Optional per-request latency instrumentation.
+
+Servers create a RequestTimer when ``"instrument": 1`` is set in
+config.json and call ``record()`` with the enqueue, dequeue and
+send-complete ``perf_counter_ns`` timestamps of each request. Histograms
+(microseconds, per client key) are dumped as JSON when the server exits,
+including on SIGTERM from the runner. Clients record their per-request RTT
+into a Histogram and dump it with ``hdr.dump``.
+
+Runners call ``summarize()`` to merge everything into p50/p99/p999 per
+client class, and ``store_samples()`` to keep every request's RTT and
+queue wait in the results store (perfmodel.py fits the "rtt" ones).
+"""
+import atexit
+import os
+import signal
+import sys
+
+from common import hdr
+
+SERVER_KINDS = ("queue_wait", "service", "total")
+
+
+class RequestTimer:
+    def __init__(self, path):
+        self.path = path
+        self.hists = {kind: {} for kind in SERVER_KINDS}
+
+    def _hist(self, kind, client):
+        h = self.hists[kind].get(client)
+        if h is None:
+            h = self.hists[kind][client] = hdr.Histogram()
+        return h
+
+    def record(self, client, t_enq, t_deq, t_done):
+        """Record one request; timestamps are perf_counter_ns values."""
+        self._hist("queue_wait", client).record((t_deq - t_enq) // 1000)
+        self._hist("service", client).record((t_done - t_deq) // 1000)
+        self._hist("total", client).record((t_done - t_enq) // 1000)
+
+    def dump(self):
+        d = os.path.dirname(self.path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        hdr.dump(self.path, self.hists)
+
+    def dump_at_exit(self):
+        """Dump on normal exit and turn SIGTERM into a normal exit."""
+        atexit.register(self.dump)
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+
+def summarize(server_path, client_paths, client_class):
+    """Merge histograms into per-class percentiles (milliseconds).
+
+    server_path  -- server dump ({kind: {client key: hist}}), may be missing
+    client_paths -- {client id: path of its RTT histogram dump}
+    client_class -- maps a client id or server-side client key to its class
+
+    Returns {"<kind>_<stat>_<class>": value} with kind in rtt/queue_wait/
+    service/total and stat in p50/p99/p999.
+    """
+    by_class = {}
+    for cid, path in client_paths.items():
+        if os.path.exists(path):
+            rtt = hdr.load(path)["rtt"]
+            by_class.setdefault(("rtt", client_class(cid)), []).append(rtt)
+    if server_path and os.path.exists(server_path):
+        for kind, per_client in hdr.load(server_path).items():
+            for key, h in per_client.items():
+                by_class.setdefault((kind, client_class(key)), []).append(h)
+
+    metrics = {}
+    for (kind, cls), hists in by_class.items():
+        s = hdr.merge_all(hists).summary(scale=1000.0)
+        for stat in ("p50", "p99", "p999"):
+            metrics[f"{kind}_{stat}_{cls}"] = s[stat]
+    return metrics
+
+
+def store_samples(store, run_id, server_path, client_paths):
+    """Add the run's histograms to a ResultsStore as per-request samples (ms).
+
+    Client RTTs are stored as kind "rtt" under their client id, the
+    server's queue waits as "queue_wait" under its client key. Values are
+    bucket values, so within the histogram's precision (~0.8%).
+    """
+    for cid, path in client_paths.items():
+        if os.path.exists(path):
+            rtt = hdr.load(path)["rtt"]
+            store.add_samples(run_id, str(cid), "rtt", [v / 1000.0 for v in rtt.values()])
+    if server_path and os.path.exists(server_path):
+        for key, h in hdr.load(server_path).get("queue_wait", {}).items():
+            store.add_samples(run_id, key, "queue_wait", [v / 1000.0 for v in h.values()])
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""Single-process asyncio load generator for the word servers.
+
+One interpreter drives thousands of virtual clients, instead of one
+``client.py`` process per Mininet host. Run it from a part directory (it
+reads server_ip/port/k/p from config.json there) or pass --host/--port.
+
+Protocols
+  persistent  one connection per client, "p,k\\n" lines pipelined on it
+              (part3/server.py, p3/server_part3_fcfs.py)
+  conn        one connection per request (part2, part3_new, part4)
+  udp         one datagram per request to the server's udp_port, with
+              retransmission (part3_new, part4; see datagram.py), c per burst
+
+persistent and conn connect to the server's Unix socket with --unix PATH
+(every Python server, see unixsock.py).
+
+Client groups are ``NAME:COUNT[:key=value,...]`` with keys c (requests per
+burst), k, p (start offset), pipeline=burst|window (burst: send c, wait
+for all c, like the existing clients; window: keep c requests in flight),
+prio / deadline_ms, which tag every request with a priority class and a
+relative deadline (see scheduling.py), and src, a local address to send
+from: on loopback any 127.x.y.z, so servers that queue per client IP
+(part4) see each group as its own host. The summary breaks request
+latency down per group, with the requests slower than deadline_ms.
+A group of one client is logged as NAME, larger groups as NAME_1..NAME_N,
+which is what the part3 runner expects for rogue/normal_*.
+
+Modes
+  closed  every client starts at once (optionally spread over --ramp-ms)
+          and downloads the whole file
+  open    clients arrive as a Poisson process at --rate per second for
+          --duration seconds, picking a group in proportion to COUNT
+
+Completion times are written per client in the runners' formats
+(--format part3: ELAPSED_MS/FINISH_EPOCH lines, part4: seconds as a float)
+and summarised on stdout, e.g.
+
+    cd part3 && python3 ../common/loadgen.py --proto persistent \\
+        --group rogue:1:c=10 --group normal:2000:c=1
+    cd part4 && python3 ../common/loadgen.py --proto conn --mode open \\
+        --rate 200 --duration 10 --group client:1:c=1 --format none
+"""
+import argparse
+import asyncio
+import collections
+import functools
+import json
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.datagram import Exchange
+from common.scheduling import format_tags
+
+
+def load_config(filename="config.json"):
+    """JSON config, falling back to the one-key-per-line format of part2/part3."""
+    if not os.path.exists(filename):
+        return {}
+    with open(filename) as f:
+        text = f.read()
+    try:
+        return json.loads(text)
+    except ValueError:
+        cfg = {}
+        for line in text.splitlines():
+            line = line.strip().strip(",")
+            if not line or line[0] in "{}":
+                continue
+            k, v = line.split(":", 1)
+            cfg[k.strip().strip('"')] = v.strip().strip('"')
+        return cfg
+
+
+def parse_group(spec, default_k, default_p):
+    """'NAME:COUNT[:c=..,k=..,p=..,pipeline=..]' -> dict."""
+    parts = spec.split(":", 2)
+    if len(parts) < 2:
+        raise argparse.ArgumentTypeError(f"bad group {spec!r}, expected NAME:COUNT[:opts]")
+    group = {"name": parts[0], "count": int(parts[1]), "c": 1, "k": default_k,
+             "p": default_p, "pipeline": "burst", "prio": 0, "deadline_ms": 0, "src": ""}
+    if len(parts) == 3 and parts[2]:
+        for opt in parts[2].split(","):
+            key, val = opt.split("=", 1)
+            if key not in group or key in ("name", "count"):
+                raise argparse.ArgumentTypeError(f"unknown group option {key!r}")
+            group[key] = val if key in ("pipeline", "src") else int(val)
+    if group["pipeline"] not in ("burst", "window"):
+        raise argparse.ArgumentTypeError("pipeline must be burst or window")
+    group["tags"] = format_tags(group["prio"], group["deadline_ms"])
+    return group
+
+
+class Result:
+    def __init__(self, cid, group=None):
+        self.cid = cid
+        self.group = group
+        self.start = None
+        self.end = None
+        self.requests = 0
+        self.bytes = 0
+        self.latencies = []     # ms from sending a request line to reading its response
+        self.retransmits = 0    # udp only
+        self.error = None
+
+    def got(self, line, t_sent):
+        self.requests += 1
+        self.bytes += len(line)
+        self.latencies.append((time.perf_counter() - t_sent) * 1000.0)
+
+
+UNIX_PATH = None                # --unix: connect there instead of host:port
+
+
+async def open_conn(host, port, timeout, src=""):
+    """asyncio.open_connection (from address `src`) with the clients' short retry backoff."""
+    deadline = time.monotonic() + timeout
+    delay = 0.005
+    while True:
+        try:
+            if UNIX_PATH:
+                return await asyncio.open_unix_connection(UNIX_PATH)
+            return await asyncio.open_connection(host, port,
+                                                 local_addr=(src, 0) if src else None)
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+
+async def persistent_client(g, res, host, port, timeout):
+    reader, writer = await open_conn(host, port, timeout, g["src"])
+    c, k, tags = g["c"], g["k"], g["tags"]
+    offset = g["p"]
+    try:
+        if g["pipeline"] == "burst":
+            while True:
+                writer.write("".join(f"{offset + i * k},{k}{tags}\n" for i in range(c)).encode())
+                t_sent = time.perf_counter()
+                offset += c * k
+                saw_eof = False
+                for _ in range(c):
+                    line = await reader.readline()
+                    res.got(line, t_sent)
+                    if not line or b"EOF" in line:
+                        saw_eof = True
+                        break
+                if saw_eof:
+                    return
+        else:
+            sent = collections.deque()
+            for _ in range(c):
+                writer.write(f"{offset},{k}{tags}\n".encode())
+                sent.append(time.perf_counter())
+                offset += k
+            saw_eof = False
+            while sent:
+                line = await reader.readline()
+                res.got(line, sent.popleft())
+                if not line:
+                    return
+                if b"EOF" in line:
+                    saw_eof = True
+                if not saw_eof:
+                    writer.write(f"{offset},{k}{tags}\n".encode())
+                    sent.append(time.perf_counter())
+                    offset += k
+    finally:
+        writer.close()
+
+
+async def one_request(res, host, port, timeout, offset, k, tags="", src=""):
+    """Response line of one request on its own connection (latency includes the connect)."""
+    t_sent = time.perf_counter()
+    reader, writer = await open_conn(host, port, timeout, src)
+    try:
+        writer.write(f"{offset},{k}{tags}\n".encode())
+        line = await reader.readline()
+        res.got(line, t_sent)
+        return line
+    finally:
+        writer.close()
+
+
+async def conn_client(g, res, host, port, timeout):
+    c, k = g["c"], g["k"]
+    offset = g["p"]
+    if g["pipeline"] == "burst":
+        while True:
+            lines = await asyncio.gather(*(one_request(res, host, port, timeout, offset + i * k, k,
+                                                       g["tags"], g["src"])
+                                           for i in range(c)))
+            offset += c * k
+            if any(not line or b"EOF" in line for line in lines):
+                return
+    else:
+        done = asyncio.Event()
+        next_offset = [offset]
+
+        async def lane():
+            while not done.is_set():
+                p = next_offset[0]
+                next_offset[0] += k
+                line = await one_request(res, host, port, timeout, p, k, g["tags"], g["src"])
+                if not line or b"EOF" in line:
+                    done.set()
+
+        await asyncio.gather(*(lane() for _ in range(c)))
+
+
+class UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.inbox = asyncio.Queue()
+
+    def datagram_received(self, data, addr):
+        self.inbox.put_nowait(data)
+
+    def error_received(self, exc):
+        pass                    # e.g. port unreachable: the requests are retransmitted
+
+
+async def udp_client(g, res, host, port, timeout, rto=0.2, retries=8):
+    loop = asyncio.get_running_loop()
+    transport, proto = await loop.create_datagram_endpoint(
+        UdpProtocol, remote_addr=(host, port), local_addr=(g["src"], 0) if g["src"] else None)
+    c, k = g["c"], g["k"]
+    offset = g["p"]
+    next_id = 1
+    try:
+        while True:
+            ex = Exchange([(offset + i * k, k) for i in range(c)], next_id, rto, retries,
+                          g["tags"].encode())
+            next_id += c
+            offset += c * k
+            t_sent = time.perf_counter()
+            for d in ex.datagrams():
+                transport.sendto(d)
+            deadline = loop.time() + ex.timeout
+            while not ex.done:
+                try:
+                    ex.received(await asyncio.wait_for(proto.inbox.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    for d in ex.timed_out():
+                        transport.sendto(d)
+                    deadline = loop.time() + ex.timeout
+            res.retransmits += ex.retransmits
+            lines = ex.results()
+            for line in lines:
+                res.got(line, t_sent)
+            if any(b"EOF" in line for line in lines):
+                return
+    finally:
+        transport.close()
+
+
+async def run_client(fn, g, res, host, port, timeout):
+    res.start = time.time()
+    try:
+        await fn(g, res, host, port, timeout)
+    except Exception as e:
+        res.error = f"{type(e).__name__}: {e}"
+    res.end = time.time()
+
+
+def client_ids(groups):
+    for g in groups:
+        for i in range(g["count"]):
+            yield g, (g["name"] if g["count"] == 1 else f"{g['name']}_{i + 1}")
+
+
+async def closed_loop(args, groups, fn):
+    results = []
+    tasks = []
+    for n, (g, cid) in enumerate(client_ids(groups)):
+        res = Result(cid, g["name"])
+        results.append(res)
+        if args.ramp_ms and n:
+            await asyncio.sleep(args.ramp_ms / 1000.0)
+        tasks.append(asyncio.create_task(run_client(fn, g, res, args.host, args.port,
+                                                    args.connect_timeout)))
+    await asyncio.gather(*tasks)
+    return results
+
+
+async def open_loop(args, groups, fn):
+    rng = random.Random(args.seed)
+    weights = [g["count"] for g in groups]
+    seen = {g["name"]: 0 for g in groups}
+    results, tasks = [], []
+    t_end = time.monotonic() + args.duration
+    while True:
+        await asyncio.sleep(rng.expovariate(args.rate))
+        if time.monotonic() >= t_end:
+            break
+        g = rng.choices(groups, weights)[0]
+        seen[g["name"]] += 1
+        res = Result(f"{g['name']}_{seen[g['name']]}", g["name"])
+        results.append(res)
+        tasks.append(asyncio.create_task(run_client(fn, g, res, args.host, args.port,
+                                                    args.connect_timeout)))
+    if tasks:
+        await asyncio.wait(tasks, timeout=args.drain_timeout)
+    return results
+
+
+def write_logs(results, fmt, log_dir):
+    os.makedirs(log_dir, exist_ok=True)
+    for r in results:
+        if r.error or r.end is None:
+            continue
+        with open(os.path.join(log_dir, f"{r.cid}.log"), "w") as f:
+            if fmt == "part3":
+                f.write(f"ELAPSED_MS:{int((r.end - r.start) * 1000)}\n")
+                f.write(f"FINISH_EPOCH:{r.end:.6f}\n")
+            else:
+                f.write(f"{r.end - r.start}")
+
+
+def group_latency(results, groups):
+    """Request latency per client group (the priority classes of a mixed load)."""
+    out = {}
+    for g in groups:
+        lat = sorted(x for r in results if r.group == g["name"] for x in r.latencies)
+        lpct = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))] if lat else float("nan")
+        entry = {"prio": g["prio"], "requests": len(lat),
+                 "latency_ms": {"p50": lpct(0.5), "p99": lpct(0.99), "p999": lpct(0.999),
+                                "max": lat[-1] if lat else float("nan")}}
+        if g["deadline_ms"]:
+            entry["deadline_ms"] = g["deadline_ms"]
+            entry["missed"] = sum(1 for x in lat if x > g["deadline_ms"])
+        out[g["name"]] = entry
+    return out
+
+
+def summarize(results, wall_s):
+    done = sorted((r.end - r.start) * 1000.0 for r in results if r.end and not r.error)
+    pct = lambda q: done[min(len(done) - 1, int(q * len(done)))] if done else float("nan")
+    requests = sum(r.requests for r in results)
+    nbytes = sum(r.bytes for r in results)
+    lat = sorted(x for r in results for x in r.latencies)
+    lpct = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))] if lat else float("nan")
+    return {
+        "clients": len(results),
+        "completed": len(done),
+        "failed": sum(1 for r in results if r.error),
+        "unfinished": sum(1 for r in results if r.end is None),
+        "completion_ms": {"mean": sum(done) / len(done) if done else float("nan"),
+                          "p50": pct(0.5), "p99": pct(0.99), "max": done[-1] if done else float("nan")},
+        "requests": requests,
+        "wall_s": wall_s,
+        "requests_per_s": requests / wall_s if wall_s > 0 else 0.0,
+        "bytes": nbytes,
+        "bytes_per_s": nbytes / wall_s if wall_s > 0 else 0.0,
+        "latency_ms": {"p50": lpct(0.5), "p99": lpct(0.99), "max": lat[-1] if lat else float("nan")},
+        "retransmits": sum(r.retransmits for r in results),
+    }
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    cfg = load_config()
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--host", default=str(cfg.get("server_ip", "127.0.0.1")))
+    ap.add_argument("--port", type=int, default=None,
+                    help="default: port from config.json (udp_port for --proto udp)")
+    ap.add_argument("--proto", choices=["persistent", "conn", "udp"], required=True)
+    ap.add_argument("--unix", metavar="PATH", help="persistent/conn: connect to the server's "
+                    "Unix socket (unix_socket) instead of host:port")
+    ap.add_argument("--group", action="append", default=[], metavar="NAME:COUNT[:opts]",
+                    help="client group, e.g. rogue:1:c=10 or normal:999:c=1,k=5")
+    ap.add_argument("--mode", choices=["closed", "open"], default="closed")
+    ap.add_argument("--rate", type=float, default=10.0, help="open loop: client arrivals per second")
+    ap.add_argument("--duration", type=float, default=10.0, help="open loop: arrival window (s)")
+    ap.add_argument("--drain-timeout", type=float, default=60.0,
+                    help="open loop: wait this long for clients still running")
+    ap.add_argument("--ramp-ms", type=float, default=0.0, help="closed loop: gap between client starts")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--connect-timeout", type=float, default=5.0)
+    ap.add_argument("--udp-timeout-ms", type=float, default=float(cfg.get("udp_timeout_ms", 200)),
+                    help="udp: first retransmission timeout, doubled on every retry")
+    ap.add_argument("--udp-retries", type=int, default=int(cfg.get("udp_retries", 8)))
+    ap.add_argument("--format", choices=["part3", "part4", "none"], default="part3")
+    ap.add_argument("--log-dir", default="logs")
+    ap.add_argument("--summary", help="also write the summary JSON here")
+    args = ap.parse_args()
+
+    if args.port is None:
+        key = "udp_port" if args.proto == "udp" else "port"
+        args.port = int(cfg.get(key, cfg.get("server_port", 8887)))
+    k = int(cfg.get("k", 5))
+    p = int(cfg.get("p", 0))
+    try:
+        groups = [parse_group(s, k, p) for s in args.group] or [parse_group("client:1", k, p)]
+    except argparse.ArgumentTypeError as e:
+        ap.error(str(e))
+
+    global UNIX_PATH
+    UNIX_PATH = args.unix
+    raise_fd_limit()
+    if args.proto == "udp":
+        fn = functools.partial(udp_client, rto=args.udp_timeout_ms / 1000.0, retries=args.udp_retries)
+    else:
+        fn = persistent_client if args.proto == "persistent" else conn_client
+    loop = closed_loop if args.mode == "closed" else open_loop
+    t0 = time.monotonic()
+    results = asyncio.run(loop(args, groups, fn))
+    wall = time.monotonic() - t0
+
+    if args.format != "none":
+        write_logs(results, args.format, args.log_dir)
+    for r in results:
+        if r.error:
+            print(f"{r.cid}: {r.error}", file=sys.stderr)
+    summary = summarize(results, wall)
+    summary["groups"] = group_latency(results, groups)
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(summary, f, indent=2)
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
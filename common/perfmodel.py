@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""Analytic performance models fitted to stored sweeps.
+
+Two models, both fitted by least squares with 95% confidence intervals
+(Student t on the residual degrees of freedom):
+
+  k-sweep  (part1: one client, one request per k words)
+      T(k) = ceil(N/k) * (RTT + o) + N*w / bw + setup
+
+      Only the sum RTT + o is identifiable from a single corpus. Give
+      --rtt-ms (or sweep with "instrument": 1, whose runs store "rtt"
+      samples) to split it into RTT and the per-request overhead o. With sweeps over more than one corpus size
+      the N*w/bw term is fitted directly and bw gets its own interval;
+      otherwise it is derived from the fixed part, taking setup as one
+      RTT (the TCP handshake).
+
+  clients  (part2: n clients, one sequential server, one request each)
+      every request cycle is Z + s + W: Z off the server (RTT, connect,
+      client), s deterministic service, and W the M/D/1 wait at the
+      utilisation the n clients generate, rho = n*s / cycle, with
+      W = rho*s / (2*(1 - rho)). T(n) = ceil(N/k) * cycle. Z and s are
+      fitted by Gauss-Newton; the saturation point is n* = (Z + s) / s,
+      where the server becomes the bottleneck.
+
+Both predict for other corpus sizes with --predict-words: the best k (the
+smallest k within --tol of the one-request time; larger k buys nothing
+more) and T(n) around the saturation point.
+
+    python3 perfmodel.py k-sweep --csv ../part1/results.csv --words-file ../part1/words.txt
+    python3 perfmodel.py clients --db ../part2/results.db --words-file ../part2/words.txt \\
+        --k 5 --predict-words 100000
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.adaptive import t975
+from common.results_store import ResultsStore
+from common.simulator import corpus_stats
+
+EXPERIMENTS = {"k-sweep": "part1_k_sweep", "clients": "part2_clients_sweep"}
+
+
+# --- least squares ---
+def _inverse(m):
+    """Inverse of a small square matrix (Gauss-Jordan with partial pivoting)."""
+    n = len(m)
+    a = [list(row) + [float(i == j) for j in range(n)] for i, row in enumerate(m)]
+    for col in range(n):
+        piv = max(range(col, n), key=lambda r: abs(a[r][col]))
+        if abs(a[piv][col]) < 1e-300:
+            raise ValueError("singular design matrix (parameters not identifiable)")
+        a[col], a[piv] = a[piv], a[col]
+        p = a[col][col]
+        a[col] = [v / p for v in a[col]]
+        for r in range(n):
+            if r != col and a[r][col]:
+                f = a[r][col]
+                a[r] = [v - f * u for v, u in zip(a[r], a[col])]
+    return [row[n:] for row in a]
+
+
+class Fit:
+    """Parameter estimates with standard errors and 95% intervals."""
+
+    def __init__(self, names, coef, cov, rss, n):
+        self.names = names
+        self.coef = dict(zip(names, coef))
+        self.dof = n - len(names)
+        self.sigma = math.sqrt(rss / self.dof) if self.dof > 0 else float("nan")
+        self.se = {name: math.sqrt(max(cov[i][i], 0.0)) for i, name in enumerate(names)}
+        self.rmse = math.sqrt(rss / n) if n else float("nan")
+
+    def ci(self, name):
+        h = t975(self.dof) * self.se[name] if self.dof > 0 else float("inf")
+        return self.coef[name] - h, self.coef[name] + h
+
+
+def ols(rows, y, names):
+    """Ordinary least squares; rows are the regressor vectors."""
+    p = len(names)
+    xtx = [[sum(r[i] * r[j] for r in rows) for j in range(p)] for i in range(p)]
+    xty = [sum(r[i] * v for r, v in zip(rows, y)) for i in range(p)]
+    inv = _inverse(xtx)
+    coef = [sum(inv[i][j] * xty[j] for j in range(p)) for i in range(p)]
+    rss = sum((v - sum(c * x for c, x in zip(coef, r))) ** 2 for r, v in zip(rows, y))
+    s2 = rss / (len(y) - p) if len(y) > p else float("nan")
+    cov = [[v * s2 for v in row] for row in inv]
+    return Fit(names, coef, cov, rss, len(y))
+
+
+def gauss_newton(f, theta, xs, y, names, iters=100, lower=1e-9):
+    """Nonlinear least squares for y ~ f(x, theta) with a numeric Jacobian."""
+    theta = list(theta)
+
+    def residuals(th):
+        return [v - f(x, th) for x, v in zip(xs, y)]
+
+    def jacobian(th):
+        cols = []
+        for i in range(len(th)):
+            h = max(abs(th[i]) * 1e-6, 1e-12)
+            up = list(th)
+            up[i] += h
+            cols.append([(f(x, up) - f(x, th)) / h for x in xs])
+        return [list(r) for r in zip(*cols)]
+
+    rss = sum(r * r for r in residuals(theta))
+    for _ in range(iters):
+        jac, res = jacobian(theta), residuals(theta)
+        jtj = [[sum(r[i] * r[j] for r in jac) for j in range(len(theta))] for i in range(len(theta))]
+        jtr = [sum(r[i] * e for r, e in zip(jac, res)) for i in range(len(theta))]
+        step = [sum(a * b for a, b in zip(row, jtr)) for row in _inverse(jtj)]
+        scale = 1.0
+        while scale > 1e-6:                # halve the step until the fit improves
+            cand = [max(t + scale * d, lower) for t, d in zip(theta, step)]
+            cand_rss = sum(r * r for r in residuals(cand))
+            if cand_rss < rss:
+                break
+            scale /= 2
+        else:
+            break
+        converged = rss - cand_rss < 1e-12 * max(rss, 1e-300)
+        theta, rss = cand, cand_rss
+        if converged:
+            break
+    jac = jacobian(theta)
+    jtj = [[sum(r[i] * r[j] for r in jac) for j in range(len(theta))] for i in range(len(theta))]
+    s2 = rss / (len(y) - len(theta)) if len(y) > len(theta) else float("nan")
+    cov = [[v * s2 for v in row] for row in _inverse(jtj)]
+    return Fit(names, theta, cov, rss, len(y))
+
+
+# --- k sweep ---
+class KSweepModel:
+    """T(k) = ceil(N/k) * per_request + bytes * ms_per_byte + fixed (ms)."""
+
+    def __init__(self, fit, word_bytes, num_words, rtt=None):
+        self.fit = fit
+        self.word_bytes = word_bytes
+        self.num_words = num_words         # corpus size of the sweep (first one)
+        self.rtt = rtt                     # (mean, lo, hi) ms, if known
+
+    @classmethod
+    def fit_obs(cls, obs, rtt=None):
+        """obs: (k, num_words, word_bytes, elapsed_ms) per run."""
+        sizes = {round(n * w) for _, n, w, _ in obs}
+        if len(sizes) > 1:
+            names = ["per_request_ms", "ms_per_byte", "fixed_ms"]
+            rows = [[math.ceil(n / k), n * w, 1.0] for k, n, w, _ in obs]
+        else:
+            names = ["per_request_ms", "fixed_ms"]
+            rows = [[math.ceil(n / k), 1.0] for k, n, w, _ in obs]
+        fit = ols(rows, [t for *_, t in obs], names)
+        word_bytes = sum(w for _, _, w, _ in obs) / len(obs)
+        return cls(fit, word_bytes, obs[0][1], rtt), sizes
+
+    @property
+    def setup_ms(self):
+        """Connection setup inside fixed_ms when bw is derived: one RTT, if known."""
+        return self.rtt[0] if self.rtt else 0.0
+
+    def predict(self, k, n):
+        c = self.fit.coef
+        t = math.ceil(n / k) * c["per_request_ms"]
+        if "ms_per_byte" in c:
+            return t + n * self.word_bytes * c["ms_per_byte"] + c["fixed_ms"]
+        # single corpus: the transfer part of fixed_ms scales with N
+        transfer = c["fixed_ms"] - self.setup_ms
+        return t + self.setup_ms + transfer * n / self.num_words
+
+    def best_k(self, n, tol=0.05):
+        """Smallest k with T(k) <= (1 + tol) * T(n); beyond it larger k gains < tol."""
+        limit = (1 + tol) * self.predict(n, n)
+        lo, hi = 1, n
+        while lo < hi:                     # T(k) is non-increasing in k
+            mid = (lo + hi) // 2
+            if self.predict(mid, n) <= limit:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def params(self):
+        """Fitted and derived parameters as name -> (value, lo, hi, unit)."""
+        f = self.fit
+        out = {"RTT + overhead": (f.coef["per_request_ms"], *f.ci("per_request_ms"), "ms/request")}
+        if self.rtt:
+            rtt, rlo, rhi = self.rtt
+            _, plo, phi, _ = out["RTT + overhead"]
+            out["RTT"] = (rtt, rlo, rhi, "ms")
+            out["overhead"] = (f.coef["per_request_ms"] - rtt, plo - rhi, phi - rlo, "ms/request")
+        if "ms_per_byte" in f.coef:
+            c, (clo, chi) = f.coef["ms_per_byte"], f.ci("ms_per_byte")
+            out["bandwidth"] = (_mbps(c), _mbps(chi), _mbps(clo), "Mbps")
+            out["fixed"] = (f.coef["fixed_ms"], *f.ci("fixed_ms"), "ms")
+        else:
+            fixed, (flo, fhi) = f.coef["fixed_ms"], f.ci("fixed_ms")
+            out["fixed (transfer + setup)"] = (fixed, flo, fhi, "ms")
+            setup = self.setup_ms
+            nbytes = self.num_words * self.word_bytes
+            out["bandwidth (derived)"] = (_mbps((fixed - setup) / nbytes),
+                                          _mbps((fhi - setup) / nbytes),
+                                          _mbps((flo - setup) / nbytes), "Mbps")
+        return out
+
+
+def _mbps(ms_per_byte):
+    """bytes/ms -> Mbit/s (inf for a non-positive time per byte)."""
+    return 8e-3 / ms_per_byte if ms_per_byte > 0 else float("inf")
+
+
+# --- concurrent clients: M/D/1 per request cycle ---
+def md1_cycle(n, z, s):
+    """Mean request cycle (ms) of n closed clients with think time z and service s."""
+    def cycle(rho):
+        return z + s + rho * s / (2 * (1 - rho))
+
+    lo, hi = 0.0, 1.0 - 1e-12
+    for _ in range(100):                   # rho = n*s / cycle(rho), increasing in rho
+        mid = (lo + hi) / 2
+        if mid < n * s / cycle(mid):
+            lo = mid
+        else:
+            hi = mid
+    return cycle((lo + hi) / 2)
+
+
+class ClientModel:
+    def __init__(self, fit, requests):
+        self.fit = fit
+        self.requests = requests           # ceil(N/k) of the fitted sweep
+
+    @classmethod
+    def fit_obs(cls, obs, requests):
+        """obs: (num_clients, mean elapsed_ms over the run's clients)."""
+        xs = [n for n, _ in obs]
+        y = [t for _, t in obs]
+        # start from the one-client cycle, a tenth of it on the server
+        t1 = min(t for n, t in obs if n == min(xs)) / requests
+        fit = gauss_newton(lambda n, th: requests * md1_cycle(n, th[0], th[1]),
+                           [0.9 * t1, 0.1 * t1], xs, y, ["think_ms", "service_ms"])
+        return cls(fit, requests)
+
+    def predict(self, n, requests=None):
+        c = self.fit.coef
+        return (requests or self.requests) * md1_cycle(n, c["think_ms"], c["service_ms"])
+
+    def saturation(self):
+        c = self.fit.coef
+        z, s = c["think_ms"], c["service_ms"]
+        (zlo, zhi), (slo, shi) = self.fit.ci("think_ms"), self.fit.ci("service_ms")
+        sat = lambda z_, s_: (z_ + s_) / s_ if s_ > 0 else float("inf")
+        return sat(z, s), sat(max(zlo, 0.0), shi), sat(zhi, max(slo, 0.0))
+
+    def params(self):
+        f = self.fit
+        return {"think (RTT + connect + client)": (f.coef["think_ms"], *f.ci("think_ms"), "ms/request"),
+                "service": (f.coef["service_ms"], *f.ci("service_ms"), "ms/request"),
+                "saturation n*": (*self.saturation(), "clients")}
+
+
+# --- loading stored sweeps ---
+def load_csv(path, x_col):
+    """(x, run, elapsed_ms) rows of a legacy results CSV."""
+    with open(path) as f:
+        return [(float(r[x_col]), int(r["run"]), float(r["elapsed_ms"])) for r in csv.DictReader(f)]
+
+
+def load_db(path, experiment):
+    """(x, run, elapsed_ms) per client of the latest `experiment` in a results store."""
+    store = ResultsStore(path)
+    try:
+        exp = store.latest_experiment(experiment)
+        if exp is None:
+            raise SystemExit(f"no experiment {experiment!r} in {path}")
+        rows = [(r["x"], r["run"], r["elapsed_ms"]) for r in store.client_rows(exp)
+                if r["elapsed_ms"] is not None]
+        rtt = [r["value_ms"] for r in store.sample_rows(exp, "rtt")]
+    finally:
+        store.close()
+    return rows, rtt
+
+
+def run_means(rows):
+    """Average the clients of each (x, run): one observation per run."""
+    acc = {}
+    for x, run, t in rows:
+        acc.setdefault((x, run), []).append(t)
+    return sorted((x, sum(v) / len(v)) for (x, _), v in acc.items())
+
+
+def mean_ci(values):
+    n = len(values)
+    m = sum(values) / n
+    if n < 2:
+        return m, m, m
+    sd = math.sqrt(sum((v - m) ** 2 for v in values) / (n - 1))
+    h = t975(n - 1) * sd / math.sqrt(n)
+    return m, m - h, m + h
+
+
+def print_params(params):
+    print(f"{'parameter':<32} {'estimate':>12} {'95% CI':>27}  unit")
+    for name, (v, lo, hi, unit) in params.items():
+        print(f"{name:<32} {v:>12.5g} [{lo:>12.5g}, {hi:>12.5g}]  {unit}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for name, x_col in (("k-sweep", "k"), ("clients", "num_clients")):
+        p = sub.add_parser(name)
+        src = p.add_mutually_exclusive_group(required=True)
+        src.add_argument("--db", nargs="+", help="results.db file(s), latest experiment of each")
+        src.add_argument("--csv", nargs="+", help=f"legacy results CSV(s) with {x_col},run,elapsed_ms")
+        p.add_argument("--experiment", default=EXPERIMENTS[name])
+        p.add_argument("--words-file", nargs="+", required=True,
+                       help="corpus of each input (one, or one per --db/--csv)")
+        p.add_argument("--predict-words", type=float, nargs="*", default=[],
+                       help="corpus sizes (words) to predict for")
+        p.add_argument("--json", help="also write the fitted model here")
+        p.set_defaults(x_col=x_col)
+    ks = sub.choices["k-sweep"]
+    ks.add_argument("--rtt-ms", type=float, help="known RTT, to split RTT + overhead")
+    ks.add_argument("--tol", type=float, default=0.05, help="best k: within this of one request")
+    cl = sub.choices["clients"]
+    cl.add_argument("--k", type=int, required=True, help="words per request in the sweep")
+    cl.add_argument("--clients", type=int, nargs="*", default=[],
+                    help="client counts to predict T(n) for (default: around n*)")
+    args = ap.parse_args()
+
+    inputs = args.db or args.csv
+    files = args.words_file * len(inputs) if len(args.words_file) == 1 else args.words_file
+    if len(files) != len(inputs):
+        ap.error("give one --words-file, or one per input")
+    datasets, rtt_samples = [], []
+    for path, words_file in zip(inputs, files):
+        if args.db:
+            rows, rtt = load_db(path, args.experiment)
+            rtt_samples += rtt
+        else:
+            rows = load_csv(path, args.x_col)
+        datasets.append((rows, *corpus_stats(words_file)))
+
+    report = {}
+    if args.cmd == "k-sweep":
+        obs = [(int(x), n, w, t) for rows, n, w in datasets for x, _, t in rows]
+        rtt = (args.rtt_ms,) * 3 if args.rtt_ms is not None else \
+            (mean_ci(rtt_samples) if rtt_samples else None)
+        model, sizes = KSweepModel.fit_obs(obs, rtt)
+        n = datasets[0][1]
+        print(f"{len(obs)} runs, corpus sizes (bytes): {sorted(sizes)}; "
+              f"residual sd {model.fit.sigma:.3g} ms, dof {model.fit.dof}")
+        params = model.params()
+        print_params(params)
+        report["params"] = params
+        report["predictions"] = []
+        for words in [n] + [int(w) for w in args.predict_words]:
+            k = model.best_k(words, args.tol)
+            row = {"words": words, "best_k": k, "T_best_ms": model.predict(k, words),
+                   "T_k1_ms": model.predict(1, words)}
+            report["predictions"].append(row)
+            print(f"N={words}: best k = {k} (T = {row['T_best_ms']:.4g} ms; "
+                  f"k=1: {row['T_k1_ms']:.4g} ms)")
+    else:
+        rows, n, _ = datasets[0]
+        if len(datasets) > 1:
+            ap.error("clients: fit one sweep at a time")
+        requests = math.ceil(n / args.k)
+        obs = run_means(rows)
+        model = ClientModel.fit_obs(obs, requests)
+        print(f"{len(obs)} runs, {requests} requests per client; "
+              f"residual sd {model.fit.sigma:.3g} ms, dof {model.fit.dof}")
+        params = model.params()
+        print_params(params)
+        report["params"] = params
+        sat = params["saturation n*"][0]
+        counts = args.clients or sorted({1, max(1, round(sat / 2)), max(1, round(sat)),
+                                         max(1, round(2 * sat))})
+        report["predictions"] = []
+        for words in [n] + [int(w) for w in args.predict_words]:
+            req = math.ceil(words / args.k)
+            row = {"words": words, "saturation_clients": sat,
+                   "T_ms": {c: model.predict(c, req) for c in counts}}
+            report["predictions"].append(row)
+            print(f"N={words}: " + ", ".join(f"T({c})={t:.4g} ms" for c, t in row["T_ms"].items()))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
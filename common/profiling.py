@@ -0,0 +1,211 @@
+"""On-demand CPU and memory profiling for the running servers.
+
+``install_profiling(stats, config)``, called next to ``serve_stats``, adds
+two tools that cost nothing until they are switched on:
+
+  CPU     a sampling profiler: a daemon thread reads the stack of every
+          other thread (sys._current_frames) ``profile_hz`` times a second
+          (default 200) and counts collapsed stacks, one line per distinct
+          stack, root first: "thread;func (file:line);... count". This is
+          the input of flamegraph.pl / speedscope. Samples are wall-clock,
+          so a thread blocked in select(), a lock or sendall() shows up at
+          the line that blocked.
+  memory  tracemalloc snapshots: the first one starts tracing, every later
+          one is diffed against the previous (top allocation sites by size
+          growth).
+
+Both are driven by signals or by stats commands:
+
+    kill -USR1 <pid>          start / stop the CPU profiler
+    kill -USR2 <pid>          memory snapshot (diff from the previous one)
+    echo "profile start" | nc -U logs/server.stats.sock
+    echo "profile stop"  | nc -U ...   -> {"path": ..., "samples": ...}
+    echo "mem"           | nc -U ...   -> {"path": ..., "top": [...]}
+    echo "mem stop"      | nc -U ...
+
+Output goes to ``profile_dir`` (default logs/profile) as
+cpu-<pid>-<n>.folded and mem-<pid>-<n>.txt. Runners capture a chosen sweep
+point with ProfileCapture.
+"""
+import collections
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+
+from common.stats import query
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, out_dir="logs/profile", hz=200):
+        self.out_dir = out_dir
+        self.interval = 1.0 / max(hz, 1)
+        self.counts = collections.Counter()
+        self.samples = 0
+        self.runs = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self.running:
+            return {"running": True}
+        self.counts.clear()
+        self.samples = 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return {"running": True, "hz": round(1.0 / self.interval)}
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        """Stop sampling and write the collapsed stacks; returns a summary."""
+        if not self.running:
+            return {"running": False}
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.runs += 1
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"cpu-{os.getpid()}-{self.runs}.folded")
+        with open(path, "w") as f:
+            for stack, n in self.counts.most_common():
+                f.write(f"{stack} {n}\n")
+        return {"running": False, "path": path, "samples": self.samples,
+                "stacks": len(self.counts)}
+
+    def toggle(self):
+        return self.stop() if self.running else self.start()
+
+
+class MemoryTracker:
+    def __init__(self, out_dir="logs/profile", frames=8, top=25):
+        self.out_dir = out_dir
+        self.frames = frames
+        self.top = top
+        self.previous = None
+        self.snaps = 0
+
+    def snapshot(self):
+        """Start tracing, or diff a new snapshot against the previous one."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.previous = tracemalloc.take_snapshot()
+            return {"tracing": True, "baseline": True}
+        snap = tracemalloc.take_snapshot()
+        stats = snap.compare_to(self.previous, "lineno")
+        self.previous = snap
+        self.snaps += 1
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"mem-{os.getpid()}-{self.snaps}.txt")
+        current, peak = tracemalloc.get_traced_memory()
+        with open(path, "w") as f:
+            f.write(f"# traced current={current} peak={peak} bytes\n")
+            for st in stats[:self.top]:
+                f.write(f"{st}\n")
+        return {"tracing": True, "path": path, "current_bytes": current, "peak_bytes": peak,
+                "top": [str(st) for st in stats[:10]]}
+
+    def stop(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.previous = None
+        return {"tracing": False}
+
+
+def install_profiling(stats, config):
+    """Register the profiling commands on `stats` and the SIGUSR1/SIGUSR2 handlers.
+
+    Signal handlers are only installed from the main thread.
+    """
+    out_dir = config.get("profile_dir", "logs/profile")
+    cpu = SamplingProfiler(out_dir, int(config.get("profile_hz", 200)))
+    mem = MemoryTracker(out_dir)
+
+    def profile_cmd(args):
+        action = args[0] if args else "toggle"
+        if action == "start":
+            return cpu.start()
+        if action == "stop":
+            return cpu.stop()
+        if action == "toggle":
+            return cpu.toggle()
+        return {"error": "usage: profile [start|stop|toggle]"}
+
+    def mem_cmd(args):
+        return mem.stop() if args and args[0] == "stop" else mem.snapshot()
+
+    stats.commands["profile"] = profile_cmd
+    stats.commands["mem"] = mem_cmd
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, lambda *_: print(f"profile: {cpu.toggle()}", flush=True))
+        signal.signal(signal.SIGUSR2, lambda *_: print(f"mem: {mem.snapshot()}", flush=True))
+    return cpu, mem
+
+
+class ProfileCapture:
+    """Runner side: profile one run of a server.
+
+    Uses the stats endpoint when there is one (and reports the output
+    paths), otherwise signals the server process.
+    """
+
+    def __init__(self, proc, addr=None):
+        self.proc = proc
+        self.addr = addr
+
+    def _send(self, command, sig):
+        if self.addr:
+            return query(self.addr, command, timeout=30.0)
+        self.proc.send_signal(sig)
+        return {"signalled": sig.name}
+
+    def start(self):
+        mem = self._send("mem", signal.SIGUSR2)
+        cpu = self._send("profile start", signal.SIGUSR1)
+        return cpu, mem
+
+    def stop(self):
+        cpu = self._send("profile stop", signal.SIGUSR1)
+        time.sleep(0.05)              # let a signalled CPU profile finish writing first
+        mem = self._send("mem", signal.SIGUSR2)
+        return cpu, mem
+
+    @classmethod
+    def for_run(cls, config, proc, x, run=1):
+        """Started capture if config "profile_at" is this sweep point (first run), else None."""
+        at = config.get("profile_at")
+        if at in (None, "") or float(at) != float(x) or run != 1:
+            return None
+        capture = cls(proc, config.get("stats_socket"))
+        capture.start()
+        return capture
+
+    def finish(self):
+        cpu, mem = self.stop()
+        print(f"  profile: cpu {cpu.get('path', cpu)}, memory {mem.get('path', mem)}")
+        return cpu, mem
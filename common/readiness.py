@@ -0,0 +1,85 @@
+"""Readiness handshake between runners and servers.
+
+Servers print ``READY`` on stdout (flushed) once the listening socket is
+bound and the corpus is loaded. Runners block on that line instead of
+sleeping for a fixed time, and wait on process exit when stopping.
+Clients started at the same moment as the server retry their connect
+with a short backoff (connect_with_retry) instead of sleeping first.
+"""
+import os
+import select
+import subprocess
+import threading
+import time
+
+from common.unixsock import connect
+
+READY_LINE = "READY"
+
+
+def _drain(fd):
+    """Keep reading fd until EOF so a chatty server never blocks on a full pipe."""
+    try:
+        while os.read(fd, 65536):
+            pass
+    except OSError:
+        pass
+
+
+def wait_ready(proc, timeout=10.0):
+    """Block until `proc` prints READY on stdout.
+
+    `proc` must have been started with stdout=PIPE. Raises RuntimeError if
+    the process exits or stays silent for `timeout` seconds. The rest of
+    its output is drained by a daemon thread.
+    """
+    fd = proc.stdout.fileno()
+    deadline = time.monotonic() + timeout
+    buf = b""
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise RuntimeError(f"server not ready after {timeout}s: {buf.decode(errors='replace')!r}")
+        readable, _, _ = select.select([fd], [], [], remaining)
+        if not readable:
+            continue
+        chunk = os.read(fd, 4096)
+        if not chunk:
+            proc.wait()
+            raise RuntimeError(f"server exited with {proc.returncode} before READY: "
+                               f"{buf.decode(errors='replace')!r}")
+        buf += chunk
+        lines = buf.split(b"\n")
+        buf = lines.pop()
+        if any(line.strip() == READY_LINE.encode() for line in lines):
+            threading.Thread(target=_drain, args=(fd,), daemon=True).start()
+            return
+
+
+def connect_with_retry(addr, timeout=5.0):
+    """Connect to the server, retrying with short backoff until it is listening.
+
+    `addr` is (host, port), or a Unix socket path (see unixsock.py).
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.005
+    while True:
+        try:
+            return connect(addr)
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+
+def stop(proc, timeout=5.0):
+    """Terminate `proc` and wait for it to exit (kill if it does not)."""
+    if proc.poll() is not None:
+        return proc.returncode
+    proc.terminate()
+    try:
+        return proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        return proc.wait()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""Performance regression gate over bench.py reports.
+
+A baseline is a bench.py report reduced to its samples, keyed like the
+report (micro/<bench>/words=N/k=K, macro/<variant>/words=N/k=K), together
+with the suite options it was run with:
+
+    python3 regression.py save                         # run the suite, store it
+    python3 regression.py save --report bench.json     # store an existing report
+    python3 regression.py check                        # re-run, compare, gate
+    python3 regression.py check --report bench.json --variants part3
+
+``check`` re-runs the suite with the baseline's options (optionally fewer
+variants) unless given a report, then compares every gated metric
+
+    ns_per_op        micro, per request handled   (higher is worse)
+    requests_per_s   macro throughput             (lower is worse)
+    p99_ms           macro tail latency           (higher is worse)
+
+with a one-sided Mann-Whitney U test on the repeated samples: a metric
+regressed when the current samples are worse than the baseline's at
+--alpha (default 0.01) and the medians moved by at least --min-change
+(default 5%, so a tiny but consistent shift does not fail the gate). The
+test uses ranks only, so one outlier run does not decide it. Exact
+p-values are used for small samples; with 5 runs each, only a complete
+separation of the two sample sets (p = 1/252) is significant at 0.01, and
+with 3 runs each nothing can be (metrics are then marked "too few
+samples").
+
+The exit status is 1 if anything regressed, 0 otherwise. Baseline and
+current run should come from the same machine; a mismatch is reported.
+"""
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.bench import SUITE_OPTIONS, add_suite_options, run_suite
+
+BASELINE = "bench_baseline.json"
+# metric -> +1 if higher is worse, -1 if lower is worse
+GATED = {"ns_per_op": +1, "requests_per_s": -1, "p99_ms": +1}
+
+
+def samples_by_key(report):
+    """{key: {metric: [samples]}} of the gated metrics of a bench.py report."""
+    out = {}
+    for entry in report.get("micro", []):
+        out[entry["key"]] = {entry["metric"]: entry["samples"]}
+    for entry in report.get("macro", []):
+        out[entry["key"]] = {m: [run[m] for run in entry["runs"]]
+                             for m in entry["runs"][0] if m in GATED}
+    return out
+
+
+def _u_counts(n1, n2):
+    """Number of orderings of n1 + n2 values giving each U statistic of the first sample."""
+    # f[i][j][u]: orderings of i values from sample 1 and j from sample 2 with statistic u
+    f = [[None] * (n2 + 1) for _ in range(n1 + 1)]
+    for i in range(n1 + 1):
+        for j in range(n2 + 1):
+            if i == 0 or j == 0:
+                f[i][j] = [1] + [0] * (i * j)
+                continue
+            cur = [0] * (i * j + 1)
+            for u, c in enumerate(f[i - 1][j]):      # largest value from sample 1: beats all j
+                cur[u + j] += c
+            for u, c in enumerate(f[i][j - 1]):      # largest value from sample 2
+                cur[u] += c
+            f[i][j] = cur
+    return f[n1][n2]
+
+
+def mann_whitney_greater(a, b):
+    """One-sided p-value for "values in a tend to be greater than in b"."""
+    n1, n2 = len(a), len(b)
+    u = sum(1.0 if x > y else 0.5 if x == y else 0.0 for x in a for y in b)
+    ties = len(a + b) - len(set(a + b))
+    if not ties and n1 * n2 <= 400:
+        counts = _u_counts(n1, n2)
+        return sum(counts[math.ceil(u):]) / math.comb(n1 + n2, n1)
+    # normal approximation with tie correction and continuity correction
+    n = n1 + n2
+    tie_term = sum(c ** 3 - c for c in (sorted(a + b).count(v) for v in set(a + b)))
+    sigma = math.sqrt(n1 * n2 / 12.0 * ((n + 1) - tie_term / (n * (n - 1))))
+    if sigma == 0:
+        return 1.0
+    z = (u - n1 * n2 / 2.0 - 0.5) / sigma
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def compare(base, cur, metric, alpha, min_change):
+    """Verdict for one metric: dict with medians, change and p-values."""
+    worse = GATED[metric]
+    mb, mc = statistics.median(base), statistics.median(cur)
+    change = (mc - mb) / mb if mb else 0.0
+    row = {"baseline": mb, "current": mc, "change": change, "verdict": "same"}
+    if 1.0 / math.comb(len(base) + len(cur), len(cur)) >= alpha:
+        row["verdict"] = "too few samples"    # no outcome could be significant
+        return row
+    a, b = (cur, base) if worse > 0 else (base, cur)
+    row["p_worse"] = mann_whitney_greater(a, b)
+    row["p_better"] = mann_whitney_greater(b, a)
+    if row["p_worse"] < alpha and worse * change >= min_change:
+        row["verdict"] = "REGRESSED"
+    elif row["p_better"] < alpha and -worse * change >= min_change:
+        row["verdict"] = "improved"
+    return row
+
+
+def check(baseline, current, alpha, min_change):
+    """Compare every key and metric present in both; returns the result rows."""
+    rows = []
+    for key, metrics in sorted(baseline["samples"].items()):
+        if key not in current:
+            continue
+        for metric, base in metrics.items():
+            if metric in current[key]:
+                rows.append({"key": key, "metric": metric,
+                             **compare(base, current[key][metric], metric, alpha, min_change)})
+    return rows
+
+
+def print_rows(rows):
+    print(f"{'benchmark':<38} {'metric':<15} {'baseline':>11} {'current':>11} "
+          f"{'change':>8} {'p':>7}  verdict")
+    for r in rows:
+        p = r.get("p_worse" if r["verdict"] != "improved" else "p_better", float("nan"))
+        print(f"{r['key']:<38} {r['metric']:<15} {r['baseline']:11.2f} {r['current']:11.2f} "
+              f"{100 * r['change']:+7.1f}% {p:7.4f}  {r['verdict']}")
+
+
+def suite_args(options, variants=None):
+    """Namespace for bench.run_suite from stored options."""
+    args = argparse.Namespace(**options)
+    if variants:
+        args.variants = [v for v in variants if v in options["variants"]]
+    return args
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    save = sub.add_parser("save", help="run the suite (or take --report) and store it as the baseline")
+    save.add_argument("--what", choices=["micro", "macro", "all"], default="all")
+    add_suite_options(save)
+    chk = sub.add_parser("check", help="re-run the baseline's suite (or take --report) and compare")
+    chk.add_argument("--variants", nargs="+", help="only re-run these variants")
+    chk.add_argument("--alpha", type=float, default=0.01, help="significance level per metric")
+    chk.add_argument("--min-change", type=float, default=0.05,
+                     help="smallest relative change of the median that can fail the gate")
+    chk.add_argument("--out", default="bench-current.json", help="where to write the re-run report")
+    chk.add_argument("--json", action="store_true", help="print the comparison as JSON")
+    for p in (save, chk):
+        p.add_argument("--baseline", default=BASELINE)
+        p.add_argument("--report", help="bench.py report to use instead of running the suite")
+    args = ap.parse_args()
+
+    if args.cmd == "save":
+        if args.report:
+            with open(args.report) as f:
+                report = json.load(f)
+        else:
+            report = run_suite(args)
+        baseline = {"machine": report["machine"],
+                    "options": report.get("options", {name: getattr(args, name)
+                                                      for name in SUITE_OPTIONS}),
+                    "samples": samples_by_key(report)}
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"stored {len(baseline['samples'])} benchmarks in {args.baseline}")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if args.report:
+        with open(args.report) as f:
+            report = json.load(f)
+    else:
+        report = run_suite(suite_args(baseline["options"], args.variants))
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    for field in ("host", "cpus", "python"):
+        if baseline["machine"].get(field) != report["machine"].get(field):
+            print(f"[WARN] {field} differs from the baseline: "
+                  f"{baseline['machine'].get(field)} -> {report['machine'].get(field)}")
+
+    rows = check(baseline, samples_by_key(report), args.alpha, args.min_change)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_rows(rows)
+    regressed = [r for r in rows if r["verdict"] == "REGRESSED"]
+    print(f"{len(rows)} comparisons against {baseline['machine'].get('git') or 'baseline'}: "
+          f"{len(regressed)} regressed, "
+          f"{sum(r['verdict'] == 'improved' for r in rows)} improved")
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Structured client results, collected by the runners as they arrive.
+
+A client's result is one flat JSON object instead of a line in a log file:
+
+    elapsed_ms   download time (ms)
+    finish_mono  CLOCK_MONOTONIC when it finished (s), shared by Mininet hosts
+    requests     responses received
+    words        words counted
+    bytes        response bytes received
+    error        null, or what went wrong
+
+plus anything client-specific (vocab, peak_rss_kb, ...). Clients run by an
+agent return it from their run function and the agent's reply carries it
+as "result". Clients started as processes print it as their last line:
+
+    RESULT {"elapsed_ms": 812.4, "finish_mono": 5123.21, ...}
+
+and the runner reads every client's stdout pipe through one selector with
+``collect``: results are taken as each client exits, a client that exits
+without a RESULT line is reported failed at once (with the end of its
+output), and clients still running at the deadline are killed and
+reported late, instead of finding out one communicate() timeout at a time.
+"""
+import json
+import os
+import selectors
+import sys
+import time
+
+RESULT_PREFIX = "RESULT "
+
+
+def emit(result, file=None):
+    """Print `result` as the client's RESULT line."""
+    print(RESULT_PREFIX + json.dumps(result), file=file or sys.stdout, flush=True)
+
+
+def parse(output):
+    """The last RESULT object in a client's output, or None."""
+    for line in reversed(output.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            try:
+                return json.loads(line[len(RESULT_PREFIX):])
+            except ValueError:
+                return None
+    return None
+
+
+def failed(error, output=""):
+    return {"error": error, "output": output[-500:]}
+
+
+def collect(procs, timeout=None, on_result=None):
+    """Results of all client processes, read concurrently.
+
+    `procs` maps a name to a Popen started with stdout=PIPE. Returns
+    {name: result}; a client without a RESULT line or still running after
+    `timeout` seconds gets {"error": ..., "output": <tail>}. on_result(name,
+    result) is called as each one arrives.
+    """
+    sel = selectors.DefaultSelector()
+    bufs = {}
+    for name, proc in procs.items():
+        sel.register(proc.stdout.fileno(), selectors.EVENT_READ, name)
+        bufs[name] = bytearray()
+    results = {}
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    def finish(name, result):
+        results[name] = result
+        if on_result:
+            on_result(name, result)
+
+    while len(results) < len(procs):
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            break
+        for key, _ in sel.select(remaining):
+            name = key.data
+            chunk = os.read(key.fd, 65536)
+            if chunk:
+                bufs[name] += chunk
+                continue
+            sel.unregister(key.fd)
+            procs[name].wait()
+            output = bufs[name].decode(errors="replace")
+            result = parse(output)
+            if result is None:
+                result = failed(f"exited with {procs[name].returncode} without a result", output)
+            finish(name, result)
+    for name, proc in procs.items():
+        if name not in results:
+            sel.unregister(proc.stdout.fileno())
+            proc.kill()
+            proc.wait()
+            finish(name, failed(f"no result after {timeout}s", bufs[name].decode(errors="replace")))
+    sel.close()
+    return results
+
+
+def warn_failed(name, result):
+    """on_result callback printing failed clients as they are detected."""
+    if result.get("error"):
+        print(f"[WARN] {name}: {result['error']}", flush=True)
@@ -0,0 +1,167 @@
+"""SQLite store for experiment results.
+
+Replaces the per-part CSVs that were reopened for every row and only kept
+averages. One experiment row is created per sweep invocation; every run of
+a sweep point keeps its raw per-client times, per-request samples and
+derived metrics (e.g. JFI). Rows are buffered and written with
+``executemany`` in one transaction per flush.
+
+    store = ResultsStore("results.db")
+    exp = store.new_experiment("part3_fcfs", config)
+    run = store.add_run(exp, "c", c, run_id)
+    store.add_client(run, "rogue", "rogue", elapsed_ms=..., finish_ms=...)
+    store.add_metric(run, "jfi", jfi)
+    store.close()
+"""
+import hashlib
+import json
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiments (
+    id          INTEGER PRIMARY KEY,
+    name        TEXT NOT NULL,
+    config_hash TEXT NOT NULL,
+    config      TEXT NOT NULL,
+    created     REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id            INTEGER PRIMARY KEY,
+    experiment_id INTEGER NOT NULL REFERENCES experiments(id),
+    param         TEXT NOT NULL,     -- swept parameter name: k, num_clients, c
+    x             REAL NOT NULL,     -- its value for this run
+    run           INTEGER NOT NULL,  -- repetition index at this x
+    created       REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS clients (
+    run_id     INTEGER NOT NULL REFERENCES runs(id),
+    client     TEXT NOT NULL,
+    class      TEXT NOT NULL,        -- rogue / normal / greedy / ...
+    elapsed_ms REAL,
+    finish_ms  REAL                  -- relative to the run's common start
+);
+CREATE TABLE IF NOT EXISTS samples (
+    run_id   INTEGER NOT NULL REFERENCES runs(id),
+    client   TEXT NOT NULL,
+    kind     TEXT NOT NULL,          -- rtt / queue_wait / service / ...
+    seq      INTEGER NOT NULL,
+    value_ms REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    name   TEXT NOT NULL,
+    value  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_exp ON runs(experiment_id, x);
+CREATE INDEX IF NOT EXISTS clients_run ON clients(run_id);
+CREATE INDEX IF NOT EXISTS samples_run ON samples(run_id, client, kind);
+CREATE INDEX IF NOT EXISTS metrics_run ON metrics(run_id, name);
+"""
+
+
+def config_hash(config):
+    """Stable short hash of a config dict (key order does not matter)."""
+    blob = json.dumps(config, sort_keys=True, default=str).encode()
+    return hashlib.sha1(blob).hexdigest()[:12]
+
+
+class ResultsStore:
+    def __init__(self, path="results.db", batch_size=5000):
+        self.conn = sqlite3.connect(str(path))
+        self.conn.executescript(SCHEMA)
+        self.batch_size = batch_size
+        # Ids are assigned here so child rows can be buffered before their
+        # run row hits the database (single writer per file).
+        self._next_run = self.conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM runs").fetchone()[0]
+        self._pending = {"runs": [], "clients": [], "samples": [], "metrics": []}
+
+    # --- writing ---
+    def new_experiment(self, name, config):
+        cur = self.conn.execute(
+            "INSERT INTO experiments (name, config_hash, config, created) VALUES (?, ?, ?, ?)",
+            (name, config_hash(config), json.dumps(config, sort_keys=True, default=str), time.time()))
+        self.conn.commit()
+        return cur.lastrowid
+
+    def add_run(self, experiment_id, param, x, run):
+        run_id = self._next_run
+        self._next_run += 1
+        self._queue("runs", (run_id, experiment_id, param, x, run, time.time()))
+        return run_id
+
+    def add_client(self, run_id, client, cls, elapsed_ms=None, finish_ms=None):
+        self._queue("clients", (run_id, client, cls, elapsed_ms, finish_ms))
+
+    def add_samples(self, run_id, client, kind, values_ms):
+        self._queue_many("samples", [(run_id, client, kind, i, v) for i, v in enumerate(values_ms)])
+
+    def add_metric(self, run_id, name, value):
+        self._queue("metrics", (run_id, name, value))
+
+    def _queue(self, table, row):
+        self._pending[table].append(row)
+        self._maybe_flush()
+
+    def _queue_many(self, table, rows):
+        self._pending[table].extend(rows)
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if sum(len(rows) for rows in self._pending.values()) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        inserts = {
+            "runs": "INSERT INTO runs (id, experiment_id, param, x, run, created) VALUES (?, ?, ?, ?, ?, ?)",
+            "clients": "INSERT INTO clients (run_id, client, class, elapsed_ms, finish_ms) VALUES (?, ?, ?, ?, ?)",
+            "samples": "INSERT INTO samples (run_id, client, kind, seq, value_ms) VALUES (?, ?, ?, ?, ?)",
+            "metrics": "INSERT INTO metrics (run_id, name, value) VALUES (?, ?, ?)",
+        }
+        with self.conn:
+            for table in ("runs", "clients", "samples", "metrics"):
+                if self._pending[table]:
+                    self.conn.executemany(inserts[table], self._pending[table])
+                    self._pending[table] = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    # --- querying ---
+    def latest_experiment(self, name):
+        """Id of the most recent experiment called `name` (None if there is none)."""
+        row = self.conn.execute(
+            "SELECT id FROM experiments WHERE name = ? ORDER BY id DESC LIMIT 1", (name,)).fetchone()
+        return row[0] if row else None
+
+    def query(self, sql, params=()):
+        """Run `sql` and return a list of dict rows."""
+        cur = self.conn.execute(sql, params)
+        cols = [d[0] for d in cur.description]
+        return [dict(zip(cols, row)) for row in cur.fetchall()]
+
+    def client_rows(self, experiment_id):
+        """One row per (run, client): x, run, client, class, elapsed_ms, finish_ms."""
+        self.flush()
+        return self.query(
+            """SELECT r.x, r.run, c.client, c.class, c.elapsed_ms, c.finish_ms
+               FROM runs r JOIN clients c ON c.run_id = r.id
+               WHERE r.experiment_id = ? ORDER BY r.x, r.run""", (experiment_id,))
+
+    def metric_rows(self, experiment_id, name):
+        """One row per run: x, run, value of metric `name`."""
+        self.flush()
+        return self.query(
+            """SELECT r.x, r.run, m.value
+               FROM runs r JOIN metrics m ON m.run_id = r.id
+               WHERE r.experiment_id = ? AND m.name = ? ORDER BY r.x, r.run""", (experiment_id, name))
+
+    def sample_rows(self, experiment_id, kind):
+        """Raw per-request samples of `kind`: x, run, client, class, value_ms."""
+        self.flush()
+        return self.query(
+            """SELECT r.x, r.run, s.client, COALESCE(c.class, '') AS class, s.value_ms
+               FROM runs r JOIN samples s ON s.run_id = r.id
+               LEFT JOIN clients c ON c.run_id = s.run_id AND c.client = s.client
+               WHERE r.experiment_id = ? AND s.kind = ?""", (experiment_id, kind))
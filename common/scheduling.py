@@ -0,0 +1,361 @@
+"""Request scheduling policies shared by the servers and the simulator.
+
+Every policy keeps one FIFO per client (requests of one client are always
+served in arrival order, which a persistent connection needs for its
+responses) and decides which client's head request goes next:
+
+  fcfs  global arrival order (part3/server.py, p3/server_part3_fcfs.py)
+  rr    round robin over the clients that have requests (part4/server.py)
+  srpt  shortest remaining processing time: the client with the fewest
+        requests left to reach the end of the file, ceil((total - p) / k)
+        for the offset p of its head request. The server knows len(words),
+        so this needs nothing from the client. Without a guard a greedy
+        client that pulls ahead is preferred more and more, so waiting
+        ages a client: every ``aging_ms`` its head request has waited
+        counts as one request less remaining (0 = pure SRPT).
+  prio  strict priority: the client whose head request has the highest
+        priority class, in arrival order within a class. Lower classes
+        wait as long as a higher one has requests.
+  edf   earliest deadline first: the client whose head request has the
+        earliest absolute deadline (arrival + its relative deadline);
+        untagged requests get ``edf_default_deadline_ms`` (default 1000).
+
+Requests may be tagged with a class and a relative deadline after "p,k"
+(see split_tags):
+
+    0,5;prio=1;deadline_ms=20
+
+Untagged requests are class 0. Every policy keeps per-class counters
+(class_stats: queued, served, a histogram of the queueing wait with its
+p50/p99/p999, deadline misses at dispatch), so the
+servers can show what any policy does to each class. A class only decides
+between clients' head requests: a client mixing classes on one queue
+(part4 queues per host) still has its requests served in arrival order.
+
+Servers pick the policy with ``"scheduler": "fcfs" | "rr" | "srpt" |
+"prio" | "edf"``, ``"srpt_aging_ms"`` and ``"edf_default_deadline_ms"`` in
+config.json and use RequestQueue, which adds a lock and blocking get() to a
+Scheduler. The simulator uses the same classes on its own clock to compare
+policies:
+
+    python3 simulator.py --config ../part3/config.json --compare-policies 10
+"""
+import heapq
+import threading
+import time
+from collections import deque
+
+from common.hdr import Histogram
+
+POLICIES = ("fcfs", "rr", "srpt", "prio", "edf")
+DEFAULT_AGING_MS = 10.0
+DEFAULT_DEADLINE_MS = 1000.0
+
+
+def split_tags(line):
+    """("p,k", prio, deadline_ms) of a request line "p,k[;prio=N][;deadline_ms=D]".
+
+    Missing or malformed tags give class 0 and no deadline (None).
+    """
+    request, sep, tags = line.partition(";")
+    prio, deadline_ms = 0, None
+    if sep:
+        for tag in tags.split(";"):
+            key, _, val = tag.partition("=")
+            try:
+                if key.strip() == "prio":
+                    prio = int(val)
+                elif key.strip() == "deadline_ms":
+                    deadline_ms = float(val)
+            except ValueError:
+                pass
+    return request.strip(), prio, deadline_ms
+
+
+def format_tags(prio=0, deadline_ms=None):
+    """The ";prio=..;deadline_ms=.." suffix of a request line ("" if untagged)."""
+    tags = ""
+    if prio:
+        tags += f";prio={prio}"
+    if deadline_ms:
+        tags += f";deadline_ms={deadline_ms:g}"
+    return tags
+
+
+class Scheduler:
+    """Per-client FIFO queues; subclasses choose which client goes next.
+
+    Not thread-safe. `clock` returns seconds (time.monotonic, or the
+    simulator's clock).
+    """
+    name = None
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.queues = {}          # client -> deque of (item, p, k, t_arrival, prio, deadline)
+        self.size = 0
+        self.classes = {}         # prio -> counters, see class_stats
+
+    def __len__(self):
+        return self.size
+
+    def depth(self):
+        """Queued requests per client."""
+        return {client: len(q) for client, q in self.queues.items()}
+
+    def push(self, client, item, p=None, k=1, prio=0, deadline_ms=None):
+        """Queue `item` for `client`; p, k is the request (p=None if unparsable).
+
+        prio is its class, deadline_ms its deadline relative to now (or None).
+        """
+        q = self.queues.get(client)
+        if q is None:
+            q = self.queues[client] = deque()
+        now = self.clock()
+        deadline = None if deadline_ms is None else now + deadline_ms / 1000.0
+        q.append((item, p, k, now, prio, deadline))
+        self.size += 1
+        c = self.classes.get(prio)
+        if c is None:
+            c = self.classes[prio] = {"queued": 0, "served": 0, "wait_us": Histogram(),
+                                      "deadlines": 0, "missed": 0}
+        c["queued"] += 1
+        self._queued(client, len(q) == 1)
+
+    def peek(self):
+        """(client, item) that pop() would return, or None."""
+        if not self.size:
+            return None
+        client = self._next()
+        return client, self.queues[client][0][0]
+
+    def pop(self):
+        """Remove and return the next (client, item), or None if empty."""
+        if not self.size:
+            return None
+        client = self._next()
+        q = self.queues[client]
+        item, _, _, t, prio, deadline = q.popleft()
+        self.size -= 1
+        now = self.clock()
+        c = self.classes[prio]
+        c["queued"] -= 1
+        c["served"] += 1
+        c["wait_us"].record((now - t) * 1e6)
+        if deadline is not None:
+            c["deadlines"] += 1
+            c["missed"] += now > deadline
+        if not q:
+            del self.queues[client]
+        self._served(client, bool(q))
+        return client, item
+
+    def class_stats(self):
+        """Per class: queued now, served, queueing wait (mean, p50/p99/p999, max), deadlines and misses."""
+        stats = {}
+        for prio, c in sorted(self.classes.items()):
+            wait = c["wait_us"].summary(scale=1000.0)
+            stats[str(prio)] = {"queued": c["queued"], "served": c["served"],
+                                "mean_wait_ms": wait["mean"], "p50_wait_ms": wait["p50"],
+                                "p99_wait_ms": wait["p99"], "p999_wait_ms": wait["p999"],
+                                "max_wait_ms": wait["max"],
+                                "deadlines": c["deadlines"], "missed": c["missed"]}
+        return stats
+
+    # --- policy hooks ---
+    def _queued(self, client, first):
+        """A request of `client` was queued; `first` if its queue was empty."""
+        raise NotImplementedError
+
+    def _next(self):
+        """Client whose head request goes next (at least one is queued)."""
+        raise NotImplementedError
+
+    def _served(self, client, more):
+        """The client returned by _next() was served; `more` if it still has requests."""
+        raise NotImplementedError
+
+
+class FCFS(Scheduler):
+    name = "fcfs"
+
+    def __init__(self, clock=time.monotonic):
+        super().__init__(clock)
+        self.order = deque()      # client of every queued request, in arrival order
+
+    def _queued(self, client, first):
+        self.order.append(client)
+
+    def _next(self):
+        return self.order[0]
+
+    def _served(self, client, more):
+        self.order.popleft()
+
+
+class RoundRobin(Scheduler):
+    name = "rr"
+
+    def __init__(self, clock=time.monotonic):
+        super().__init__(clock)
+        self.ring = deque()       # clients with requests, in rotation order
+
+    def _queued(self, client, first):
+        if first:
+            self.ring.append(client)
+
+    def _next(self):
+        return self.ring[0]
+
+    def _served(self, client, more):
+        self.ring.popleft()
+        if more:
+            self.ring.append(client)      # back of the rotation
+
+
+class HeadOrder(Scheduler):
+    """The client whose head request has the smallest _key() goes next.
+
+    A key only depends on the head request, so a heap with one entry per
+    client, re-keyed when its head is served, keeps the order.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        super().__init__(clock)
+        self.heap = []            # (key, seq, client), one entry per client
+        self._seq = 0
+
+    def _key(self, client):
+        raise NotImplementedError
+
+    def _queued(self, client, first):
+        if first:
+            self._seq += 1
+            heapq.heappush(self.heap, (self._key(client), self._seq, client))
+
+    def _next(self):
+        return self.heap[0][2]
+
+    def _served(self, client, more):
+        heapq.heappop(self.heap)
+        if more:
+            self._queued(client, True)    # re-key on its new head request
+
+
+class SRPT(HeadOrder):
+    """Fewest remaining requests first, with linear aging.
+
+    The priority of a client is remaining - waited / aging. All heads age
+    at the same rate, so ordering by remaining + t_arrival / aging is the
+    same at any instant.
+    """
+    name = "srpt"
+
+    def __init__(self, total, aging_ms=DEFAULT_AGING_MS, clock=time.monotonic):
+        super().__init__(clock)
+        self.total = total
+        self.aging_s = aging_ms / 1000.0
+
+    def remaining(self, p, k):
+        """Requests still needed from offset p to the end of the file."""
+        if p is None or p >= self.total:
+            return 0              # answered with EOF right away
+        return -(-(self.total - max(p, 0)) // max(k, 1))
+
+    def _key(self, client):
+        _, p, k, t, _, _ = self.queues[client][0]
+        key = self.remaining(p, k)
+        if self.aging_s > 0:
+            key += t / self.aging_s
+        return key
+
+
+class StrictPriority(HeadOrder):
+    """Highest class first; arrival order within a class."""
+    name = "prio"
+
+    def _key(self, client):
+        _, _, _, t, prio, _ = self.queues[client][0]
+        return -prio, t
+
+
+class EDF(HeadOrder):
+    """Earliest absolute deadline first; untagged requests get a default deadline."""
+    name = "edf"
+
+    def __init__(self, default_deadline_ms=DEFAULT_DEADLINE_MS, clock=time.monotonic):
+        super().__init__(clock)
+        self.default_deadline_s = default_deadline_ms / 1000.0
+
+    def _key(self, client):
+        _, _, _, t, _, deadline = self.queues[client][0]
+        return t + self.default_deadline_s if deadline is None else deadline
+
+
+def make_scheduler(policy="fcfs", total=0, aging_ms=DEFAULT_AGING_MS, clock=time.monotonic,
+                   deadline_ms=DEFAULT_DEADLINE_MS):
+    if policy == "fcfs":
+        return FCFS(clock)
+    if policy == "rr":
+        return RoundRobin(clock)
+    if policy == "srpt":
+        return SRPT(total, aging_ms, clock)
+    if policy == "prio":
+        return StrictPriority(clock)
+    if policy == "edf":
+        return EDF(deadline_ms, clock)
+    raise ValueError(f"unknown scheduler {policy!r}, expected one of {', '.join(POLICIES)}")
+
+
+class RequestQueue:
+    """Thread-safe request queue in the order of a scheduling policy."""
+
+    def __init__(self, policy="fcfs", total=0, aging_ms=DEFAULT_AGING_MS,
+                 deadline_ms=DEFAULT_DEADLINE_MS):
+        self.sched = make_scheduler(policy, total, aging_ms, deadline_ms=deadline_ms)
+        self.cond = threading.Condition()
+
+    @classmethod
+    def from_config(cls, config, total, default="fcfs"):
+        """Policy from config.json ("scheduler", "srpt_aging_ms",
+        "edf_default_deadline_ms"); total = len(words)."""
+        return cls(config.get("scheduler", default) or default, total,
+                   float(config.get("srpt_aging_ms", DEFAULT_AGING_MS)),
+                   float(config.get("edf_default_deadline_ms", DEFAULT_DEADLINE_MS)))
+
+    @property
+    def policy(self):
+        return self.sched.name
+
+    def put(self, client, item, p=None, k=1, prio=0, deadline_ms=None):
+        with self.cond:
+            self.sched.push(client, item, p, k, prio, deadline_ms)
+            self.cond.notify()
+
+    def get(self, block=True):
+        """Next (client, item); None if empty and not blocking."""
+        with self.cond:
+            while not self.sched.size:
+                if not block:
+                    return None
+                self.cond.wait()
+            return self.sched.pop()
+
+    def get_if(self, client):
+        """Next item if it belongs to `client` (response coalescing), else None."""
+        with self.cond:
+            head = self.sched.peek()
+            if head is None or head[0] != client:
+                return None
+            return self.sched.pop()[1]
+
+    def qsize(self):
+        return self.sched.size
+
+    def depth(self):
+        with self.cond:
+            return self.sched.depth()
+
+    def class_stats(self):
+        with self.cond:
+            return self.sched.class_stats()
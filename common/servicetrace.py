@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""Time-windowed service traces and their analysis.
+
+Runners compute one JFI per run from the final completion times, which
+hides how service was shared while the run went on: a greedy client can
+take over the worker early and then leave. With ``"trace_window_ms": 100``
+in config.json a server also records, per fixed window of wall time,
+
+    served   words sent to each client in the window
+    requests requests served per client
+    queued   each client's queued requests when the window closed
+             (servers whose queue_depth reports per_client)
+
+and appends one JSON line per window that saw any service or queued work
+to ``trace_path`` (default logs/server.trace.jsonl):
+
+    {"i": 12, "t": 1.2, "window_ms": 100, "served": {"10.0.0.1": 850, ...},
+     "requests": {...}, "queued": {"10.0.0.1": 9, "10.0.0.2": 1}}
+
+Counting is one dict update per served request; a daemon thread closes
+the windows. The analyzer turns a trace into per-window JFI over the
+clients that were active in the window (served or queued), per-client
+throughput (words/s) and served / queued share, and lists the stretches
+where the JFI stayed below --threshold, i.e. how long the scheduler took
+to recover after a greedy client arrived or left:
+
+    python3 servicetrace.py logs/server.trace.jsonl
+    python3 servicetrace.py logs/server.trace.jsonl --threshold 0.8 --json trace.json
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+
+def count_words(payload):
+    """Words in the response bytes `payload` (or a list of them), EOF markers excluded."""
+    if isinstance(payload, (list, tuple)):
+        return sum(count_words(p) for p in payload)
+    return payload.count(b",") + payload.count(b"\n") - payload.count(b"EOF")
+
+
+class WindowTrace:
+    def __init__(self, queue_depth, window_ms=100, path="logs/server.trace.jsonl"):
+        self.queue_depth = queue_depth       # ServerStats.queue_depth
+        self.window_s = window_ms / 1000.0
+        self.window_ms = window_ms
+        self.path = path
+        self.t0 = time.monotonic()
+        self.windows = {}                    # window index -> {client: [words, requests]}
+        self._lock = threading.Lock()
+
+    def record(self, client, words, requests=1):
+        i = int((time.monotonic() - self.t0) / self.window_s)
+        with self._lock:
+            counts = self.windows.setdefault(i, {}).setdefault(client, [0, 0])
+            counts[0] += words
+            counts[1] += requests
+
+    def _queued(self):
+        depth = self.queue_depth()
+        if isinstance(depth, dict):
+            return {str(c): n for c, n in depth.get("per_client", {}).items() if n}
+        return {}
+
+    def _close(self, f, now_i):
+        """Write every window before `now_i`; the queue is sampled once, for the last one."""
+        with self._lock:
+            closed = sorted(i for i in self.windows if i < now_i)
+            windows = [(i, self.windows.pop(i)) for i in closed]
+        queued = self._queued()
+        if queued and (not closed or closed[-1] != now_i - 1):
+            windows.append((now_i - 1, {}))  # nothing served, work waiting
+        for i, counts in windows:
+            f.write(json.dumps({
+                "i": i, "t": round(i * self.window_s, 6), "window_ms": self.window_ms,
+                "served": {str(c): n[0] for c, n in counts.items()},
+                "requests": {str(c): n[1] for c, n in counts.items()},
+                "queued": queued if i == now_i - 1 else {},
+            }) + "\n")
+        f.flush()
+
+    def _run(self):
+        d = os.path.dirname(self.path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        with open(self.path, "w") as f:
+            while True:
+                now = time.monotonic() - self.t0
+                i = int(now / self.window_s)
+                time.sleep((i + 1) * self.window_s - now)
+                self._close(f, i + 1)
+
+    def start(self):
+        threading.Thread(target=self._run, name="trace", daemon=True).start()
+        return self
+
+
+def install_trace(stats, config):
+    """Attach a WindowTrace to `stats` if config sets trace_window_ms."""
+    window_ms = int(config.get("trace_window_ms", 0) or 0)
+    if not window_ms:
+        return None
+    stats.trace = WindowTrace(stats.queue_depth, window_ms,
+                              config.get("trace_path", "logs/server.trace.jsonl")).start()
+    return stats.trace
+
+
+# --- analysis ----------------------------------------------------------------
+
+def jain(values):
+    s = sum(values)
+    s2 = sum(v * v for v in values)
+    return (s * s) / (len(values) * s2) if s2 > 0 else 1.0
+
+
+def load_trace(path):
+    """Windows of a trace file, merged by index, gaps filled with empty windows."""
+    by_i = {}
+    window_ms = None
+    with open(path) as f:
+        for line in f:
+            w = json.loads(line)
+            window_ms = w["window_ms"]
+            cur = by_i.setdefault(w["i"], {"served": {}, "requests": {}, "queued": {}})
+            for field in ("served", "requests"):
+                for c, n in w[field].items():
+                    cur[field][c] = cur[field].get(c, 0) + n
+            if w["queued"]:
+                cur["queued"] = w["queued"]
+    if not by_i:
+        return [], window_ms
+    first, last = min(by_i), max(by_i)
+    empty = {"served": {}, "requests": {}, "queued": {}}
+    return [(i, by_i.get(i, empty)) for i in range(first, last + 1)], window_ms
+
+
+def analyze(windows, window_ms, threshold=0.9):
+    """Per-window JFI, throughput and shares, plus the unfair stretches."""
+    window_s = window_ms / 1000.0
+    rows = []
+    for i, w in windows:
+        active = set(w["served"]) | set(w["queued"])
+        served = sum(w["served"].values())
+        queued = sum(w["queued"].values())
+        rows.append({
+            "t": round(i * window_s, 6),
+            "active": len(active),
+            "words_per_s": served / window_s,
+            "jfi": jain([w["served"].get(c, 0) for c in active]) if active else None,
+            "throughput": {c: n / window_s for c, n in w["served"].items()},
+            "served_share": {c: n / served for c, n in w["served"].items()} if served else {},
+            "queued_share": {c: n / queued for c, n in w["queued"].items()} if queued else {},
+        })
+    unfair, start = [], None
+    for r in rows + [{"t": None, "jfi": None}]:
+        low = r["jfi"] is not None and r["jfi"] < threshold
+        if low and start is None:
+            start, worst = r["t"], r["jfi"]
+        elif low:
+            worst = min(worst, r["jfi"])
+        elif start is not None:
+            end = r["t"] if r["t"] is not None else rows[-1]["t"] + window_s
+            unfair.append({"start_s": start, "end_s": end, "duration_s": end - start,
+                           "min_jfi": worst, "recovered": r["t"] is not None})
+            start = None
+    jfis = [r["jfi"] for r in rows if r["jfi"] is not None]
+    summary = {"windows": len(rows), "window_ms": window_ms, "threshold": threshold,
+               "mean_jfi": sum(jfis) / len(jfis) if jfis else None,
+               "min_jfi": min(jfis) if jfis else None,
+               "unfair": unfair}
+    return rows, summary
+
+
+def top(shares):
+    if not shares:
+        return "-"
+    c = max(shares, key=shares.get)
+    return f"{c} {shares[c]:.2f}"
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("trace", help="trace file written by a server (trace_path)")
+    ap.add_argument("--threshold", type=float, default=0.9,
+                    help="JFI below which a window counts as unfair")
+    ap.add_argument("--json", help="write per-window rows and the summary here")
+    ap.add_argument("--quiet", action="store_true", help="only print the summary")
+    args = ap.parse_args()
+
+    windows, window_ms = load_trace(args.trace)
+    if not windows:
+        raise SystemExit(f"{args.trace}: no windows")
+    rows, summary = analyze(windows, window_ms, args.threshold)
+    if not args.quiet:
+        print(f"{'t (s)':>8} {'active':>6} {'words/s':>10} {'JFI':>6}  "
+              f"{'top served share':<24} top queued share")
+        for r in rows:
+            jfi = f"{r['jfi']:.3f}" if r["jfi"] is not None else "-"
+            print(f"{r['t']:8.2f} {r['active']:6d} {r['words_per_s']:10.0f} {jfi:>6}  "
+                  f"{top(r['served_share']):<24} {top(r['queued_share'])}")
+    mean = summary["mean_jfi"]
+    print(f"{summary['windows']} windows of {window_ms} ms, mean JFI "
+          f"{mean:.3f}, min {summary['min_jfi']:.3f}" if mean is not None else "no active windows")
+    for u in summary["unfair"]:
+        print(f"  JFI < {args.threshold} from {u['start_s']:.2f}s for {u['duration_s']:.2f}s "
+              f"(min {u['min_jfi']:.3f}){'' if u['recovered'] else ', not recovered by the end'}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary, "windows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""Discrete-event simulator of the word servers and their clients.
+
+Models what the Mininet experiments measure, without Mininet:
+
+  servers   fcfs       single worker, one global FIFO (part3/server.py,
+                       p3/server_part3_fcfs.py); persistent connections
+            fcfs-conn  same, but one TCP connection per request
+                       (part3_new/server.py)
+            rr         round robin over per-client-IP queues, one
+                       connection per request (part4/server.py)
+  policies  --policy fcfs|rr|srpt overrides the server's queueing order
+            (common/scheduling.py, the classes the servers use)
+  clients   part3      send c requests back-to-back, wait for c responses,
+                       stop as soon as an EOF line arrives (part3/client.py,
+                       part3_new/part4 client.py)
+            p3         same bursts, but always drains all c responses before
+                       checking for EOF (p3/client.py)
+
+Client 1 is the greedy one (batch size c); the others use batch size 1.
+The network is the star topology of topology.py: every link has the same
+bandwidth and one-way delay; the server's access link is the shared
+bottleneck and is modelled as a FIFO transmitter. The worker pays
+``proc_ms`` (only for in-range offsets, like handle_request) plus a fixed
+per-request overhead. Clients do not set TCP_NODELAY, so Nagle holds the
+rest of a greedy burst until its first request is ACKed; this is what keeps
+the measured part3 JFI well above a pure queueing model. Completion times are measured from a common start,
+and JFI uses the same 1/t utilities as Runner.calculate_jfi.
+
+    python3 simulator.py --clients 2000 --c 10 --k 5 --words 2000
+    python3 simulator.py --validate ../part3/results_p3.csv --config ../part3/config.json
+    python3 simulator.py --config ../part3/config.json --compare-policies 10
+
+Against part3/results_p3.csv the JFI is within 0.01 for every c except the
+c=10 outlier run.
+"""
+import argparse
+import heapq
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.scheduling import DEFAULT_AGING_MS, POLICIES, make_scheduler
+
+HEADER_BYTES = 66       # Ethernet + IP + TCP headers per segment
+REQUEST_BYTES = 8       # "p,k\n"
+
+
+def calculate_jfi(times):
+    """Jain's index on utilities 1/t_i (same as part3 Runner.calculate_jfi)."""
+    u = [1.0 / max(t, 1e-6) for t in times]
+    s = sum(u)
+    s2 = sum(x * x for x in u)
+    return (s * s) / (len(u) * s2) if s2 > 0 else 0.0
+
+
+class Simulation:
+    def __init__(self, num_clients=10, c=1, k=5, num_words=2000, word_bytes=4,
+                 proc_ms=0.0, overhead_ms=0.1, bw_mbps=1.0, delay_ms=0.05,
+                 server="fcfs", client="part3", launch_skew_ms=0.0, nagle=True,
+                 delayed_ack_ms=40.0, policy=None, aging_ms=DEFAULT_AGING_MS):
+        self.n = num_clients
+        self.c = c
+        self.k = k
+        self.N = num_words
+        self.word_bytes = word_bytes      # average word length incl. comma
+        self.proc = proc_ms / 1000.0
+        self.overhead = overhead_ms / 1000.0
+        self.bw = bw_mbps * 1e6 / 8.0     # bytes per second
+        self.prop = delay_ms / 1000.0
+        self.server = server
+        self.per_conn = server in ("fcfs-conn", "rr")
+        self.drain_all = client == "p3"
+        self.skew = launch_skew_ms / 1000.0
+        # clients do not set TCP_NODELAY: after the first small write of a
+        # burst, the rest is held until that segment is ACKed (piggybacked on
+        # its response, or the receiver's delayed-ACK timer)
+        self.nagle = nagle and not self.per_conn
+        self.ack_delay = delayed_ack_ms / 1000.0
+
+        self.now = 0.0
+        self._events = []
+        self._seq = 0
+
+        # server state: per-client queues in the order of the scheduling policy
+        policy = policy or ("rr" if server == "rr" else "fcfs")
+        self.queue = make_scheduler(policy, num_words, aging_ms, clock=lambda: self.now)
+        self.busy = False
+        self.link_free = 0.0
+
+        # client state
+        self.batch = [c if i == 0 else 1 for i in range(num_clients)]
+        self.offset = [0] * num_clients
+        self.pending = [0] * num_clients  # responses still expected this round
+        self.saw_eof = [False] * num_clients
+        self.finish = [None] * num_clients
+        self.held = [None] * num_clients  # Nagle-held offsets, waiting for an ACK
+        self.requests_served = 0
+
+    # --- event loop ---
+    def at(self, t, fn, *args):
+        self._seq += 1
+        heapq.heappush(self._events, (t, self._seq, fn, args))
+
+    def run(self):
+        for i in range(self.n):
+            self.at(i * self.skew, self._client_round, i)
+        events = self._events
+        while events:
+            t, _, fn, args = heapq.heappop(events)
+            self.now = t
+            fn(*args)
+        return self.finish
+
+    # --- network ---
+    def _ser(self, nbytes):
+        return (nbytes + HEADER_BYTES) / self.bw
+
+    def _uplink(self):
+        """Client -> server: handshake (per-connection servers) + request."""
+        d = 2 * self.prop + 2 * self._ser(REQUEST_BYTES)
+        if self.per_conn:
+            d += 4 * self.prop + 4 * self._ser(0)     # SYN / SYN-ACK round trip
+        return d
+
+    def _response_bytes(self, p):
+        if p >= self.N:
+            return 4
+        words = min(self.k, self.N - p)
+        return words * self.word_bytes + (4 if p + self.k >= self.N else 0)
+
+    # --- clients ---
+    def _client_round(self, i):
+        b = self.batch[i]
+        self.pending[i] = b
+        up = self._uplink()
+        offsets = [self.offset[i] + j * self.k for j in range(b)]
+        self.offset[i] += b * self.k
+        if self.nagle and b > 1:
+            self.held[i] = offsets[1:]
+            self.at(self.now + up, self._arrive, i, offsets[0], self.held[i])
+            return
+        for p in offsets:
+            self.at(self.now + up, self._arrive, i, p)
+
+    def _ack(self, i):
+        """The first segment of a burst was ACKed: flush the held requests."""
+        held, self.held[i] = self.held[i], None
+        if held:
+            self.at(self.now + self._uplink(), self._arrive_many, i, held)
+
+    def _deliver(self, i, p):
+        if self.finish[i] is not None:
+            return                          # client already closed
+        eof = p + self.k >= self.N
+        self.saw_eof[i] = self.saw_eof[i] or eof
+        self.pending[i] -= 1
+        if eof and not self.drain_all:
+            self.finish[i] = self.now
+        elif self.pending[i] == 0:
+            if self.saw_eof[i]:
+                self.finish[i] = self.now
+            else:
+                self._client_round(i)
+
+    # --- server ---
+    def _arrive_many(self, i, offsets):
+        for p in offsets:
+            self._arrive(i, p)
+
+    def _arrive(self, i, p, held=None):
+        if held:
+            self.at(self.now + self.ack_delay, self._send_ack, i, held)
+        self.queue.push(i, p, p, self.k)
+        if not self.busy:
+            self._start_service()
+
+    def _start_service(self):
+        req = self.queue.pop()
+        if req is None:
+            self.busy = False
+            return
+        self.busy = True
+        i, p = req
+        service = self.overhead + (self.proc if p < self.N else 0.0)
+        self.at(self.now + service, self._finish_service, i, p)
+
+    def _send_ack(self, i, held):
+        if self.held[i] is held:            # still waiting on this burst
+            self.at(self.now + 2 * self.prop + 2 * self._ser(0), self._ack, i)
+
+    def _finish_service(self, i, p):
+        self.requests_served += 1
+        # sendall returns once the data is buffered; the access link drains it
+        ser = self._ser(self._response_bytes(p))
+        self.link_free = max(self.link_free, self.now) + ser
+        arrival = self.link_free + ser + 2 * self.prop
+        self.at(arrival, self._deliver, i, p)
+        if self.held[i]:
+            self.at(arrival, self._ack, i)          # ACK rides on the response
+        self._start_service()
+
+
+def simulate(**kw):
+    sim = Simulation(**kw)
+    finish = sim.run()
+    times_ms = [t * 1000.0 for t in finish]
+    return {"times_ms": times_ms, "jfi": calculate_jfi(times_ms),
+            "mean_ms": sum(times_ms) / len(times_ms), "requests": sim.requests_served}
+
+
+def compare_policies(base, cs, policies=POLICIES):
+    """Mean completion time and JFI per scheduling policy for each c."""
+    print(f"{'c':>3} " + " ".join(f"{p + ' mean_ms':>13} {p + ' jfi':>8}" for p in policies))
+    rows = []
+    for c in cs:
+        row = {p: simulate(**dict(base, c=c, policy=p)) for p in policies}
+        rows.append((c, row))
+        print(f"{c:>3} " + " ".join(f"{row[p]['mean_ms']:>13.1f} {row[p]['jfi']:>8.4f}"
+                                    for p in policies))
+    return rows
+
+
+def load_config(filename):
+    """Simple config parser (same format as the part directories)."""
+    cfg = {}
+    with open(filename) as f:
+        for line in f:
+            line = line.strip().strip(",")
+            if not line or line[0] in "{}":
+                continue
+            k, v = line.split(":", 1)
+            cfg[k.strip().strip('"')] = v.strip().strip('"')
+    return cfg
+
+
+def corpus_stats(words_file, repeat=1):
+    """(word count, average bytes per word incl. separator)."""
+    with open(words_file) as f:
+        words = f.read().strip().split(",")
+    return len(words) * max(1, repeat), (sum(len(w) for w in words) + len(words)) / len(words)
+
+
+def validate(csv_path, base):
+    """Compare simulated JFI with a stored results CSV (columns c,run,jfi)."""
+    import csv
+    measured = {}
+    with open(csv_path) as f:
+        for row in csv.DictReader(f):
+            measured.setdefault(int(row["c"]), []).append(float(row["jfi"]))
+    print(f"{'c':>3} {'measured':>9} {'simulated':>9} {'error':>7}")
+    errs = []
+    for c in sorted(measured):
+        m = sum(measured[c]) / len(measured[c])
+        s = simulate(**dict(base, c=c))["jfi"]
+        errs.append(s - m)
+        print(f"{c:>3} {m:>9.4f} {s:>9.4f} {s - m:>+7.4f}")
+    rmse = math.sqrt(sum(e * e for e in errs) / len(errs))
+    print(f"RMSE = {rmse:.4f}, max |error| = {max(abs(e) for e in errs):.4f}")
+    return rmse
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--config", help="take num_clients/c/k/proc_ms/repeat_words from this config.json")
+    ap.add_argument("--words-file", help="corpus (default: words.txt next to --config)")
+    ap.add_argument("--clients", type=int)
+    ap.add_argument("--c", type=int)
+    ap.add_argument("--k", type=int)
+    ap.add_argument("--words", type=int, help="corpus size in words (overrides --words-file)")
+    ap.add_argument("--word-bytes", type=float, default=4.0)
+    ap.add_argument("--proc-ms", type=float)
+    ap.add_argument("--overhead-ms", type=float, default=0.1, help="per-request server CPU cost")
+    ap.add_argument("--bw", type=float, default=1.0, help="link bandwidth (Mbps)")
+    ap.add_argument("--delay-ms", type=float, default=0.05, help="one-way delay per link")
+    ap.add_argument("--server", choices=["fcfs", "fcfs-conn", "rr"], default="fcfs")
+    ap.add_argument("--client", choices=["part3", "p3"], default="part3")
+    ap.add_argument("--policy", choices=POLICIES, help="queueing order (default: the server's)")
+    ap.add_argument("--aging-ms", type=float, default=DEFAULT_AGING_MS, help="srpt aging")
+    ap.add_argument("--launch-skew-ms", type=float, default=0.0,
+                    help="delay between consecutive client starts")
+    ap.add_argument("--no-nagle", action="store_true", help="model clients with TCP_NODELAY")
+    ap.add_argument("--delayed-ack-ms", type=float, default=40.0)
+    ap.add_argument("--sweep-c", type=int, metavar="CMAX", help="report JFI for c = 1..CMAX")
+    ap.add_argument("--validate", metavar="CSV", help="compare against a stored c,run,jfi CSV")
+    ap.add_argument("--compare-policies", type=int, metavar="CMAX",
+                    help="mean completion time and JFI of fcfs, rr and srpt for c = 1..CMAX")
+    args = ap.parse_args()
+
+    cfg = load_config(args.config) if args.config else {}
+    words_file = args.words_file or (os.path.join(os.path.dirname(args.config), "words.txt")
+                                     if args.config else None)
+    num_words, word_bytes = args.words, args.word_bytes
+    if num_words is None:
+        if words_file and os.path.exists(words_file):
+            num_words, word_bytes = corpus_stats(words_file, int(cfg.get("repeat_words", 1)))
+        else:
+            num_words = 2000
+
+    def pick(arg, key, default, conv=int):
+        return arg if arg is not None else conv(cfg.get(key, default))
+
+    base = dict(num_clients=pick(args.clients, "num_clients", 10), c=pick(args.c, "c", 1),
+                k=pick(args.k, "k", 5), num_words=num_words, word_bytes=word_bytes,
+                proc_ms=pick(args.proc_ms, "proc_ms", 0, float), overhead_ms=args.overhead_ms,
+                bw_mbps=args.bw, delay_ms=args.delay_ms, server=args.server, client=args.client,
+                launch_skew_ms=args.launch_skew_ms, nagle=not args.no_nagle,
+                delayed_ack_ms=args.delayed_ack_ms, policy=args.policy, aging_ms=args.aging_ms)
+
+    if args.validate:
+        validate(args.validate, base)
+    elif args.compare_policies:
+        compare_policies(base, range(1, args.compare_policies + 1))
+    elif args.sweep_c:
+        for c in range(1, args.sweep_c + 1):
+            r = simulate(**dict(base, c=c))
+            print(f"c={c} JFI={r['jfi']:.4f} mean={r['mean_ms']:.1f}ms "
+                  f"greedy={r['times_ms'][0]:.1f}ms")
+    else:
+        r = simulate(**base)
+        t = r["times_ms"]
+        print(f"clients={len(t)} requests={r['requests']} JFI={r['jfi']:.4f} "
+              f"greedy={t[0]:.1f}ms mean={r['mean_ms']:.1f}ms max={max(t):.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Live counters for running servers and a small query endpoint.
+
+A server keeps one ServerStats and bumps it on its hot path. on_served
+is only called from the single worker thread, so it is plain int and dict
+updates; connection open/close may come from several threads and take a
+small lock. When config.json has ``stats_port`` and/or ``stats_socket``
+the server also starts ``serve_stats``: a daemon thread answering line
+commands with one JSON line each, e.g.
+
+    $ echo stats | nc -U logs/server.stats.sock
+    {"uptime_s": 3.2, "queue_depth": 4, "served": {"10.0.0.1": 120, ...}, ...}
+
+Unix sockets are reachable from the runner even though the server lives
+in a Mininet host namespace. ``stats_interval_ms`` + ``stats_path`` make
+the server append snapshots to a JSON-lines file instead/as well, and
+``trace_window_ms`` adds a per-window trace of the service (see servicetrace.py).
+"""
+import json
+import os
+import socket
+import threading
+import time
+
+from common.servicetrace import count_words
+
+
+class ServerStats:
+    def __init__(self, queue_depth=None):
+        self.started = time.monotonic()
+        self.queue_depth = queue_depth or (lambda: 0)  # callable -> int or {client: int}
+        self.served = {}        # client -> requests served
+        self.bytes_sent = 0
+        self.send_calls = 0
+        self.active_connections = 0
+        self.accepted = 0
+        self.busy_ns = 0        # worker time spent serving requests
+        self.trace = None       # servicetrace.WindowTrace, see install_trace
+        self._conn_lock = threading.Lock()
+        self.commands = {"stats": lambda args: self.snapshot()}
+
+    # --- hot-path updates ---
+    def on_accept(self):
+        with self._conn_lock:
+            self.accepted += 1
+            self.active_connections += 1
+
+    def on_close(self):
+        with self._conn_lock:
+            self.active_connections -= 1
+
+    def on_served(self, client, nbytes, busy_ns=0, requests=1, send_calls=1, payload=None):
+        """`payload`: the response bytes (or list of them), only read by the trace."""
+        self.served[client] = self.served.get(client, 0) + requests
+        self.bytes_sent += nbytes
+        self.send_calls += send_calls
+        self.busy_ns += busy_ns
+        if self.trace is not None and payload is not None:
+            self.trace.record(client, count_words(payload), requests)
+
+    # --- reporting ---
+    def snapshot(self):
+        uptime = time.monotonic() - self.started
+        served = dict(self.served)
+        total = sum(served.values())
+        return {
+            "time": time.time(),
+            "uptime_s": uptime,
+            "queue_depth": self.queue_depth(),
+            "served": served,
+            "share": {c: n / total for c, n in served.items()} if total else {},
+            "bytes_sent": self.bytes_sent,
+            "send_calls": self.send_calls,
+            "active_connections": self.active_connections,
+            "accepted": self.accepted,
+            "threads": threading.active_count(),
+            "worker_busy_s": self.busy_ns / 1e9,
+            "worker_utilization": (self.busy_ns / 1e9) / uptime if uptime > 0 else 0.0,
+        }
+
+    def handle(self, line):
+        """Run one command line ('stats', or a registered extension)."""
+        parts = line.split()
+        name = parts[0] if parts else "stats"
+        fn = self.commands.get(name)
+        if fn is None:
+            return {"error": f"unknown command {name!r}", "commands": sorted(self.commands)}
+        try:
+            return fn(parts[1:])
+        except Exception as e:
+            return {"error": str(e)}
+
+
+def _serve_conn(stats, conn):
+    with conn:
+        f = conn.makefile("rwb")
+        for raw in f:
+            reply = stats.handle(raw.decode(errors="ignore").strip())
+            f.write((json.dumps(reply) + "\n").encode())
+            f.flush()
+
+
+def _accept_loop(stats, listener):
+    while True:
+        try:
+            conn, _ = listener.accept()
+        except OSError:
+            return
+        threading.Thread(target=_serve_conn, args=(stats, conn), daemon=True).start()
+
+
+def serve_stats(stats, config):
+    """Start the endpoints configured in `config` (a dict of strings/ints)."""
+    listeners = []
+    port = int(config.get("stats_port", 0) or 0)
+    if port:
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind((str(config.get("server_ip", "0.0.0.0")), port))
+        s.listen()
+        listeners.append(s)
+    path = config.get("stats_socket")
+    if path:
+        if os.path.exists(path):
+            os.remove(path)
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.bind(path)
+        s.listen()
+        listeners.append(s)
+    for s in listeners:
+        threading.Thread(target=_accept_loop, args=(stats, s), daemon=True).start()
+
+    interval = int(config.get("stats_interval_ms", 0) or 0)
+    if interval:
+        out = config.get("stats_path", "logs/server.stats.jsonl")
+        threading.Thread(target=_snapshot_loop, args=(stats, out, interval / 1000.0),
+                         daemon=True).start()
+    return listeners
+
+
+def _snapshot_loop(stats, path, interval):
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    with open(path, "w") as f:
+        while True:
+            time.sleep(interval)
+            f.write(json.dumps(stats.snapshot()) + "\n")
+            f.flush()
+
+
+def query(addr, command="stats", timeout=2.0):
+    """Send one command to a stats endpoint (unix path or (host, port))."""
+    family = socket.AF_UNIX if isinstance(addr, str) else socket.AF_INET
+    with socket.socket(family, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(addr)
+        s.sendall((command + "\n").encode())
+        buf = b""
+        while not buf.endswith(b"\n"):
+            chunk = s.recv(65536)
+            if not chunk:
+                break
+            buf += chunk
+    return json.loads(buf)
+
+
+class Sampler:
+    """Runner-side thread polling a stats endpoint every `interval` seconds."""
+
+    def __init__(self, addr, interval=0.5):
+        self.addr = addr
+        self.interval = interval
+        self.snapshots = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.snapshots.append(query(self.addr))
+            except (OSError, ValueError):
+                pass
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.snapshots
@@ -0,0 +1,46 @@
+"""A recorded run's samples come back out of the results store.
+
+    python3 -m pytest common/test_results_store.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common import hdr
+from common.instrument import store_samples
+from common.results_store import ResultsStore
+
+
+def test_add_samples_round_trip(tmp_path):
+    store = ResultsStore(tmp_path / "results.db")
+    exp = store.new_experiment("test", {"k": 5})
+    run = store.add_run(exp, "c", 2, 1)
+    store.add_client(run, "rogue", "rogue", finish_ms=10.0)
+    store.add_samples(run, "rogue", "rtt", [0.5, 1.5])
+    rows = store.sample_rows(exp, "rtt")
+    store.close()
+    assert [(r["x"], r["run"], r["client"], r["class"], r["value_ms"]) for r in rows] == \
+        [(2, 1, "rogue", "rogue", 0.5), (2, 1, "rogue", "rogue", 1.5)]
+
+
+def test_store_samples_from_histograms(tmp_path):
+    rtt = hdr.Histogram()
+    for us in (120, 80, 80):
+        rtt.record(us)
+    wait = hdr.Histogram()
+    wait.record(40)
+    hdr.dump(tmp_path / "rogue.hist.json", {"rtt": rtt})
+    hdr.dump(tmp_path / "server.hist.json", {"queue_wait": {"10.0.0.1": wait},
+                                             "service": {"10.0.0.1": wait}})
+
+    store = ResultsStore(tmp_path / "results.db")
+    exp = store.new_experiment("test", {})
+    run = store.add_run(exp, "c", 1, 1)
+    store_samples(store, run, tmp_path / "server.hist.json",
+                  {"rogue": tmp_path / "rogue.hist.json", "normal_2": tmp_path / "missing.json"})
+    rtts = store.sample_rows(exp, "rtt")
+    waits = store.sample_rows(exp, "queue_wait")
+    store.close()
+    assert sorted(r["value_ms"] for r in rtts) == [0.08, 0.08, 0.12]
+    assert {r["client"] for r in rtts} == {"rogue"}
+    assert [(r["client"], r["value_ms"]) for r in waits] == [("10.0.0.1", 0.04)]
@@ -0,0 +1,41 @@
+"""A nonempty WordIndex serves the same slices as p3's list of words.
+
+    python3 -m pytest common/test_wordindex.py
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.wordindex import WordIndex, build
+
+CORPORA = [
+    "cat,dog,,emu,ant,,,fox,cow,",
+    ",cat, dog ,emu,\n,ant,fox,,cow,emu,,\n",
+    " ,, , ,",
+    "",
+]
+
+
+def p3_words(text):
+    """p3/server_part3_fcfs.py's list path."""
+    return [w.strip() for w in text.strip().split(",") if w.strip()]
+
+
+@pytest.mark.parametrize("text", CORPORA)
+@pytest.mark.parametrize("stride,chunk_size", [(1, 3), (2, 5), (64, 1 << 20)])
+def test_nonempty_matches_list(tmp_path, text, stride, chunk_size):
+    path = str(tmp_path / "words.txt")
+    with open(path, "w") as f:
+        f.write(text)
+    build(path, stride, chunk_size, nonempty=True)
+    index = WordIndex(path, stride=stride, rebuild=False, nonempty=True)
+    words = p3_words(text)
+    try:
+        assert len(index) == len(words)
+        for p in range(len(words) + 1):
+            for k in (1, 2, 5):
+                assert index[p:p + k] == words[p:p + k]
+    finally:
+        index.close()
@@ -0,0 +1,63 @@
+"""Unix domain stream sockets next to TCP, for co-located clients and benchmarks.
+
+With ``unix_socket`` in config.json a Python server listens on that path as
+well as on its TCP port, and serves both alike: same protocol, same queues,
+same scheduler. Clients pick it with ``--transport unix`` (or "transport":
+"unix" in config.json) and connect to the path from the same config. Mininet
+hosts share the file system, so this also works across host namespaces,
+and bench.py uses it to time a server without the TCP/IP stack.
+
+A peer on a Unix socket has no IP address, so it is keyed ``unix:<pid>``
+by the pid from SO_PEERCRED: per-client scheduling and the stats then treat
+every client process as one client, as they treat every host over TCP.
+"""
+import os
+import socket
+import struct
+
+_UCRED = struct.Struct("3i")        # pid, uid, gid
+
+
+def listen_unix(path, backlog=128):
+    """Listening stream socket at `path`, replacing a stale socket file."""
+    if os.path.exists(path):
+        os.remove(path)
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.bind(path)
+    s.listen(backlog)
+    return s
+
+
+def listen_config(config):
+    """The Unix listener configured by "unix_socket", or None."""
+    path = config.get("unix_socket")
+    if not path:
+        return None
+    s = listen_unix(path)
+    print(f"Server listening on unix {path}")
+    return s
+
+
+def peer_key(conn, addr):
+    """Client key of an accepted connection: its IP, or unix:<pid>."""
+    if conn.family == socket.AF_UNIX:
+        pid, _, _ = _UCRED.unpack(conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                                  _UCRED.size))
+        return f"unix:{pid}"
+    return addr[0]
+
+
+def connect(addr):
+    """Connected stream socket to (host, port), or to a Unix socket path."""
+    if not isinstance(addr, str):
+        return socket.create_connection(addr)
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(addr)
+    except OSError:
+        s.close()
+        raise
+    return s
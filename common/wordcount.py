@@ -0,0 +1,84 @@
+"""Streaming word counts for the clients.
+
+Clients feed every response line to a WordCounter as it arrives instead
+of collecting the whole file into a list and counting at the end, so
+counting overlaps the wait for the next response and memory grows with
+the vocabulary, not with the file (or ``repeat_words``). Lines are counted
+as bytes straight from the receive buffer; a word is decoded only when the
+counts are printed.
+"""
+import collections
+import resource
+
+EOF = b"EOF"
+
+
+class WordCounter:
+    def __init__(self):
+        self.counts = collections.Counter()   # word (bytes) -> count
+        self.words = 0
+        self.responses = 0
+        self.bytes = 0
+        self.eof = False
+
+    def add(self, line):
+        """Count the words of one response line (bytes); True if it ends with EOF."""
+        self.responses += 1
+        self.bytes += len(line)
+        tokens = line.strip().split(b",")
+        eof = tokens[-1] == EOF
+        if eof:
+            tokens.pop()
+            self.eof = True
+        tokens = [t for t in tokens if t]     # "EOF" alone, or stray empty words
+        self.counts.update(tokens)
+        self.words += len(tokens)
+        return eof
+
+    def __len__(self):
+        return len(self.counts)
+
+    def items(self):
+        """(word, count) pairs, words decoded."""
+        return ((w.decode(errors="replace"), n) for w, n in self.counts.items())
+
+    def result(self, **fields):
+        """The counting part of a client's structured result (see resultchan.py).
+
+        Without an explicit ``error``, a download that ended before EOF is one.
+        """
+        result = {"requests": self.responses, "words": self.words, "bytes": self.bytes,
+                  "vocab": len(self.counts), "peak_rss_kb": peak_rss_kb(),
+                  "error": None if self.eof else "connection closed before EOF"}
+        result.update(fields)
+        return result
+
+
+def reset_peak_rss():
+    """Start a new peak: reset VmHWM to the current RSS (Linux >= 4.0).
+
+    A pre-warmed agent runs many clients in one process, so each run resets
+    the mark first and reports its own peak. False if it could not be reset.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process since it started or reset_peak_rss() (kB).
+
+    VmHWM where /proc exists: ru_maxrss survives exec on Linux, so a client
+    started by a large runner would report the runner's peak.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""Sparse on-disk index of a comma-separated word corpus.
+
+The servers load their corpus with ``f.read().strip().split(",")``, which
+costs a Python string per word and grows without bound with the file (and
+``repeat_words``). A WordIndex instead keeps a sidecar ``<corpus>.idx``
+holding the byte offset of every ``stride``-th word plus the corpus size
+and mtime. Opening it reads only that array; ``index[p:p+k]`` does one
+``pread`` at the nearest indexed offset and a short scan, and returns the
+same words the split list would. ``repeat`` makes the corpus look that
+many times longer without copying it. With ``nonempty`` the index matches
+p3's list instead, whose words are stripped and the empty ones (",," or a
+trailing comma) dropped; it keeps its own ``<corpus>.nonempty.idx``.
+
+The sidecar is built by a streaming pass over the file in fixed-size
+chunks, using a vectorized NumPy search for the delimiters when NumPy is
+installed and ``bytes.find`` otherwise. It is rebuilt automatically when
+the corpus size or mtime no longer match.
+
+Servers opt in with ``"word_index": 1`` (and optionally
+``"word_index_stride"``) in config.json via ``load_words``.
+
+    python3 wordindex.py build words.txt --stride 64
+    python3 wordindex.py bench --sizes 1e5 1e6 1e7
+"""
+import argparse
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from array import array
+
+try:
+    import numpy as np
+except ImportError:          # plain-Python delimiter search
+    np = None
+
+MAGIC = b"WIDX1\0\0\0"
+HEADER = struct.Struct("<8sIQqQQQ")   # magic, stride, size, mtime_ns, count, lead, end
+CHUNK = 16 << 20
+WHITESPACE = b" \t\n\r\x0b\x0c"
+DEFAULT_STRIDE = 64
+
+
+def index_path(corpus, nonempty=False):
+    return corpus + (".nonempty.idx" if nonempty else ".idx")
+
+
+def _content_bounds(f, size):
+    """Byte range of the corpus after str.strip() (leading/trailing whitespace)."""
+    lead = 0
+    while lead < size:
+        block = os.pread(f.fileno(), 4096, lead)
+        stripped = block.lstrip(WHITESPACE)
+        lead += len(block) - len(stripped)
+        if stripped:
+            break
+    end = size
+    while end > lead:
+        start = max(lead, end - 4096)
+        block = os.pread(f.fileno(), end - start, start)
+        stripped = block.rstrip(WHITESPACE)
+        end = start + len(stripped)
+        if stripped:
+            break
+    return lead, end
+
+
+def _scan(chunk, base, count, stride):
+    """Delimiters in `chunk` (which starts at byte `base`).
+
+    `count` words precede the chunk; a ',' ends the current word and
+    starts word number count + j. Returns (start offsets of the new words
+    whose number is a multiple of `stride`, number of ',' found).
+    """
+    first = (-count) % stride
+    if np is not None:
+        commas = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == 44)
+        return (commas[first::stride] + (base + 1)).tolist(), len(commas)
+    starts = []
+    n = 0
+    i = chunk.find(b",")
+    while i >= 0:
+        if n % stride == first:
+            starts.append(base + i + 1)
+        n += 1
+        i = chunk.find(b",", i + 1)
+    return starts, n
+
+
+def _scan_nonempty(f, lead, end, stride, chunk_size):
+    """Start offsets of every stride-th non-blank word in lead..end, and their count."""
+    offsets = array("Q")
+    count = 0
+    start, blank = lead, True                # the current word: where it starts, no content yet
+
+    def word_done():
+        nonlocal count
+        if not blank:
+            if count % stride == 0:
+                offsets.append(start)
+            count += 1
+
+    pos = lead
+    while pos < end:
+        chunk = os.pread(f.fileno(), min(chunk_size, end - pos), pos)
+        at = pos
+        for i, part in enumerate(chunk.split(b",")):
+            if i:                            # a ',' ended the previous word
+                word_done()
+                start, blank = at, True
+            if blank and part.strip(WHITESPACE):
+                blank = False
+            at += len(part) + 1
+        pos += len(chunk)
+    word_done()
+    return offsets, count
+
+
+def build(corpus, stride=DEFAULT_STRIDE, chunk_size=CHUNK, nonempty=False):
+    """Stream over `corpus` and write its sidecar index; returns the path."""
+    st = os.stat(corpus)
+    offsets = array("Q")
+    with open(corpus, "rb") as f:
+        lead, end = _content_bounds(f, st.st_size)
+        if nonempty:
+            offsets, count = _scan_nonempty(f, lead, end, stride, chunk_size)
+        else:
+            offsets.append(lead)             # word 0
+            count = 1                        # words seen so far (= commas + 1)
+            pos = lead
+            while pos < end:
+                chunk = os.pread(f.fileno(), min(chunk_size, end - pos), pos)
+                starts, n = _scan(chunk, pos, count, stride)
+                offsets.extend(starts)
+                count += n
+                pos += len(chunk)
+
+    path = index_path(corpus, nonempty)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as out:
+        out.write(HEADER.pack(MAGIC, stride, st.st_size, st.st_mtime_ns, count, lead, end))
+        offsets.tofile(out)
+    os.replace(tmp, path)
+    return path
+
+
+class WordIndex:
+    """Read-only, sequence-like view of a corpus: len(), index[i], index[a:b]."""
+
+    def __init__(self, corpus, repeat=1, stride=DEFAULT_STRIDE, rebuild=True, nonempty=False):
+        self.corpus = corpus
+        self.nonempty = nonempty             # stripped words, empty ones skipped
+        path = index_path(corpus, nonempty)
+        if not self._load(path) and rebuild:
+            build(corpus, stride, nonempty=nonempty)
+            self._load(path)
+        if not hasattr(self, "offsets"):
+            raise ValueError(f"no valid index for {corpus}")
+        self.repeat = max(1, int(repeat))
+        self.fd = os.open(corpus, os.O_RDONLY)
+
+    def _load(self, path):
+        """Read the sidecar if it exists and matches the corpus on disk."""
+        try:
+            with open(path, "rb") as f:
+                header = f.read(HEADER.size)
+                magic, stride, size, mtime_ns, count, lead, end = HEADER.unpack(header)
+                st = os.stat(self.corpus)
+                if magic != MAGIC or size != st.st_size or mtime_ns != st.st_mtime_ns:
+                    return False
+                offsets = array("Q")
+                offsets.frombytes(f.read())
+        except (OSError, struct.error):
+            return False
+        self.stride, self.count, self.lead, self.end = stride, count, lead, end
+        self.offsets = offsets
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+    def __len__(self):
+        return self.count * self.repeat
+
+    def _read(self, p, k):
+        """k words starting at word p of the base corpus (p + k <= count)."""
+        pos = self.offsets[p // self.stride]
+        skip = p % self.stride
+        need = skip + k              # words to have complete in the buffer
+        buf = b""
+        while True:
+            want = min(max(4096, 16 * need), self.end - pos)
+            buf += os.pread(self.fd, want, pos)
+            pos += want
+            if self.nonempty:
+                parts = buf.split(b",")
+                if pos < self.end:
+                    parts.pop()              # may be cut short
+                words = [w for w in (part.strip(WHITESPACE) for part in parts) if w]
+                if len(words) >= need or pos >= self.end:
+                    return [w.decode() for w in words[skip:need]]
+            elif buf.count(b",") >= need or pos >= self.end:
+                break
+        parts = buf.split(b",", need)
+        return [w.decode() for w in parts[skip:need]]
+
+    def slice(self, p, k):
+        out = []
+        total = len(self)
+        while k > 0 and p < total:
+            q = p % self.count
+            take = min(k, self.count - q)
+            out.extend(self._read(q, take))
+            p += take
+            k -= take
+        return out
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError("WordIndex only supports contiguous slices")
+            return self.slice(start, stop - start)
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError(key)
+        return self.slice(key, 1)[0]
+
+
+def load_words(filename, repeat=1, config=None):
+    """The server's word sequence: a list, or a WordIndex if config enables it."""
+    config = config or {}
+    if int(config.get("word_index", 0) or 0):
+        return WordIndex(filename, repeat,
+                         int(config.get("word_index_stride", DEFAULT_STRIDE) or DEFAULT_STRIDE))
+    with open(filename) as f:
+        base = f.read().strip().split(",")
+    return base * max(1, int(repeat))
+
+
+# --- benchmark: startup time and peak RSS vs corpus size ---
+_PROBE = r"""
+import resource, sys, time
+
+def peak_rss_kb():
+    # VmHWM is per address space; ru_maxrss would include the parent before exec
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+from common.wordindex import load_words
+words = load_words({path!r}, 1, {{"word_index": {indexed}}})
+n = len(words)
+t1 = time.perf_counter()
+for p in range(0, n, max(1, n // 1000)):
+    words[p:p + 5]
+t2 = time.perf_counter()
+rss = peak_rss_kb()
+print(t1 - t0, (t2 - t1) / len(range(0, n, max(1, n // 1000))), rss, n)
+"""
+
+
+def _probe(path, indexed):
+    root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+    out = subprocess.run([sys.executable, "-c", _PROBE.format(root=root, path=path,
+                                                               indexed=int(indexed))],
+                         capture_output=True, text=True, check=True).stdout.split()
+    startup, lookup, rss_kb, n = float(out[0]), float(out[1]), int(out[2]), int(out[3])
+    return startup, lookup, rss_kb, n
+
+
+def bench(sizes, stride=DEFAULT_STRIDE):
+    vocab = [b"cat", b"dog", b"emu", b"ant", b"fox", b"cow"]
+    print(f"{'words':>12} {'MB':>8} {'build_s':>8} | {'list_start_s':>12} {'list_rss_MB':>11} | "
+          f"{'idx_start_s':>11} {'idx_rss_MB':>10} {'lookup_us':>9}")
+    with tempfile.TemporaryDirectory() as d:
+        for n in sizes:
+            path = os.path.join(d, f"words_{n}.txt")
+            with open(path, "wb") as f:
+                line = b",".join(vocab[i % len(vocab)] for i in range(1_000_000))
+                full, rest = divmod(n, 1_000_000)
+                for _ in range(full):
+                    f.write(line + (b"," if rest or _ < full - 1 else b""))
+                f.write(b",".join(vocab[i % len(vocab)] for i in range(rest)))
+                f.write(b"\n")
+            t0 = time.perf_counter()
+            build(path, stride)
+            t_build = time.perf_counter() - t0
+            l_start, _, l_rss, n_list = _probe(path, False)
+            i_start, i_lookup, i_rss, n_idx = _probe(path, True)
+            assert n_list == n_idx == n, (n_list, n_idx, n)
+            print(f"{n:>12} {os.path.getsize(path) / 1e6:>8.1f} {t_build:>8.3f} | "
+                  f"{l_start:>12.3f} {l_rss / 1024:>11.1f} | "
+                  f"{i_start:>11.4f} {i_rss / 1024:>10.1f} {i_lookup * 1e6:>9.1f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="write <corpus>.idx")
+    b.add_argument("corpus")
+    b.add_argument("--stride", type=int, default=DEFAULT_STRIDE)
+    r = sub.add_parser("bench", help="startup time and RSS of list vs index loading")
+    r.add_argument("--sizes", type=float, nargs="+", default=[1e5, 1e6, 1e7])
+    r.add_argument("--stride", type=int, default=DEFAULT_STRIDE)
+    args = ap.parse_args()
+    if args.cmd == "build":
+        t0 = time.perf_counter()
+        path = build(args.corpus, args.stride)
+        idx = WordIndex(args.corpus)
+        print(f"{path}: {idx.count} words, {len(idx.offsets)} offsets, "
+              f"{time.perf_counter() - t0:.3f}s"
+              f"{'' if np is not None else ' (no numpy)'}")
+    else:
+        bench([int(s) for s in args.sizes], args.stride)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""Pool of worker processes serving requests from a shared-memory corpus.
+
+In-process servers do parsing, slicing, joining and sending under one GIL,
+so CPU-bound service never uses more than one core. With ``"workers": N``
+in config.json a server keeps its I/O and scheduling in the main process
+and hands each request to one of N worker processes:
+
+  * the corpus lives once in ``multiprocessing.shared_memory``: the word
+    text plus the start offset of every word, so a response is one slice
+    of the text (``words[p:p+k]`` joined with ',' is exactly that slice)
+  * every worker owns a slot in a shared response arena and writes its
+    response there; only (seq, length, busy_ns) goes back over its pipe
+  * the front end dispatches in the server's scheduling order (FCFS or
+    RR) and delivers responses in that same order, so the wire sees the
+    order the in-process server would produce, while service overlaps
+
+Workers are forked, so they inherit the shared segments without
+re-attaching. ``proc_ms`` is emulated in the worker (sleep, or a busy loop
+with ``spin`` to model CPU-bound service).
+
+    python3 workerpool.py bench --workers 1 2 4 --proc-ms 2 --spin
+"""
+import argparse
+import atexit
+import multiprocessing as mp
+import os
+import signal
+import struct
+import sys
+import time
+from array import array
+from collections import deque
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.wordindex import _scan
+
+_HEADER = struct.Struct("<QQ")       # word count, text length
+EOF_LINE = b"EOF\n"
+
+
+class SharedCorpus:
+    """Corpus text and word offsets in one shared-memory segment."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            text = f.read().strip()
+        starts, n = _scan(text, 0, 1, 1)          # every word after the first
+        offsets = array("Q", [0])
+        offsets.extend(starts)
+        offsets.append(len(text) + 1)             # as if a ',' followed the last word
+        self.count = n + 1
+        size = _HEADER.size + offsets.itemsize * len(offsets) + len(text)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        _HEADER.pack_into(self.shm.buf, 0, self.count, len(text))
+        o_end = _HEADER.size + offsets.itemsize * len(offsets)
+        self.shm.buf[_HEADER.size:o_end] = offsets.tobytes()
+        self.shm.buf[o_end:o_end + len(text)] = text
+        self._views(o_end, len(text))
+
+    def _views(self, o_end, text_len):
+        self.offsets = self.shm.buf[_HEADER.size:o_end].cast("Q")
+        self.text = self.shm.buf[o_end:o_end + text_len]
+
+    def words(self, p, q):
+        """Bytes of words p..q-1 of the base corpus joined by ',' (p < q <= count)."""
+        return self.text[self.offsets[p]:self.offsets[q] - 1]
+
+    def response(self, p, k, repeat):
+        """The servers' response line for request (p, k); EOF if p < 0 (-1: unparsable)."""
+        total = self.count * repeat
+        if p < 0 or p >= total:
+            return EOF_LINE
+        end = min(p + k, total)
+        parts = []
+        while p < end:
+            q = p % self.count
+            take = min(end - p, self.count - q)
+            parts.append(self.words(q, q + take))
+            p += take
+        if end >= total:
+            parts.append(b"EOF")
+        return b",".join(parts) + b"\n"
+
+    def close(self, unlink=True):
+        self.offsets.release()
+        self.text.release()
+        try:
+            self.shm.close()
+        except BufferError:           # a view is still held by another thread
+            pass
+        if unlink:
+            self.shm.unlink()
+
+
+def _emulate(proc_ms, spin):
+    if proc_ms <= 0:
+        return
+    if spin:
+        deadline = time.perf_counter() + proc_ms / 1000.0
+        while time.perf_counter() < deadline:
+            pass
+    else:
+        time.sleep(proc_ms / 1000.0)
+
+
+def _worker(conn, corpus, arena, slot, slot_size, repeat, proc_ms, spin):
+    out = arena.buf[slot * slot_size:(slot + 1) * slot_size]
+    try:
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+            seq, p, k = msg
+            t0 = time.perf_counter_ns()
+            data = corpus.response(p, k, repeat)
+            _emulate(proc_ms, spin)
+            busy = time.perf_counter_ns() - t0
+            if len(data) <= slot_size:
+                out[:len(data)] = data
+                conn.send((seq, len(data), None, busy))
+            else:                             # too big for the slot: send inline
+                conn.send((seq, len(data), bytes(data), busy))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        out.release()
+
+
+class WorkerPool:
+    def __init__(self, words_path, repeat=1, workers=2, proc_ms=0, spin=False,
+                 slot_size=1 << 16):
+        self.corpus = SharedCorpus(words_path)
+        self.repeat = max(1, int(repeat))
+        self.slot_size = slot_size
+        self.arena = shared_memory.SharedMemory(create=True, size=workers * slot_size)
+        ctx = mp.get_context("fork")
+        self.conns, self.procs = [], []
+        for i in range(workers):
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_worker, daemon=True,
+                               args=(child, self.corpus, self.arena, i, slot_size,
+                                     self.repeat, proc_ms, spin))
+            proc.start()
+            child.close()
+            self.conns.append(parent)
+            self.procs.append(proc)
+        self.slots = [self.arena.buf[i * slot_size:(i + 1) * slot_size] for i in range(workers)]
+        self._closed = False
+
+    def __len__(self):
+        return self.corpus.count * self.repeat
+
+    def run(self, next_request, deliver, idle_s=0.0005):
+        """Serve forever (until close()).
+
+        next_request() -> (ctx, p, k) or None when the queue is empty; it is
+        called in scheduling order. deliver(ctx, data, busy_ns) is called for
+        each response in exactly the order the requests were taken.
+        """
+        free = deque(range(len(self.conns)))
+        in_flight = {}                 # worker -> ctx
+        done = {}                      # seq -> (ctx, data, busy_ns)
+        next_seq = commit = 0
+        while not self._closed:
+            while free:
+                item = next_request()
+                if item is None:
+                    break
+                ctx, p, k = item
+                w = free.popleft()
+                self.conns[w].send((next_seq, p, k))
+                in_flight[w] = ctx
+                next_seq += 1
+            if not in_flight:
+                time.sleep(idle_s)
+                continue
+            # block for a result, but keep polling the queue if a worker is idle
+            ready = wait([self.conns[w] for w in in_flight], idle_s if free else None)
+            for conn in ready:
+                w = self.conns.index(conn)
+                try:
+                    seq, n, inline, busy = conn.recv()
+                except EOFError:
+                    if self._closed:
+                        return
+                    raise RuntimeError(f"worker {w} died")
+                data = inline if inline is not None else bytes(self.slots[w][:n])
+                done[seq] = (in_flight.pop(w), data, busy)
+                free.append(w)
+            while commit in done:
+                deliver(*done.pop(commit))
+                commit += 1
+
+    def close(self):
+        self._closed = True
+        for conn in self.conns:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for proc in self.procs:
+            proc.join(timeout=1.0)
+            if proc.is_alive():
+                proc.terminate()
+        for view in self.slots:
+            view.release()
+        try:
+            self.arena.close()
+        except BufferError:
+            pass
+        self.arena.unlink()
+        self.corpus.close()
+
+    def close_at_exit(self):
+        """Unlink the shared segments on normal exit and on SIGTERM."""
+        atexit.register(self.close)
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+
+# --- benchmark: throughput vs worker count for FCFS and RR dispatch order ---
+def _synthetic_queue(policy, clients, per_client, k, total):
+    """Requests in the order the FCFS or RR front end would take them."""
+    if policy == "rr":
+        order = [(c, i) for i in range(per_client) for c in range(clients)]
+    else:   # fcfs: client 0 is greedy and floods the queue first
+        order = [(0, i) for i in range(per_client)] + \
+                [(c, i) for i in range(per_client) for c in range(1, clients)]
+    return deque(((c, i), (i * k) % total, k) for c, i in order)
+
+
+def bench(words_path, workers_list, proc_ms, spin, k, clients, per_client, repeat):
+    print(f"corpus={words_path} repeat={repeat} k={k} proc_ms={proc_ms} "
+          f"({'spin' if spin else 'sleep'}) cpus={os.cpu_count()}")
+    print(f"{'policy':>6} {'workers':>7} {'req/s':>10} {'speedup':>8}")
+    for policy in ("fcfs", "rr"):
+        base = None
+        for n in workers_list:
+            pool = WorkerPool(words_path, repeat, n, proc_ms, spin)
+            queue = _synthetic_queue(policy, clients, per_client, k, len(pool))
+            expected = list(queue)
+            seen = []
+
+            def next_request():
+                return queue.popleft() if queue else None
+
+            def deliver(ctx, data, busy_ns):
+                seen.append(ctx)
+                if len(seen) == len(expected):
+                    pool._closed = True
+
+            t0 = time.perf_counter()
+            pool.run(next_request, deliver)
+            rate = len(seen) / (time.perf_counter() - t0)
+            assert seen == [c for c, _, _ in expected], "delivery order differs from dispatch order"
+            pool.close()
+            base = base or rate
+            print(f"{policy:>6} {n:>7} {rate:>10.0f} {rate / base:>8.2f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("bench", help="throughput vs number of worker processes")
+    b.add_argument("--words", default="words.txt")
+    b.add_argument("--repeat", type=int, default=10)
+    b.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    b.add_argument("--proc-ms", type=float, default=1.0)
+    b.add_argument("--spin", action="store_true", help="busy-wait proc_ms (CPU-bound service)")
+    b.add_argument("--k", type=int, default=5)
+    b.add_argument("--clients", type=int, default=10)
+    b.add_argument("--per-client", type=int, default=200)
+    args = ap.parse_args()
+    bench(args.words, args.workers, args.proc_ms, args.spin, args.k, args.clients,
+          args.per_client, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
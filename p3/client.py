@@ -1,8 +1,15 @@
+import os
+import sys
 import time
 import json
 import socket
 import argparse
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common import hdr
+from common.readiness import connect_with_retry
+from common.resultchan import emit
+
 def read_line(sock: socket.socket) -> str:
     """Read one line terminated by \\n from socket"""
     buf = bytearray()
@@ -15,42 +22,60 @@ def read_line(sock: socket.socket) -> str:
             break
     return buf.decode()
 
-def normal_client(host, port, k, start_p, cid):
+def normal_client(addr, k, start_p, cid, rtt_hist=None):
     """Normal client: 1 request -> wait -> next"""
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.connect((host, port))
+    s = connect_with_retry(addr)
     p = start_p
+    result = {"requests": 0, "bytes": 0, "error": None}
     start = time.time()
     try:
         while True:
+            t_send = time.perf_counter_ns()
             s.sendall(f"{p},{k}\n".encode())
             resp = read_line(s)
-            if not resp or "EOF" in resp:
+            if rtt_hist is not None:
+                rtt_hist.record((time.perf_counter_ns() - t_send) // 1000)
+            if not resp:
+                result["error"] = "connection closed before EOF"
+                break
+            result["requests"] += 1
+            result["bytes"] += len(resp)
+            if "EOF" in resp:
                 break
             p += k
     finally:
         s.close()
     elapsed_ms = (time.time() - start) * 1000.0
     print(f"[Normal-{cid}] ELAPSED_MS:{elapsed_ms:.2f}", flush=True)
-    return elapsed_ms
+    return dict(result, elapsed_ms=elapsed_ms, finish_mono=time.monotonic())
 
-def greedy_client(host, port, k, start_p, c, cid):
+def greedy_client(addr, k, start_p, c, cid, rtt_hist=None):
     """Greedy client: send c requests back-to-back -> wait for c replies -> repeat"""
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.connect((host, port))
+    s = connect_with_retry(addr)
     offset = start_p
+    result = {"requests": 0, "bytes": 0, "error": None}
     start = time.time()
     try:
         while True:
             # Send c requests without waiting
+            sent_at = []
             for i in range(c):
+                sent_at.append(time.perf_counter_ns())
                 s.sendall(f"{offset + i*k},{k}\n".encode())
 
             # Collect c responses
             saw_eof = False
-            for _ in range(c):
+            for i in range(c):
                 resp = read_line(s)
-                if not resp or "EOF" in resp:
+                if rtt_hist is not None:
+                    rtt_hist.record((time.perf_counter_ns() - sent_at[i]) // 1000)
+                if not resp:
+                    result["error"] = "connection closed before EOF"
+                    saw_eof = True
+                    break
+                result["requests"] += 1
+                result["bytes"] += len(resp)
+                if "EOF" in resp:
                     saw_eof = True
             if saw_eof:
                 break
@@ -59,24 +84,36 @@ def greedy_client(host, port, k, start_p, c, cid):
         s.close()
     elapsed_ms = (time.time() - start) * 1000.0
     print(f"[Greedy-{cid}] ELAPSED_MS:{elapsed_ms:.2f}", flush=True)
-    return elapsed_ms
+    return dict(result, elapsed_ms=elapsed_ms, finish_mono=time.monotonic())
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--greedy", action="store_true", help="Run as greedy client")
     parser.add_argument("--id", type=int, default=0, help="Client ID (for logging)")
+    parser.add_argument("--hist", type=str, default=None,
+                        help="Record per-request RTTs and dump the histogram to this path")
+    parser.add_argument("--transport", choices=["tcp", "unix"], default=None,
+                        help="Connect over TCP or to the server's Unix socket (default: config)")
     args = parser.parse_args()
+    rtt_hist = hdr.Histogram() if args.hist else None
 
     # Load config.json
     with open("config.json", "r") as f:
         cfg = json.load(f)
     host = cfg.get("server_ip", "127.0.0.1")
     port = int(cfg.get("port", 8887))
+    # "unix": connect to the server's unix_socket instead
+    args.transport = args.transport or cfg.get("transport", "tcp")
+    addr = cfg["unix_socket"] if args.transport == "unix" else (host, port)
     k = int(cfg.get("k", 5))
     start_p = int(cfg.get("p", 0))
     c = int(cfg.get("c", 3))
 
     if args.greedy:
-        greedy_client(host, port, k, start_p, c, args.id)
+        result = greedy_client(addr, k, start_p, c, args.id, rtt_hist)
     else:
-        normal_client(host, port, k, start_p, args.id)
+        result = normal_client(addr, k, start_p, args.id, rtt_hist)
+    if rtt_hist is not None:
+        hdr.dump(args.hist, {"rtt": rtt_hist})
+    result["transport"] = args.transport
+    emit(result)
@@ -1,13 +1,14 @@
+import os
+import sys
 import matplotlib.pyplot as plt
-import csv
 
-xs, jfis = [], []
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.results_store import ResultsStore
 
-with open("results_part3/results.csv") as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        xs.append(int(row["c"]))
-        jfis.append(float(row["jfi"]))
+store = ResultsStore("results_part3/results.db")
+rows = store.metric_rows(store.latest_experiment("p3_fcfs"), "jfi")
+xs = [int(row["x"]) for row in rows]
+jfis = [row["value"] for row in rows]
 
 plt.plot(xs, jfis, marker="o")
 plt.xlabel("c (greedy batch size)")
@@ -1,29 +1,39 @@
 import subprocess
 import sys
-import time
 import json
-import threading
+import argparse
 import os
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.readiness import wait_ready, stop
+from common.results_store import ResultsStore
+from common.instrument import summarize, store_samples
+from common.adaptive import AdaptiveRepeats
+from common.profiling import ProfileCapture
+from common.resultchan import collect
+
 RESULTS_DIR = "results_part3"
-CSV_FILE = os.path.join(RESULTS_DIR, "results.csv")
+RESULTS_DB = os.path.join(RESULTS_DIR, "results.db")
+LOGDIR = "logs_part3"
+EXPERIMENT = "p3_fcfs"
+
+def hist_path(cid):
+    return os.path.join(LOGDIR, f"client{cid}.hist.json")
 
-def run_proc(cmd, cid, greedy=False):
-    """Run one client process and capture output"""
+def start_client(cid, greedy=False, instrument=False):
+    """Start one client process; its result comes back on its stdout pipe"""
     args = [sys.executable, "client.py"]
     if greedy:
         args.append("--greedy")
     args.extend(["--id", str(cid)])
-    p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-    out, _ = p.communicate()
-    return out
+    if instrument:
+        args.extend(["--hist", hist_path(cid)])
+    return subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
 
-def parse_elapsed(output: str) -> float:
-    """Extract elapsed time from client output"""
-    for line in output.splitlines():
-        if line.startswith("ELAPSED_MS:"):
-            return float(line.split(":", 1)[1])
-    return float("nan")
+def warn_failed(cid, result):
+    """Report a failed or late client as soon as it is detected"""
+    if result.get("error"):
+        print(f"[WARN] client{cid}: {result['error']}", flush=True)
 
 def jfi(values):
     """Compute Jain’s Fairness Index"""
@@ -32,63 +42,95 @@ def jfi(values):
     n = len(values)
     return (s * s) / (n * s2) if s2 > 0 else 0.0
 
+def latency_metrics(num_clients):
+    """Per-class p50/p99/p999 (ms); server-side keys are ip:port, reported as 'all'."""
+    paths = {i: hist_path(i) for i in range(num_clients)}
+    def client_class(key):
+        if isinstance(key, int):
+            return "greedy" if key == num_clients - 1 else "normal"
+        return "all"
+    metrics = summarize(os.path.join(LOGDIR, "server.hist.json"), paths, client_class)
+    for name in sorted(metrics):
+        print(f"  {name} = {metrics[name]:.2f} ms")
+    return metrics
+
+def record(cfg, c, times, j, new_experiment, latency=None, instrument=False):
+    """Append this run to the store; one experiment spans a whole c sweep."""
+    store = ResultsStore(RESULTS_DB)
+    exp = None if new_experiment else store.latest_experiment(EXPERIMENT)
+    if exp is None:
+        exp = store.new_experiment(EXPERIMENT, {k: v for k, v in cfg.items() if k != "c"})
+    prev = store.query("SELECT COUNT(*) AS n FROM runs WHERE experiment_id = ? AND x = ?", (exp, c))
+    run_id = store.add_run(exp, "c", c, prev[0]["n"] + 1)
+    for i, t in enumerate(times):
+        cls = "greedy" if i == len(times) - 1 else "normal"
+        store.add_client(run_id, f"client{i}", cls, elapsed_ms=t)
+    store.add_metric(run_id, "jfi", j)
+    for name, value in (latency or {}).items():
+        store.add_metric(run_id, name, value)
+    if instrument:
+        # every request's RTT and queue wait, for perfmodel.py
+        store_samples(store, run_id, os.path.join(LOGDIR, "server.hist.json"),
+                      {f"client{i}": hist_path(i) for i in range(len(times))})
+    store.close()
+
+def run_once(num_clients, instrument, cfg=None, c=None, attempt=1):
+    """Start the server, run all clients concurrently, return their elapsed ms."""
+    srv = subprocess.Popen([sys.executable, "server_part3_fcfs.py"],
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    wait_ready(srv)
+    # cfg "profile_at": profile the first run at this c
+    profile = ProfileCapture.for_run(cfg or {}, srv, c, attempt)
+
+    # Run clients (the last one greedy), collecting results as they finish
+    procs = {i: start_client(i, greedy=(i == num_clients - 1), instrument=instrument)
+             for i in range(num_clients)}
+    timeout = (cfg or {}).get("client_timeout_s")
+    results = collect(procs, timeout=timeout, on_result=warn_failed)
+    if profile:
+        profile.finish()
+
+    # Kill server
+    stop(srv)
+
+    # Failed clients count as NaN
+    return [float("nan") if results[i].get("error") else results[i]["elapsed_ms"]
+            for i in range(num_clients)]
+
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--new-experiment", action="store_true",
+                    help="Start a new sweep in the results store instead of appending to the latest")
+    args = ap.parse_args()
+
     # Load config
     with open("config.json", "r") as f:
         cfg = json.load(f)
     num_clients = int(cfg.get("num_clients", 10))
     c = int(cfg.get("c", 10))
-
-    # Start server
-    srv = subprocess.Popen([sys.executable, "server.py"],
-                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-    time.sleep(0.5)
-
-    # Run clients
-    outs = [None] * num_clients
-
-    def run_normal(i):
-        outs[i] = run_proc("client.py", cid=i, greedy=False)
-
-    def run_greedy(i):
-        outs[i] = run_proc("client.py", cid=i, greedy=True)
-
-    threads = []
-    for i in range(num_clients - 1):
-        t = threading.Thread(target=run_normal, args=(i,))
-        t.start()
-        threads.append(t)
-    t = threading.Thread(target=run_greedy, args=(num_clients - 1,))
-    t.start()
-    threads.append(t)
-
-    for t in threads:
-        t.join()
-
-    # Kill server
-    try:
-        srv.terminate()
-    except Exception:
-        pass
-
-    # Parse times
-    times = [parse_elapsed(o or "") for o in outs]
-    j = jfi(times)
-
-    # Ensure results dir exists
-    os.makedirs(RESULTS_DIR, exist_ok=True)
-
-    # Write CSV row
-    new_file = not os.path.exists(CSV_FILE)
-    with open(CSV_FILE, "a") as f:
-        if new_file:
-            header = ["c"] + [f"client{i}" for i in range(num_clients)] + ["jfi"]
-            f.write(",".join(header) + "\n")
-        row = [str(c)] + [f"{t:.2f}" for t in times] + [f"{j:.4f}"]
-        f.write(",".join(row) + "\n")
-
-    # Print progress to terminal
-    for i, t in enumerate(times):
-        tag = "Greedy" if i == num_clients - 1 else f"Normal-{i}"
-        print(f"[{tag}] finished in {t:.2f} ms")
-    print(f"JFI(c={c}): {j:.4f}")
+    instrument = bool(int(cfg.get("instrument", 0)))
+    os.makedirs(LOGDIR, exist_ok=True)
+
+    # Fixed single run unless config sets ci_target_abs / ci_target_rel
+    repeats = AdaptiveRepeats.from_config(cfg, 1)
+    jfis = []
+    attempts = 0
+    while not repeats.done(jfis, attempts=attempts):
+        attempts += 1
+        times = run_once(num_clients, instrument, cfg, c, attempts)
+        j = jfi(times)
+
+        # Ensure results dir exists
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        latency = latency_metrics(num_clients) if instrument else {}
+        record(cfg, c, times, j, args.new_experiment and attempts == 1, latency, instrument)
+        if all(t == t for t in times):   # no NaN: every client reported
+            jfis.append(j)
+
+        # Print progress to terminal
+        for i, t in enumerate(times):
+            tag = "Greedy" if i == num_clients - 1 else f"Normal-{i}"
+            print(f"[{tag}] finished in {t:.2f} ms")
+        print(f"JFI(c={c}): {j:.4f}")
+    if repeats.adaptive:
+        print(f"JFI(c={c}) {repeats.describe(jfis)}")
@@ -1,29 +1,65 @@
+import os
+import sys
 import json
+import time
 import socket
 import selectors
 import threading
-import queue
-from typing import Dict, Tuple
+from typing import Dict
 
-REQ_QUEUE: "queue.Queue[Tuple[socket.socket, int, int]]" = queue.Queue()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.instrument import RequestTimer
+from common.stats import ServerStats, serve_stats
+from common.profiling import install_profiling
+from common.servicetrace import install_trace
+from common.wordindex import WordIndex
+from common.coalesce import sendmsg_all
+from common.scheduling import RequestQueue, split_tags
+from common.unixsock import listen_config, peer_key
 
 class FCFSWordServer:
     def __init__(self, cfg_path: str = "config.json", words_path: str = "words.txt"):
         with open(cfg_path, "r") as f:
             cfg = json.load(f)
+        self.cfg = cfg
         self.host = cfg.get("server_ip", "0.0.0.0")
         self.port = int(cfg.get("port", 8887))
+        # Optional per-request queue-wait / service histograms
+        self.timer = RequestTimer(cfg.get("hist_path", "logs_part3/server.hist.json")) \
+            if int(cfg.get("instrument", 0)) else None
         self.selector = selectors.DefaultSelector()
         self.listen_sock: socket.socket | None = None
-        # Load words file once
-        with open(words_path, "r") as wf:
-            raw = wf.read().strip()
-        self.words = [w.strip() for w in raw.split(",") if w.strip()]
-        # Per-connection read buffers
+        self.unix_sock: socket.socket | None = None    # cfg "unix_socket"
+        # Load words file once, or open its sparse on-disk index
+        if int(cfg.get("word_index", 0)):
+            # nonempty: the same words as the list below, stripped and without empty ones
+            self.words = WordIndex(words_path, stride=int(cfg.get("word_index_stride", 64)),
+                                   nonempty=True)
+        else:
+            with open(words_path, "r") as wf:
+                raw = wf.read().strip()
+            self.words = [w.strip() for w in raw.split(",") if w.strip()]
+        # Per-connection read buffers and peer "ip:port" keys
         self.buffers: Dict[int, bytearray] = {}
+        self.peers: Dict[int, str] = {}
+        # >0: serve consecutive queued requests of one socket together, one gathered write
+        self.coalesce_us = int(cfg.get("coalesce_us", 0))
+        # conn -> (p, k, enqueue perf_counter_ns or 0 when not instrumenting),
+        # served in the order of cfg "scheduler" (fcfs by default)
+        self.requests = RequestQueue.from_config(cfg, len(self.words))
+        # Live counters, queried via stats_port / stats_socket
+        self.stats = ServerStats(self._queue_depth)
+        self.stats.commands["classes"] = lambda args: self.requests.class_stats()
         # Worker thread
         self.worker = threading.Thread(target=self._worker_loop, daemon=True)
 
+    def _queue_depth(self):
+        per_client = {}
+        for conn, n in self.requests.depth().items():
+            peer = self.peers.get(id(conn), "?")
+            per_client[peer] = per_client.get(peer, 0) + n
+        return {"total": sum(per_client.values()), "per_client": per_client}
+
     # --- protocol helpers ---
     def _handle_request(self, p: int, k: int) -> str:
         n = len(self.words)
@@ -45,6 +81,9 @@ class FCFSWordServer:
         conn.setblocking(False)
         self.selector.register(conn, selectors.EVENT_READ, self._read_client)
         self.buffers[id(conn)] = bytearray()
+        self.peers[id(conn)] = f"{addr[0]}:{addr[1]}" if conn.family == socket.AF_INET \
+            else peer_key(conn, addr)
+        self.stats.on_accept()
 
     def _read_client(self, conn: socket.socket):
         try:
@@ -62,6 +101,8 @@ class FCFSWordServer:
             except Exception:
                 pass
             self.buffers.pop(id(conn), None)
+            self.peers.pop(id(conn), None)
+            self.stats.on_close()
             return
         buf = self.buffers[id(conn)]
         buf.extend(data)
@@ -72,10 +113,10 @@ class FCFSWordServer:
                 break
             line = buf[:nl].decode(errors="ignore")
             del buf[:nl+1]
-            line = line.strip()
+            line, prio, deadline_ms = split_tags(line)
             if not line:
                 continue
-            # Expect "p,k"
+            # Expect "p,k" (optionally tagged ";prio=..;deadline_ms=..")
             try:
                 p_str, k_str = line.split(",", 1)
                 p = int(p_str.strip())
@@ -83,21 +124,55 @@ class FCFSWordServer:
             except Exception:
                 # Malformed line; ignore
                 continue
-            # Enqueue request (FCFS across ALL clients)
-            REQ_QUEUE.put((conn, p, k))
+            # Enqueue request (across ALL clients, in scheduling order)
+            self.requests.put(conn, (p, k, time.perf_counter_ns() if self.timer else 0), p, k,
+                              prio, deadline_ms)
 
     def _worker_loop(self):
         while True:
-            conn, p, k = REQ_QUEUE.get()
+            conn, (p, k, t_enq) = self.requests.get()
             try:
+                t_deq = time.perf_counter_ns()
                 resp = self._handle_request(p, k).encode()
+                if self.coalesce_us:
+                    self._serve_coalesced(conn, resp, t_enq, t_deq)
+                    continue
                 # sendall from single worker guarantees ordered writes per response
                 conn.sendall(resp)
+                t_done = time.perf_counter_ns()
+                peer = self.peers.get(id(conn), "?")
+                self.stats.on_served(peer, len(resp), t_done - t_deq, payload=resp)
+                if self.timer:
+                    self.timer.record(peer, t_enq, t_deq, t_done)
             except Exception:
                 # socket might be gone; ignore
                 pass
 
+    def _serve_coalesced(self, conn, resp, t_enq, t_deq):
+        """Serve the following head requests of the same socket too, then send
+        all responses with one gathered write; the scheduling order is unchanged."""
+        batch = [resp]
+        times = [(t_enq, t_deq)]
+        deadline = time.perf_counter_ns() + self.coalesce_us * 1000
+        while time.perf_counter_ns() < deadline:
+            item = self.requests.get_if(conn)
+            if item is None:
+                break
+            p, k, t_enq = item
+            times.append((t_enq, time.perf_counter_ns()))
+            batch.append(self._handle_request(p, k).encode())
+        calls = sendmsg_all(conn, batch)
+        t_done = time.perf_counter_ns()
+        peer = self.peers.get(id(conn), "?")
+        self.stats.on_served(peer, sum(map(len, batch)), t_done - t_deq,
+                             requests=len(batch), send_calls=calls, payload=batch)
+        if self.timer:
+            for t_enq, t_deq in times:
+                self.timer.record(peer, t_enq, t_deq, t_done)
+
     def serve_forever(self):
+        if self.timer:
+            self.timer.dump_at_exit()
         # Listen socket
         self.listen_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -105,24 +180,29 @@ class FCFSWordServer:
         self.listen_sock.listen()
         self.listen_sock.setblocking(False)
         self.selector.register(self.listen_sock, selectors.EVENT_READ, self._accept)
+        self.unix_sock = listen_config(self.cfg)
+        if self.unix_sock:
+            self.unix_sock.setblocking(False)
+            self.selector.register(self.unix_sock, selectors.EVENT_READ, self._accept)
         # Start worker
         self.worker.start()
-        print(f"[FCFS] Listening on {self.host}:{self.port} with {len(self.words)} words loaded")
+        serve_stats(self.stats, self.cfg)
+        install_profiling(self.stats, self.cfg)
+        install_trace(self.stats, self.cfg)
+        print(f"[{self.requests.policy.upper()}] Listening on {self.host}:{self.port} with {len(self.words)} words loaded")
+        print("READY", flush=True)
         try:
             while True:
                 for key, _ in self.selector.select(timeout=1.0):
-                    cb = key.data
-                    if key.fileobj is self.listen_sock:
-                        cb(self.listen_sock)
-                    else:
-                        cb(key.fileobj)
+                    key.data(key.fileobj)
         finally:
             try:
                 self.selector.close()
             except Exception:
                 pass
-            if self.listen_sock:
-                self.listen_sock.close()
+            for ls in (self.listen_sock, self.unix_sock):
+                if ls:
+                    ls.close()
 
 if __name__ == "__main__":
     FCFSWordServer().serve_forever()
@@ -5,11 +5,12 @@
 #include <fstream>
 #include <iostream>
 #include <map>
-#include <sstream>
 #include <string>
+#include <unordered_map>
 #include <vector>
 #include <algorithm>
 #include <chrono>
+#include <thread>
 
 using namespace std;
 
@@ -38,6 +39,47 @@ map<string, string> load_config(const string &filename) {
     return config;
 }
 
+// Connect, retrying with short backoff until the server is listening.
+int connect_with_retry(const sockaddr_in &addr, int timeout_ms) {
+    using namespace std::chrono;
+    auto deadline = steady_clock::now() + milliseconds(timeout_ms);
+    int delay_ms = 5;
+    while (true) {
+        int fd = socket(AF_INET, SOCK_STREAM, 0);
+        if (connect(fd, (const sockaddr*)&addr, sizeof(addr)) == 0) return fd;
+        close(fd);
+        if (steady_clock::now() >= deadline) return -1;
+        this_thread::sleep_for(milliseconds(delay_ms));
+        delay_ms = min(delay_ms * 2, 100);
+    }
+}
+
+// Peak resident set size (kB) from VmHWM; ru_maxrss would carry over the
+// peak of the process that exec'd us
+long peak_rss_kb() {
+    ifstream status("/proc/self/status");
+    string line;
+    while (getline(status, line)) {
+        if (line.compare(0, 6, "VmHWM:") == 0) return stol(line.substr(6));
+    }
+    return -1;
+}
+
+// Structured result line for the runner (see common/resultchan.py)
+void print_result(double elapsed_ms, long requests, long words, long bytes,
+                  size_t vocab, const string &error) {
+    double finish_mono = std::chrono::duration<double>(
+        std::chrono::steady_clock::now().time_since_epoch()).count();
+    cout << fixed << "RESULT {\"elapsed_ms\": " << elapsed_ms
+         << ", \"finish_mono\": " << finish_mono
+         << ", \"requests\": " << requests << ", \"words\": " << words
+         << ", \"bytes\": " << bytes << ", \"vocab\": " << vocab
+         << ", \"peak_rss_kb\": " << peak_rss_kb() << ", \"error\": ";
+    if (error.empty()) cout << "null";
+    else cout << "\"" << error << "\"";
+    cout << "}" << endl;
+}
+
 int main() {
     using namespace std::chrono;
     auto start = high_resolution_clock::now();
@@ -49,44 +91,72 @@ int main() {
     int k = stoi(config["k"]);
     int p = stoi(config["p"]);
 
-    int sockfd = socket(AF_INET, SOCK_STREAM, 0);
     sockaddr_in serv_addr{};
     serv_addr.sin_family = AF_INET;
     serv_addr.sin_addr.s_addr = inet_addr(server_ip.c_str());
     serv_addr.sin_port = htons(server_port);
 
-    connect(sockfd, (sockaddr*)&serv_addr, sizeof(serv_addr));
+    int sockfd = connect_with_retry(serv_addr, 5000);
+    if (sockfd < 0) {
+        cerr << "connect failed" << endl;
+        print_result(0, 0, 0, 0, 0, "connect failed");
+        return 1;
+    }
 
-    map<string, int> freq;
-    while (true) {
+    // Count words as they arrive: only complete words (ended by ',' or '\n')
+    // are counted, the tail of a read waits in `partial` for the next one
+    unordered_map<string, int> freq;
+    string partial;
+    bool eof = false, closed = false;
+    long requests = 0, words = 0, bytes = 0;
+    char buffer[4096];
+    while (!eof) {
         string request = to_string(p) + "," + to_string(k) + "\n";
         send(sockfd, request.c_str(), request.size(), 0);
 
-        char buffer[1024];
-        int n = read(sockfd, buffer, sizeof(buffer) - 1);
-        if (n <= 0) break;
-        buffer[n] = '\0';
-
-        string resp(buffer);
-        stringstream ss(resp);
-        string word;
-        while (getline(ss, word, ',')) {
-            if (word == "EOF\n" || word == "EOF") {
-                goto DONE;
+        bool line_done = false;
+        while (!line_done) {
+            int n = read(sockfd, buffer, sizeof(buffer));
+            if (n <= 0) {
+                eof = closed = true;
+                break;
+            }
+            bytes += n;
+            for (int i = 0; i < n; i++) {
+                char ch = buffer[i];
+                if (ch != ',' && ch != '\n') {
+                    partial += ch;
+                    continue;
+                }
+                if (partial == "EOF") {
+                    eof = true;
+                } else if (!partial.empty() && !eof) {
+                    freq[partial]++;
+                    words++;
+                }
+                partial.clear();
+                if (ch == '\n') {
+                    line_done = true;
+                    requests++;
+                }
             }
-            freq[word]++;
         }
         p += k;
     }
 
-DONE:
     close(sockfd);
     auto end = high_resolution_clock::now();
     auto elapsed = duration_cast<milliseconds>(end - start).count();
 
-    for (auto &it : freq) {
-        cout << it.first << ", " << it.second << endl;
+    // Print in word order, as before
+    vector<pair<string, int>> sorted_freq(freq.begin(), freq.end());
+    sort(sorted_freq.begin(), sorted_freq.end());
+    for (auto &it : sorted_freq) {
+        cout << it.first << ", " << it.second << "\n";
     }
     cout << "ELAPSED_MS:" << elapsed << endl;
-    return 0;
+    cout << "PEAK_RSS_KB:" << peak_rss_kb() << endl;
+    print_result(duration<double, std::milli>(end - start).count(), requests, words, bytes,
+                 freq.size(), closed ? "connection closed before EOF" : "");
+    return closed ? 1 : 0;
 }
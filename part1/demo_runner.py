@@ -1,6 +1,9 @@
 # demo_runner.py
-import json, os, time, pathlib
+import json, os, sys, pathlib
+from subprocess import PIPE, STDOUT
 from topo_wordcount import make_net
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.readiness import wait_ready, stop
 
 K = int(os.environ.get("K", "5"))
 P = int(os.environ.get("P", "0"))
@@ -14,10 +17,10 @@ net = make_net(); net.start()
 h1, h2 = net.get('h1'), net.get('h2')
 
 # start server with demo config
-srv = h2.popen("./server --config demo_config.json", shell=True)
-time.sleep(0.5)
+srv = h2.popen("./server --config demo_config.json", shell=True, stdout=PIPE, stderr=STDOUT)
+wait_ready(srv)
 
 # run client once (no --quiet): prints word frequencies + ELAPSED_MS
 print(h1.cmd(f"./client --config demo_config.json --k {K}"))
 
-srv.terminate(); time.sleep(0.2); net.stop()
+stop(srv); net.stop()
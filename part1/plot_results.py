@@ -1,21 +1,27 @@
 #!/usr/bin/env python3
+import os
+import sys
 import pandas as pd
 import matplotlib.pyplot as plt
-from pathlib import Path
-import math
 
-df = pd.read_csv("results.csv")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.results_store import ResultsStore
+from common.adaptive import t975
+
+store = ResultsStore("results.db")
+df = pd.DataFrame(store.client_rows(store.latest_experiment("part1_k_sweep")))
+df = df.rename(columns={"x": "k"})
 # Aggregate
 agg = df.groupby("k")["elapsed_ms"].agg(["mean", "std", "count"]).reset_index()
-# 95% CI using normal approx (n=5 is small, but acceptable for this assignment)
+# 95% CI using Student t (run counts differ per k with adaptive repetitions)
 agg["sem"] = agg["std"] / agg["count"].pow(0.5)
-agg["ci95"] = 1.96 * agg["sem"]
+agg["ci95"] = agg["count"].map(lambda n: t975(n - 1)) * agg["sem"]
 
 plt.figure()
 plt.errorbar(agg["k"], agg["mean"], yerr=agg["ci95"], fmt='o-', capsize=4)
 plt.xlabel("k (words per request)")
 plt.ylabel("Completion time (ms)")
-plt.title("Word Download Completion Time vs k (avg ± 95% CI, n=5)")
+plt.title("Word Download Completion Time vs k (avg ± 95% CI)")
 plt.grid(True)
 plt.savefig("plot.png", bbox_inches="tight", dpi=180)
 print("Saved plot.png")
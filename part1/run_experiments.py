@@ -1,11 +1,16 @@
 # STARTER CODE ONLY. EDIT AS DESIRED
 #!/usr/bin/env python3
-import re
-import time
-import csv
+import os
+import sys
 import json
 from pathlib import Path
+from subprocess import PIPE, STDOUT
 from topo_wordcount import make_net
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.readiness import wait_ready, stop
+from common.results_store import ResultsStore
+from common.adaptive import AdaptiveRepeats
+from common.resultchan import parse as parse_result
 
 # Config
 K_VALUES = []
@@ -21,11 +26,12 @@ while val <= 100:
     else:
         val += 20    # step of 10
 
-RUNS_PER_K = 5
+RUNS_PER_K = 5   # fixed count unless config.json sets ci_target_abs / ci_target_rel
 SERVER_CMD = "./server --config config.json"
 CLIENT_CMD_TMPL = "./client --config config.json --quiet"
 
-RESULTS_CSV = Path("results.csv")
+RESULTS_DB = Path("results.db")
+EXPERIMENT = "part1_k_sweep"
 
 
 def modify_config(key, value, filename="config.json"):
@@ -42,11 +48,11 @@ def modify_config(key, value, filename="config.json"):
         json.dump(config, f, indent=2)
 
 def main():
-    # Prepare CSV
-    if not RESULTS_CSV.exists():
-        with RESULTS_CSV.open("w", newline="") as f:
-            w = csv.writer(f)
-            w.writerow(["k", "run", "elapsed_ms"])
+    store = ResultsStore(RESULTS_DB)
+    with open("config.json") as f:
+        config = json.load(f)
+    exp = store.new_experiment(EXPERIMENT, config)
+    repeats = AdaptiveRepeats.from_config(config, RUNS_PER_K)
 
     net = make_net()
     net.start()
@@ -59,27 +65,35 @@ def main():
         Path("words.txt").write_text("cat,bat,cat,dog,dog,emu,emu,emu,ant\n")
 
     # Start server
-    srv = h2.popen(SERVER_CMD, shell=True, stdout=None, stderr=None)
-    time.sleep(0.5)  # give it a moment to bind
+    srv = h2.popen(SERVER_CMD, shell=True, stdout=PIPE, stderr=STDOUT)
+    wait_ready(srv)  # bound and words loaded
 
     try:
         for k in K_VALUES:
-            for r in range(1, RUNS_PER_K + 1):
+            samples = []
+            r = 0
+            while not repeats.done(samples, attempts=r):
+                r += 1
                 modify_config("k", k) # should implement this function
                 cmd = CLIENT_CMD_TMPL
                 out = h1.cmd(cmd)
-                # parse ELAPSED_MS
-                m = re.search(r"ELAPSED_MS:(\d+)", out)
-                if not m:
-                    print(f"[warn] No ELAPSED_MS found for k={k} run={r}. Raw:\n{out}")
+                # the client's structured RESULT line
+                result = parse_result(out)
+                if result is None or result.get("error"):
+                    error = result["error"] if result else "no RESULT line"
+                    print(f"[warn] k={k} run={r}: {error}. Raw:\n{out[-500:]}")
                     continue
-                ms = int(m.group(1))
-                with RESULTS_CSV.open("a", newline="") as f:
-                    csv.writer(f).writerow([k, r, ms])
-                print(f"k={k} run={r} elapsed_ms={ms}")
+                ms = result["elapsed_ms"]
+                run_id = store.add_run(exp, "k", k, r)
+                store.add_client(run_id, "h1", "normal", elapsed_ms=ms)
+                store.add_metric(run_id, "words", result["words"])
+                store.add_metric(run_id, "bytes", result["bytes"])
+                samples.append(ms)
+                print(f"k={k} run={r} elapsed_ms={ms:.1f}")
+            print(f"k={k}: {repeats.describe(samples)}")
     finally:
-        srv.terminate()
-        time.sleep(0.2)
+        stop(srv)
+        store.close()
         net.stop()
 
 if __name__ == "__main__":
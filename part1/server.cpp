@@ -92,6 +92,7 @@ int main() {
     listen(sockfd, 5);
 
     cout << "Server listening on " << server_ip << ":" << server_port << endl;
+    cout << "READY" << endl;
 
     while (true) {
         int client_fd = accept(sockfd, nullptr, nullptr);
@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
-import socket
+import os
 import sys
 import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.readiness import connect_with_retry
+from common.resultchan import emit
+from common.servicetrace import count_words
 
 # --- Simple config parser (same as server.py) ---
 def load_config(filename="config.json"):
@@ -24,20 +30,30 @@ SERVER_IP = config["server_ip"]
 SERVER_PORT = int(config["server_port"])
 P = int(config["p"])
 K = int(config["k"])
+# "unix": connect to the server's unix_socket instead of SERVER_IP:SERVER_PORT
+TRANSPORT = config.get("transport", "tcp")
 
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--transport", choices=["tcp", "unix"], default=TRANSPORT,
+                    help="Connect over TCP or to the server's Unix socket")
+    args = ap.parse_args()
+    addr = config["unix_socket"] if args.transport == "unix" else (SERVER_IP, SERVER_PORT)
+
     start = time.time()
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((SERVER_IP, SERVER_PORT))
+    with connect_with_retry(addr) as s:
         req = f"{P},{K}\n"
         s.sendall(req.encode())
-        data = s.recv(4096).decode().strip()
+        data = s.recv(4096)
     end = time.time()
 
     elapsed_ms = int((end - start) * 1000)
 
     # Only print elapsed time (cleaner for experiments)
     print(f"ELAPSED_MS:{elapsed_ms}")
+    emit({"elapsed_ms": (end - start) * 1000, "finish_mono": time.monotonic(),
+          "requests": 1, "words": count_words(data), "bytes": len(data),
+          "transport": args.transport, "error": None if data else "empty response"})
 
 if __name__ == "__main__":
     main()
@@ -1,18 +1,28 @@
 #!/usr/bin/env python3
+import os
+import sys
 import pandas as pd
 import matplotlib.pyplot as plt
 
-df = pd.read_csv("results_p2.csv")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.results_store import ResultsStore
+from common.adaptive import t975
+
+store = ResultsStore("results.db")
+clients = pd.DataFrame(store.client_rows(store.latest_experiment("part2_clients_sweep")))
+clients = clients.rename(columns={"x": "num_clients"})
+# average over the clients of each run, then CI across runs
+df = clients.groupby(["num_clients", "run"])["elapsed_ms"].mean().reset_index()
 
 agg = df.groupby("num_clients")["elapsed_ms"].agg(["mean", "std", "count"]).reset_index()
 agg["sem"] = agg["std"] / agg["count"].pow(0.5)
-agg["ci95"] = 1.96 * agg["sem"]
+agg["ci95"] = agg["count"].map(lambda n: t975(n - 1)) * agg["sem"]
 
 plt.figure()
 plt.errorbar(agg["num_clients"], agg["mean"], yerr=agg["ci95"], fmt='o-', capsize=4)
 plt.xlabel("Number of concurrent clients")
 plt.ylabel("Average completion time per client (ms)")
-plt.title("Concurrent Clients vs Completion Time (avg ± 95% CI, n=5)")
+plt.title("Concurrent Clients vs Completion Time (avg ± 95% CI)")
 plt.grid(True)
 plt.savefig("p2_plot.png", bbox_inches="tight", dpi=180)
 print("Saved p2_plot.png")
@@ -1,53 +1,32 @@
 #!/usr/bin/env python3
-import re
-import time
-import csv
+import os
+import sys
 from pathlib import Path
-from subprocess import PIPE, TimeoutExpired
+from subprocess import PIPE, STDOUT
 from world_topocount import make_net   # your topology file
-from config_utils import modify_config # helper without json
+from config_utils import load_config, modify_config # helper without json
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.readiness import wait_ready, stop
+from common.results_store import ResultsStore
+from common.adaptive import AdaptiveRepeats
+from common.profiling import ProfileCapture
+from common.resultchan import collect, warn_failed
 
 # Config
 NUM_CLIENTS_LIST = list(range(1, 33, 4))  # 1,5,9,..., 32
-RUNS_PER_SETTING = 5
+RUNS_PER_SETTING = 5  # fixed count unless config.json sets ci_target_abs / ci_target_rel
 SERVER_CMD = "python3 server.py"
 CLIENT_CMD = "python3 client.py"
-RESULTS_CSV = Path("results_p2.csv")
+RESULTS_DB = Path("results.db")
+EXPERIMENT = "part2_clients_sweep"
 
-COMM_TIMEOUT = 10  # seconds to wait for a client process to finish & produce output
-
-def safe_get_output(proc):
-    """
-    Call communicate() on proc, handle TimeoutExpired, bytes -> str conversion,
-    and return stdout (string) or empty string.
-    """
-    try:
-        out, err = proc.communicate(timeout=COMM_TIMEOUT)
-    except TimeoutExpired:
-        try:
-            proc.kill()
-        except Exception:
-            pass
-        try:
-            out, err = proc.communicate(timeout=1)
-        except Exception:
-            out = None
-    # Normalize
-    if out is None:
-        out = ""
-    elif isinstance(out, bytes):
-        try:
-            out = out.decode('utf-8', errors='replace')
-        except Exception:
-            out = str(out)
-    return out
+CLIENT_TIMEOUT = 10  # seconds a client may run before it is killed and reported late
 
 def main():
-    # Prepare CSV header
-    if not RESULTS_CSV.exists():
-        with RESULTS_CSV.open("w", newline="") as f:
-            w = csv.writer(f)
-            w.writerow(["num_clients", "run", "elapsed_ms"])
+    store = ResultsStore(RESULTS_DB)
+    config = load_config()
+    exp = store.new_experiment(EXPERIMENT, config)
+    repeats = AdaptiveRepeats.from_config(config, RUNS_PER_SETTING)
 
     net = None
     try:
@@ -62,45 +41,48 @@ def main():
             net.start()
             hS = net.get("hS")
 
-            for r in range(1, RUNS_PER_SETTING + 1):
+            run_means = []
+            r = 0
+            while not repeats.done(run_means, attempts=r):
+                r += 1
                 # Start server in hS
-                srv = hS.popen(SERVER_CMD, shell=True)
-                time.sleep(0.5)  # wait for bind
+                srv = hS.popen(SERVER_CMD, shell=True, stdout=PIPE, stderr=STDOUT)
+                wait_ready(srv)  # bound and words loaded
+                # config "profile_at": profile the first run with this many clients
+                profile = ProfileCapture.for_run(config, srv, nclients, r)
 
-                # Start all clients in parallel, capture stdout/stderr via PIPE
-                procs = []
+                # Start all clients in parallel, each reporting on its stdout pipe
+                procs = {}
                 for i in range(1, nclients + 1):
                     h = net.get(f"h{i}")
-                    # Request a subprocess with pipes so communicate() returns output
-                    proc = h.popen(CLIENT_CMD, shell=True, stdout=PIPE, stderr=PIPE, text=True)
-                    procs.append((h, proc))
+                    procs[h.name] = h.popen(CLIENT_CMD, shell=True, stdout=PIPE, stderr=STDOUT)
 
-                # Collect results from all clients
-                elapsed_list = []
-                for h, proc in procs:
-                    out = safe_get_output(proc)
-                    # debug: print(client output)  # enable if you want to see outputs
-                    m = re.search(r"ELAPSED_MS:(\d+)", out)
-                    if m:
-                        elapsed_list.append(int(m.group(1)))
+                # Collect results from all clients as they finish; failed and
+                # late clients are reported when detected
+                results = collect(procs, timeout=CLIENT_TIMEOUT, on_result=warn_failed)
+                elapsed_list = [(name, res["elapsed_ms"]) for name, res in results.items()
+                                if not res.get("error")]
+                if profile:
+                    profile.finish()
 
                 # Stop server for this run
-                try:
-                    srv.terminate()
-                except Exception:
-                    pass
-                time.sleep(0.2)
+                stop(srv)
 
                 if not elapsed_list:
                     print(f"[warn] No results for num_clients={nclients} run={r}")
                     continue
 
-                avg_ms = sum(elapsed_list) / len(elapsed_list)
-                with RESULTS_CSV.open("a", newline="") as f:
-                    csv.writer(f).writerow([nclients, r, avg_ms])
+                # keep every client's time, not just the average
+                run_id = store.add_run(exp, "num_clients", nclients, r)
+                for name, ms in elapsed_list:
+                    store.add_client(run_id, name, "normal", elapsed_ms=ms)
+                avg_ms = sum(ms for _, ms in elapsed_list) / len(elapsed_list)
+                run_means.append(avg_ms)
                 print(f"num_clients={nclients} run={r} avg_elapsed_ms={avg_ms:.2f}")
+            print(f"num_clients={nclients}: {repeats.describe(run_means)}")
 
     finally:
+        store.close()
         if net:
             net.stop()
 
@@ -1,6 +1,17 @@
 #!/usr/bin/env python3
+import os
+import sys
+import time
+import select
 import socket
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.stats import ServerStats, serve_stats
+from common.profiling import install_profiling
+from common.servicetrace import install_trace
+from common.wordindex import load_words
+from common.unixsock import listen_config, peer_key
+
 # --- Simple config parser ---
 def load_config(filename="config.json"):
     config = {}
@@ -22,33 +33,42 @@ SERVER_IP = config["server_ip"]
 SERVER_PORT = int(config["server_port"])
 FILENAME = config["filename"]
 
-# Load words file once
-with open(FILENAME) as f:
-    words = f.read().strip().split(",")
+# Load words file once (or open its sparse index if "word_index" is set)
+words = load_words(FILENAME, 1, config)
+
+stats = ServerStats()  # live counters, queried via stats_port / stats_socket
 
-def handle_client(conn):
+def build_response(data):
+    """Response line for a request "p,k" (EOF for anything unparsable)"""
     try:
-        data = conn.recv(1024).decode().strip()
-        if not data:
-            return
-        try:
-            p, k = map(int, data.split(","))
-        except:
-            conn.sendall(b"EOF\n")
-            return
+        p, k = map(int, data.split(","))
+    except:
+        return "EOF\n"
 
-        if p >= len(words):
-            conn.sendall(b"EOF\n")
-            return
+    if p >= len(words):
+        return "EOF\n"
+
+    slice_words = words[p:p+k]
+    if p + k >= len(words):
+        slice_words.append("EOF")
 
-        slice_words = words[p:p+k]
-        if p + k >= len(words):
-            slice_words.append("EOF")
+    return ",".join(slice_words) + "\n"
 
-        response = ",".join(slice_words) + "\n"
-        conn.sendall(response.encode())
+def handle_client(conn, client):
+    t0 = time.perf_counter_ns()
+    nbytes = 0
+    payload = None
+    try:
+        data = conn.recv(1024).decode().strip()
+        if not data:
+            return
+        payload = build_response(data).encode()
+        nbytes = len(payload)
+        conn.sendall(payload)
     finally:
         conn.close()
+        stats.on_close()
+        stats.on_served(client, nbytes, time.perf_counter_ns() - t0, payload=payload)
 
 def main():
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
@@ -57,10 +77,21 @@ def main():
         s.listen()
 
         print(f"Server listening on {SERVER_IP}:{SERVER_PORT}")
+        listeners = [s]
+        us = listen_config(config)         # "unix_socket": also accept there
+        if us:
+            listeners.append(us)
+        serve_stats(stats, config)
+        install_profiling(stats, config)
+        install_trace(stats, config)
+        print("READY", flush=True)
 
         while True:
-            conn, addr = s.accept()
-            handle_client(conn)   # sequential, no threading
+            ready = listeners if len(listeners) == 1 else select.select(listeners, [], [])[0]
+            for ls in ready:
+                conn, addr = ls.accept()
+                stats.on_accept()
+                handle_client(conn, peer_key(conn, addr))   # sequential, no threading
 
 if __name__ == "__main__":
     main()
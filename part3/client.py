@@ -1,7 +1,15 @@
 #!/usr/bin/env python3
-import socket
+import os
+import sys
 import time
 import argparse
+import collections
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common import hdr
+from common.readiness import connect_with_retry
+from common.resultchan import emit
+from common.wordcount import WordCounter, peak_rss_kb
 
 # --- Simple config parser (no json lib) ---
 def load_config(filename="config.json"):
@@ -20,23 +28,30 @@ SERVER_IP = cfg.get("server_ip", "10.0.0.100")
 SERVER_PORT = int(cfg.get("port", 8887))
 P = int(cfg.get("p", 0))
 K = int(cfg.get("k", 5))
+# "unix": connect to the server's unix_socket instead of SERVER_IP:SERVER_PORT
+TRANSPORT = cfg.get("transport", "tcp")
 
-def download_file(batch_size: int):
+def download_file(batch_size: int, rtt_hist=None, sock=None):
     """
     Send 'batch_size' requests back-to-back, then block until we've received
     exactly 'batch_size' responses (unless EOF is seen earlier). Repeat until EOF.
+    If rtt_hist is given, each request's send->response time (us) is recorded.
+    `sock` is an already connected socket (see prepare); otherwise we connect.
+    Words are counted per response line as it arrives; returns the WordCounter.
     """
     offset = P
-    all_words = []
+    counter = WordCounter()
+    sent_at = collections.deque()   # send timestamps of outstanding requests
 
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((SERVER_IP, SERVER_PORT))
-        buf = ""
+    with sock or connect_with_retry((SERVER_IP, SERVER_PORT)) as s:
+        buf = bytearray()
 
         while True:
             # --- send a burst of `batch_size` requests ---
             for _ in range(batch_size):
                 req = f"{offset},{K}\n"
+                if rtt_hist is not None:
+                    sent_at.append(time.perf_counter_ns())
                 s.sendall(req.encode())
                 offset += K
 
@@ -45,40 +60,65 @@ def download_file(batch_size: int):
             while got < batch_size:
                 chunk = s.recv(4096)
                 if not chunk:
-                    return all_words  # connection closed
+                    return counter  # connection closed
 
-                buf += chunk.decode()
-                while "\n" in buf and got < batch_size:
-                    line, buf = buf.split("\n", 1)
-                    line = line.strip()
-                    if not line:
+                buf += chunk
+                while got < batch_size:
+                    nl = buf.find(b"\n")
+                    if nl == -1:
+                        break
+                    line = bytes(buf[:nl])
+                    del buf[:nl + 1]
+                    if not line.strip():
                         continue
                     got += 1
+                    if rtt_hist is not None:
+                        rtt_hist.record((time.perf_counter_ns() - sent_at.popleft()) // 1000)
+
+                    # words on the EOF line are counted too
+                    if counter.add(line):
+                        return counter
 
-                    if "EOF" in line:
-                        # collect remaining words on the EOF line
-                        words_part = line.replace("EOF", "").rstrip(",")
-                        if words_part:
-                            all_words.extend([w for w in words_part.split(",") if w])
-                        return all_words
-                    else:
-                        all_words.extend([w for w in line.split(",") if w])
+def prepare(argv=None):
+    """Parse args and connect; return a function that runs the download.
 
-def main():
+    Used by the runner's agent to connect every client before the common
+    start signal, so only the download itself is timed.
+    """
     ap = argparse.ArgumentParser()
     ap.add_argument("--batch-size", type=int, default=1,
                     help="Back-to-back requests per burst (greedy uses c>1)")
     ap.add_argument("--client-id", type=str, default="client")
-    args = ap.parse_args()
+    ap.add_argument("--hist", type=str, default=None,
+                    help="Record per-request RTTs and dump the histogram to this path")
+    ap.add_argument("--transport", choices=["tcp", "unix"], default=TRANSPORT,
+                    help="Connect over TCP or to the server's Unix socket")
+    args = ap.parse_args(argv)
+    addr = cfg["unix_socket"] if args.transport == "unix" else (SERVER_IP, SERVER_PORT)
+    sock = connect_with_retry(addr)
+
+    def run():
+        rtt_hist = hdr.Histogram() if args.hist else None
+        t0 = time.monotonic()
+        counter = download_file(args.batch_size, rtt_hist, sock)
+        t1 = time.monotonic()
+        if rtt_hist is not None:
+            hdr.dump(args.hist, {"rtt": rtt_hist})
+
+        # Print elapsed and absolute finish times (for common-start timing);
+        # FINISH_MONO is CLOCK_MONOTONIC, shared by all Mininet hosts
+        elapsed_ms = int((t1 - t0) * 1000)
+        print(f"ELAPSED_MS:{elapsed_ms}")
+        print(f"FINISH_EPOCH:{time.time():.6f}")
+        print(f"FINISH_MONO:{t1:.6f}")
+        print(f"WORDS:{counter.words} VOCAB:{len(counter)} PEAK_RSS_KB:{peak_rss_kb()}")
+        return counter.result(elapsed_ms=(t1 - t0) * 1000, finish_mono=t1,
+                              transport=args.transport)
 
-    t0 = time.time()
-    _ = download_file(args.batch_size)
-    t1 = time.time()
+    return run
 
-    # Print both elapsed and absolute finish time (for common-start timing)
-    elapsed_ms = int((t1 - t0) * 1000)
-    print(f"ELAPSED_MS:{elapsed_ms}")
-    print(f"FINISH_EPOCH:{t1:.6f}")
+def main(argv=None):
+    return prepare(argv)()
 
 if __name__ == "__main__":
-    main()
+    emit(main())
@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
+import os
+import sys
 import pandas as pd
 import matplotlib.pyplot as plt
-from pathlib import Path
 
-RESULTS_CSV = Path("results_p3.csv")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.results_store import ResultsStore
+from common.adaptive import t975
 
-# Load results: columns = ["c", "run", "jfi"]
-df = pd.read_csv(RESULTS_CSV)
+store = ResultsStore("results.db")
+
+# Load the latest sweep: columns = ["c", "run", "jfi"]
+rows = store.metric_rows(store.latest_experiment("part3_fcfs"), "jfi")
+df = pd.DataFrame(rows).rename(columns={"x": "c", "value": "jfi"})
 
 # Aggregate by c: mean, std, count
 agg = df.groupby("c")["jfi"].agg(["mean", "std", "count"]).reset_index()
@@ -14,8 +20,8 @@ agg = df.groupby("c")["jfi"].agg(["mean", "std", "count"]).reset_index()
 # Standard error of the mean
 agg["sem"] = agg["std"] / agg["count"].pow(0.5)
 
-# 95% confidence interval
-agg["ci95"] = 1.96 * agg["sem"]
+# 95% confidence interval (Student t; run counts can differ per c)
+agg["ci95"] = agg["count"].map(lambda n: t975(n - 1)) * agg["sem"]
 
 # Plot
 plt.figure(figsize=(8,5))
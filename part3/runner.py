@@ -1,15 +1,25 @@
 #!/usr/bin/env python3
 
 import os
-import re
-import time
+import sys
+import json
 import glob
-import csv
 import numpy as np
 from pathlib import Path
+from subprocess import PIPE, STDOUT
 from topology import create_network
-
-RESULTS_CSV = Path("results_p3.csv")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.readiness import wait_ready, stop
+from common.results_store import ResultsStore
+from common.instrument import summarize, store_samples
+from common.stats import Sampler
+from common.adaptive import AdaptiveRepeats
+from common.agent import AgentHandle, start_together
+from common.profiling import ProfileCapture
+
+AGENT = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "common", "agent.py")
+RESULTS_DB = Path("results.db")
+EXPERIMENT = "part3_fcfs"
 
 class Runner:
     def __init__(self, config_file='config.json', runs_per_c=1):
@@ -24,6 +34,7 @@ class Runner:
                 key = key.strip().strip('"')
                 val = val.strip().strip('"')
                 config[key] = val
+        self.config = config
 
         self.server_ip = config['server_ip']
         self.port = int(config['port'])
@@ -32,42 +43,40 @@ class Runner:
         self.p = int(config['p'])
         self.k = int(config['k'])
         self.runs_per_c = runs_per_c
+        # fixed runs_per_c unless config sets ci_target_abs / ci_target_rel
+        self.repeats = AdaptiveRepeats.from_config(config, runs_per_c)
+        self.instrument = int(config.get('instrument', 0))
+        # seconds a client may run before it is killed and the run marked failed
+        self.client_timeout = float(config.get('client_timeout_s', 0)) or None
+        self.store = ResultsStore(RESULTS_DB)
+        self.experiment = None
+        self.net = None          # network and client agents are reused across runs
+        self.agents = []
 
         print(f"Config: {self.num_clients} clients, max c={self.c_max}, p={self.p}, k={self.k}")
 
     def cleanup_logs(self):
-        logs = glob.glob("logs/*.log")
+        logs = glob.glob("logs/*.log") + glob.glob("logs/*.hist.json") + glob.glob("logs/*.jsonl")
         for log in logs:
             os.remove(log)
         os.makedirs("logs", exist_ok=True)
 
-    def parse_logs(self, exp_start):
-        """Return dict: {'rogue':[ms], 'normal':[ms,...]} using a common start."""
-        results = {'rogue': [], 'normal': []}
-
-        import re, os
-
-        def finish_ms(path):
-            if os.path.exists(path):
-                txt = open(path).read()
-                # requires client.py to print: FINISH_EPOCH:<float>
-                m = re.search(r"FINISH_EPOCH\s*:\s*([0-9]+(?:\.[0-9]+)?)", txt)
-                if m:
-                    finish_epoch = float(m.group(1))
-                    return int(1000 * (finish_epoch - exp_start))
-            return None
-
-        # Rogue
-        ms = finish_ms("logs/rogue.log")
-        if ms is not None:
-            results['rogue'].append(ms)
-
-        # Normal clients
-        for i in range(2, self.num_clients + 1):
-            ms = finish_ms(f"logs/normal_{i}.log")
-            if ms is not None:
-                results['normal'].append(ms)
-
+    def parse_results(self, exp_start, client_ids, replies):
+        """Return dict: {'rogue':[ms], 'normal':[ms,...], 'clients':{id: ms}} using a common start.
+
+        exp_start is the barrier's start signal on CLOCK_MONOTONIC; each
+        client's result carries its finish_mono on the same clock.
+        """
+        results = {'rogue': [], 'normal': [], 'clients': {}, 'words': 0, 'bytes': 0}
+        for cid, reply in zip(client_ids, replies):
+            result = reply.get('result')
+            if not reply.get('ok') or not result:
+                continue
+            ms = int(1000 * (result['finish_mono'] - exp_start))
+            results['rogue' if cid == 'rogue' else 'normal'].append(ms)
+            results['clients'][cid] = ms
+            results['words'] += result.get('words', 0)
+            results['bytes'] += result.get('bytes', 0)
         return results
 
 
@@ -97,68 +106,169 @@ class Runner:
 
 
 
+    def start_network(self):
+        """Create the topology and one warm client agent per client host"""
+        self.net = create_network(num_clients=self.num_clients)
+        for i in range(self.num_clients):
+            proc = self.net.get(f'client{i+1}').popen(
+                f"python3 {AGENT} client.py", stdin=PIPE, stdout=PIPE, stderr=STDOUT)
+            self.agents.append(AgentHandle(proc, name=f'client{i+1}'))
+        for agent in self.agents:
+            agent.wait_ready()
+
+    def stop_network(self):
+        for agent in self.agents:
+            agent.close()
+        self.agents = []
+        if self.net is not None:
+            self.net.stop()
+            self.net = None
+
     def run_experiment(self, c_value, run_id=1):
         print(f"Running c={c_value}, run={run_id}")
         self.cleanup_logs()
-        net = create_network(num_clients=self.num_clients)
+        if self.net is None:
+            self.start_network()
 
-        try:
-            server = net.get('server')
-            clients = [net.get(f'client{i+1}') for i in range(self.num_clients)]
-
-            # Start server
-            server_proc = server.popen("python3 server.py")
-            time.sleep(2)                         # warm up server
-            exp_start = time.time() 
-
-            # Start rogue client
-            rogue_proc = clients[0].popen(
-                f"python3 client.py --batch-size {c_value} --client-id rogue > logs/rogue.log 2>&1",
-                shell=True
-            )
-
-            # Start normal clients
-            normal_procs = []
-            for i in range(1, self.num_clients):
-                proc = clients[i].popen(
-                    f"python3 client.py --batch-size 1 --client-id normal_{i+1} > logs/normal_{i+1}.log 2>&1",
-                    shell=True
-                )
-                normal_procs.append(proc)
-
-            # Wait for clients
-            rogue_proc.wait()
-            for proc in normal_procs:
-                proc.wait()
-
-            # Stop server
-            server_proc.terminate()
-            server_proc.wait()
-            time.sleep(1)
-
-            # Parse logs & compute JFI
-            results = self.parse_logs(exp_start)   # <<< changed
-            jfi = self.calculate_jfi(results)
-
-            # Write CSV
-            with RESULTS_CSV.open("a", newline="") as f:
-                csv.writer(f).writerow([c_value, run_id, jfi])
-
-            print(f"c={c_value}, run={run_id}, JFI={jfi:.3f}")
-            return jfi
+        # Rogue client on client1, normal clients on the rest
+        client_ids = ['rogue'] + [f'normal_{i+1}' for i in range(1, self.num_clients)]
 
+        # Start server
+        server_proc = self.net.get('server').popen("python3 server.py", stdout=PIPE, stderr=STDOUT)
+        sampler = None
+        failed = None
+        try:
+            wait_ready(server_proc)               # bound and corpus loaded
+            sampler = self.start_sampler()
+            # config "profile_at": profile the first run at this c
+            profile = ProfileCapture.for_run(self.config, server_proc, c_value, run_id)
+
+            # All clients connect first, then start on one signal (exp_start, CLOCK_MONOTONIC)
+            jobs = [(["--batch-size", c_value if cid == 'rogue' else 1, "--client-id", cid,
+                      *self.hist_argv(cid)], f"logs/{cid}.log") for cid in client_ids]
+            # Wait for clients; failures are printed as they happen
+            exp_start, replies = start_together(self.agents, jobs, run_timeout=self.client_timeout,
+                                                on_reply=self.warn_failed)
+            self.report_skew(exp_start, replies)
+            if profile:
+                profile.finish()
+            self.stop_sampler(sampler)
+            sampler = None
+        except RuntimeError as e:
+            # server not ready, or an agent failed to prepare or reply
+            failed = e
         finally:
-            net.stop()
+            if sampler is not None:
+                sampler.stop()            # the run failed while it was polling
+            # Stop server
+            stop(server_proc)
+            if failed or not all(agent.alive for agent in self.agents):
+                self.stop_network()       # restart agents (and network) next run
+
+        if failed:
+            print(f"[WARN] c={c_value}, run={run_id} failed: {failed}", flush=True)
+            nan = float('nan')
+            self.record_run(c_value, run_id, {'clients': dict.fromkeys(client_ids, nan),
+                                              'words': 0, 'bytes': 0}, nan)
+            return 0.0                    # like a run with missing client results
+
+        # Collect results & compute JFI
+        results = self.parse_results(exp_start, client_ids, replies)
+        jfi = self.calculate_jfi(results)
+
+        # Merge latency histograms into per-class percentiles
+        latency = self.latency_metrics() if self.instrument else {}
+
+        # Record raw per-client times and the run's JFI
+        run = self.record_run(c_value, run_id, results, jfi, latency)
+        if self.instrument:
+            # every request's RTT and queue wait, for perfmodel.py
+            store_samples(self.store, run, 'logs/server.hist.json', self.hist_paths())
+
+        print(f"c={c_value}, run={run_id}, JFI={jfi:.3f}")
+        return jfi
+
+    def warn_failed(self, agent, reply):
+        if not reply.get('ok'):
+            print(f"[WARN] {agent.name}: {reply.get('error')}", flush=True)
+
+    def report_skew(self, exp_start, replies):
+        """How far after the start signal the clients actually began"""
+        starts = [r['start_mono'] for r in replies if r.get('ok')]
+        if starts:
+            print(f"  start skew: max {1000 * (max(starts) - exp_start):.3f} ms")
+
+    def start_sampler(self):
+        """Poll the server's stats socket during the run (if configured)"""
+        path = self.config.get('stats_socket')
+        if not path:
+            return None
+        return Sampler(path, int(self.config.get('stats_sample_ms', 500)) / 1000.0).start()
+
+    def stop_sampler(self, sampler):
+        if sampler is None:
+            return
+        snapshots = sampler.stop()
+        with open('logs/stats.jsonl', 'w') as f:
+            for snap in snapshots:
+                f.write(json.dumps(snap) + '\n')
+        if snapshots:
+            last = snapshots[-1]
+            print(f"  queue depth={last['queue_depth']}, service share="
+                  + ", ".join(f"{c}:{s:.2f}" for c, s in sorted(last['share'].items())))
+            served = sum(last['served'].values())
+            if served:
+                print(f"  send calls per response={last['send_calls'] / served:.3f}")
+
+    def hist_argv(self, client_id):
+        return ["--hist", f"logs/{client_id}.hist.json"] if self.instrument else []
+
+    def hist_paths(self):
+        """Each client id's RTT histogram dump"""
+        client_paths = {'rogue': 'logs/rogue.hist.json'}
+        for i in range(2, self.num_clients + 1):
+            client_paths[f'normal_{i}'] = f'logs/normal_{i}.hist.json'
+        return client_paths
+
+    def client_class(self, key):
+        """Class of a client id (rogue/normal_N) or server-side key (client IP)."""
+        return 'rogue' if key in ('rogue', '10.0.0.1') else 'normal'
+
+    def latency_metrics(self):
+        metrics = summarize('logs/server.hist.json', self.hist_paths(), self.client_class)
+        for name in sorted(metrics):
+            print(f"  {name} = {metrics[name]:.2f} ms")
+        return metrics
+
+    def record_run(self, c_value, run_id, results, jfi, latency=None):
+        if self.experiment is None:
+            self.experiment = self.store.new_experiment(EXPERIMENT, self.config)
+        run = self.store.add_run(self.experiment, "c", c_value, run_id)
+        for name, ms in results['clients'].items():
+            cls = 'rogue' if name == 'rogue' else 'normal'
+            self.store.add_client(run, name, cls, finish_ms=ms)
+        self.store.add_metric(run, "jfi", jfi)
+        self.store.add_metric(run, "words", results['words'])
+        self.store.add_metric(run, "bytes", results['bytes'])
+        for name, value in (latency or {}).items():
+            self.store.add_metric(run, name, value)
+        return run
 
     def run_varying_c(self):
-        if not RESULTS_CSV.exists():
-            with RESULTS_CSV.open("w", newline="") as f:
-                csv.writer(f).writerow(["c", "run", "jfi"])
-
-        for c in range(1, self.c_max + 1):
-            for r in range(1, self.runs_per_c + 1):
-                self.run_experiment(c, run_id=r)
+        try:
+            for c in range(1, self.c_max + 1):
+                jfis = []
+                r = 0
+                while not self.repeats.done(jfis, attempts=r):
+                    r += 1
+                    jfi = self.run_experiment(c, run_id=r)
+                    if jfi > 0:   # 0.0 marks a run with missing client results
+                        jfis.append(jfi)
+                print(f"c={c}: JFI {self.repeats.describe(jfis)}")
+        finally:
+            self.stop_network()
 
+        self.store.close()
         print("All experiments completed.")
 
 
@@ -1,10 +1,23 @@
 #!/usr/bin/env python3
+import os
+import sys
 import socket
 import select
 import collections
 import threading
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.instrument import RequestTimer
+from common.stats import ServerStats, serve_stats
+from common.profiling import install_profiling
+from common.servicetrace import install_trace
+from common.wordindex import load_words
+from common.workerpool import WorkerPool
+from common.coalesce import sendmsg_all
+from common.scheduling import RequestQueue, split_tags
+from common.unixsock import listen_config, peer_key
+
 # --- Simple config parser (no json import) ---
 def load_config(filename="config.json"):
     cfg = {}
@@ -24,11 +37,17 @@ SERVER_PORT = int(config.get("port", 8887))
 FILENAME    = config.get("filename", "words.txt")
 PROC_MS     = int(config.get("proc_ms", 0))        # optional per-request processing time (ms)
 REPEAT      = int(config.get("repeat_words", 1))   # optional multiplier for file length
+INSTRUMENT  = int(config.get("instrument", 0))     # optional per-request latency histograms
+HIST_PATH   = config.get("hist_path", "logs/server.hist.json")
+WORKERS     = int(config.get("workers", 0))        # >0: serve from a pool of worker processes
+PROC_SPIN   = int(config.get("proc_spin", 0))      # busy-wait proc_ms (CPU-bound service)
+COALESCE_US = int(config.get("coalesce_us", 0))    # >0: one gathered write per same-socket run
+# "scheduler": fcfs (default), rr, srpt, prio or edf, see common/scheduling.py
 
-# Load words once (optionally repeat to make the file longer)
-with open(FILENAME) as f:
-    base = f.read().strip().split(",")
-words = base * max(1, REPEAT)
+# Load words once (optionally repeat to make the file longer); with
+# "word_index" set this is a sparse on-disk index and the repeat is virtual
+words = load_words(FILENAME, REPEAT, config) if not WORKERS else None
+pool = None                       # WorkerPool, created in main() before any thread starts
 
 def handle_request(req: str) -> str:
     """Process a single 'p,k' request and return a newline-terminated response."""
@@ -37,21 +56,24 @@ def handle_request(req: str) -> str:
     except Exception:
         return "EOF\n"
 
-    if p >= len(words):
+    if p < 0 or p >= len(words):    # same bounds as the worker processes (workerpool.py)
         return "EOF\n"
 
     slice_words = words[p:p+k]
     if p + k >= len(words):
         slice_words.append("EOF")
 
-    if PROC_MS > 0:
+    if PROC_MS > 0 and PROC_SPIN:
+        deadline = time.perf_counter() + PROC_MS / 1000.0
+        while time.perf_counter() < deadline:
+            pass
+    elif PROC_MS > 0:
         time.sleep(PROC_MS / 1000.0)  # uniform service time (optional)
 
     return ",".join(slice_words) + "\n"
 
 # === Shared state (protected by locks) ===
-rq = collections.deque()          # global FCFS queue of (sock, line)
-rq_lock = threading.Lock()
+rq = None                         # RequestQueue: sock -> (line, t_enqueue_ns), created in main()
 
 inputs = []                       # list of connected client sockets (nonblocking)
 inputs_lock = threading.Lock()
@@ -59,9 +81,21 @@ inputs_lock = threading.Lock()
 buffers = {}                      # sock -> partial text buffer
 buffers_lock = threading.Lock()
 
-def receiver_thread(listener: socket.socket):
-    """Accept clients and read requests; enqueue each request globally (FCFS)."""
-    listener.setblocking(False)
+peers = {}                        # sock -> client IP (for per-client instrumentation)
+timer = RequestTimer(HIST_PATH) if INSTRUMENT else None
+
+def queue_depth():
+    per_client = collections.Counter()
+    for sock, n in rq.depth().items():
+        per_client[peers.get(sock, "?")] += n
+    return {"total": sum(per_client.values()), "per_client": dict(per_client)}
+
+stats = ServerStats(queue_depth)  # live counters, queried via stats_port / stats_socket
+
+def receiver_thread(listeners):
+    """Accept clients and read requests; enqueue each request in rq."""
+    for listener in listeners:
+        listener.setblocking(False)
 
     while True:
         # Snapshot inputs for select safely
@@ -69,19 +103,21 @@ def receiver_thread(listener: socket.socket):
             current_inputs = inputs[:]
 
         try:
-            readable, _, _ = select.select([listener] + current_inputs, [], [], 0.005)
+            readable, _, _ = select.select(listeners + current_inputs, [], [], 0.005)
         except Exception:
             continue
 
         for sock in readable:
-            if sock is listener:
+            if sock in listeners:
                 try:
-                    conn, _ = listener.accept()
+                    conn, addr = sock.accept()
                     conn.setblocking(False)
                     with inputs_lock:
                         inputs.append(conn)
                     with buffers_lock:
                         buffers[conn] = ""
+                    peers[conn] = peer_key(conn, addr)
+                    stats.on_accept()
                 except Exception:
                     continue
             else:
@@ -95,8 +131,10 @@ def receiver_thread(listener: socket.socket):
                     with inputs_lock:
                         if sock in inputs:
                             inputs.remove(sock)
+                            stats.on_close()
                     with buffers_lock:
                         buffers.pop(sock, None)
+                    peers.pop(sock, None)
                     try:
                         sock.close()
                     except:
@@ -110,51 +148,127 @@ def receiver_thread(listener: socket.socket):
 
                     while "\n" in buf:
                         line, buf = buf.split("\n", 1)
-                        line = line.strip()
+                        line, prio, deadline_ms = split_tags(line)
                         if line:
-                            with rq_lock:
-                                rq.append((sock, line))
+                            t_enq = time.perf_counter_ns() if INSTRUMENT else 0
+                            try:
+                                p, k = map(int, line.split(","))
+                            except ValueError:
+                                p, k = None, 1   # answered with EOF
+                            rq.put(sock, (line, t_enq), p, k, prio, deadline_ms)
                     buffers[sock] = buf  # save back the remainder
 
 def worker_thread():
-    """Pop from rq and serve requests one-by-one (strict FCFS)."""
+    """Pop from rq and serve requests one-by-one, in the scheduler's order."""
     while True:
-        csock, line = None, None
-        with rq_lock:
-            if rq:
-                csock, line = rq.popleft()
-
-        if csock is None:
-            # nothing to serve; small sleep to avoid busy-spin
-            time.sleep(0.0005)
-            continue
+        csock, (line, t_enq) = rq.get()
 
         try:
-            resp = handle_request(line)
-            csock.sendall(resp.encode())
+            t_deq = time.perf_counter_ns()
+            data = handle_request(line).encode()
+            if COALESCE_US:
+                serve_coalesced(csock, data, t_enq, t_deq)
+                continue
+            csock.sendall(data)
+            t_done = time.perf_counter_ns()
+            client = peers.get(csock, "?")
+            stats.on_served(client, len(data), t_done - t_deq, payload=data)
+            if INSTRUMENT:
+                timer.record(client, t_enq, t_deq, t_done)
         except Exception:
-            # on error, drop the socket from our sets safely
-            with inputs_lock:
-                if csock in inputs:
-                    inputs.remove(csock)
-            with buffers_lock:
-                buffers.pop(csock, None)
-            try:
-                csock.close()
-            except:
-                pass
+            drop(csock)
+
+def serve_coalesced(csock, data, t_enq, t_deq):
+    """Also serve the following head requests of the same socket, then send
+    all responses in one gathered write (the scheduling order is unchanged)."""
+    batch = [data]
+    times = [(t_enq, t_deq)]
+    deadline = time.perf_counter_ns() + COALESCE_US * 1000
+    while time.perf_counter_ns() < deadline:
+        item = rq.get_if(csock)
+        if item is None:
+            break
+        line, t_enq = item
+        times.append((t_enq, time.perf_counter_ns()))
+        batch.append(handle_request(line).encode())
+    calls = sendmsg_all(csock, batch)
+    t_done = time.perf_counter_ns()
+    client = peers.get(csock, "?")
+    stats.on_served(client, sum(map(len, batch)), t_done - t_deq,
+                    requests=len(batch), send_calls=calls, payload=batch)
+    if INSTRUMENT:
+        for t_enq, t_deq in times:
+            timer.record(client, t_enq, t_deq, t_done)
+
+def drop(csock):
+    """On error, drop the socket from our sets safely."""
+    with inputs_lock:
+        if csock in inputs:
+            inputs.remove(csock)
+            stats.on_close()
+    with buffers_lock:
+        buffers.pop(csock, None)
+    try:
+        csock.close()
+    except:
+        pass
+
+def pool_dispatch_thread():
+    """Hand rq to the worker processes in scheduling order; send replies in that order."""
+    def next_request():
+        picked = rq.get(block=False)
+        if picked is None:
+            return None
+        csock, (line, t_enq) = picked
+        try:
+            p, k = map(int, line.split(","))
+        except Exception:
+            p, k = -1, 0              # answered with EOF, like handle_request
+        return (csock, t_enq, time.perf_counter_ns()), p, k
+
+    def deliver(ctx, data, busy_ns):
+        csock, t_enq, t_deq = ctx
+        try:
+            csock.sendall(data)
+            client = peers.get(csock, "?")
+            stats.on_served(client, len(data), busy_ns, payload=data)
+            if INSTRUMENT:
+                timer.record(client, t_enq, t_deq, time.perf_counter_ns())
+        except Exception:
+            drop(csock)
+
+    pool.run(next_request, deliver)
 
 def main():
+    global pool, rq
+    if INSTRUMENT:
+        timer.dump_at_exit()
+    if WORKERS:
+        # fork the workers before any other thread exists
+        pool = WorkerPool(FILENAME, REPEAT, WORKERS, PROC_MS, PROC_SPIN)
+        pool.close_at_exit()
+    rq = RequestQueue.from_config(config, len(pool) if WORKERS else len(words))
+    stats.commands["classes"] = lambda args: rq.class_stats()
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as ls:
         ls.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         ls.bind((SERVER_IP, SERVER_PORT))
         ls.listen()
-        print(f"Server listening on {SERVER_IP}:{SERVER_PORT} (threaded FCFS)")
+        print(f"Server listening on {SERVER_IP}:{SERVER_PORT} (threaded {rq.policy.upper()})")
+
+        listeners = [ls]
+        us = listen_config(config)        # "unix_socket": also accept there
+        if us:
+            listeners.append(us)
 
-        t_recv = threading.Thread(target=receiver_thread, args=(ls,), daemon=True)
-        t_work = threading.Thread(target=worker_thread, daemon=True)
+        t_recv = threading.Thread(target=receiver_thread, args=(listeners,), daemon=True)
+        t_work = threading.Thread(target=pool_dispatch_thread if WORKERS else worker_thread,
+                                  daemon=True)
         t_recv.start()
         t_work.start()
+        serve_stats(stats, config)
+        install_profiling(stats, config)
+        install_trace(stats, config)
+        print("READY", flush=True)
 
         try:
             while True:
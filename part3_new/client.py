@@ -1,8 +1,15 @@
-import socket
 import time
 import argparse
 import json
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common import hdr
+from common.readiness import connect_with_retry
+from common.datagram import UdpClient
+from common.resultchan import emit
+from common.wordcount import WordCounter, peak_rss_kb
 
 # Load configuration
 with open('config.json', 'r') as f:
@@ -11,99 +18,124 @@ with open('config.json', 'r') as f:
 SERVER_IP = config['server_ip']
 PORT = config['port']
 K = config['k']
+# "udp": datagrams to udp_port (see common/datagram.py), "unix": connections to unix_socket
+TRANSPORT = config.get('transport', 'tcp')
+
+def recv_line(conn):
+    """Read one response line (bytes, up to and including the newline)"""
+    buf = bytearray()
+    while not buf.endswith(b"\n"):
+        chunk = conn.recv(4096)
+        if not chunk:
+            break
+        buf += chunk
+    return bytes(buf)
 
-def download_file(batch_size, client_id):
-    words = []
+def fetch_batch_udp(udp, counter, offset, batch_size, rtt_hist=None):
+    """One burst of requests as datagrams; True once a response ends with EOF"""
+    sent = time.perf_counter_ns()
+    done_at = []
+    responses = udp.fetch([(offset + i * K, K) for i in range(batch_size)], done_at)
+    eof_received = False
+    for response, t_done in zip(responses, done_at):
+        if rtt_hist is not None:
+            rtt_hist.record((t_done - sent) // 1000)
+        # count each response, up to the first one with EOF
+        if not eof_received and counter.add(response):
+            eof_received = True
+    return eof_received
+
+def download_file(batch_size, client_id, rtt_hist=None, udp=None, addr=(SERVER_IP, PORT)):
+    counter = WordCounter()
     offset = 0
-    start_time = time.time()
-    
-    # Create logs directory if it doesn't exist
-    os.makedirs("logs", exist_ok=True)
+    start_time = time.monotonic()
     
     while True:
+        if udp is not None:
+            try:
+                eof_received = fetch_batch_udp(udp, counter, offset, batch_size, rtt_hist)
+            except TimeoutError as e:
+                print(f"Receive error: {e}")
+                return counter.result(error=f"udp: {e}", **udp.counters())
+            if eof_received:
+                break
+            offset += batch_size * K
+            continue
+        
         connections = []
-        responses = []
         
         # Create multiple connections for greedy client
         for i in range(batch_size):
             try:
-                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                s.connect((SERVER_IP, PORT))
+                s = connect_with_retry(addr)
                 connections.append(s)
             except Exception as e:
                 print(f"Connection error: {e}")
                 for conn in connections:
                     conn.close()
-                return None
+                return counter.result(error=f"connect: {e}")
         
         # Send requests
+        sent_at = []
         for i, conn in enumerate(connections):
             request = f"{offset + i * K},{K}\n"
             try:
+                sent_at.append(time.perf_counter_ns())
                 conn.send(request.encode())
             except Exception as e:
                 print(f"Send error: {e}")
                 for c in connections:
                     c.close()
-                return None
+                return counter.result(error=f"send: {e}")
         
         # Receive responses
         eof_received = False
         for i, conn in enumerate(connections):
             try:
-                response = conn.recv(1024).decode().strip()
-                responses.append(response)
+                response = recv_line(conn)
+                if rtt_hist is not None:
+                    rtt_hist.record((time.perf_counter_ns() - sent_at[i]) // 1000)
                 
-                if response == "EOF" or "EOF" in response.split(','):
+                # count each response as it arrives, up to the first one with EOF
+                if not eof_received and counter.add(response):
                     eof_received = True
             except Exception as e:
                 print(f"Receive error: {e}")
-                responses.append("")
             finally:
                 conn.close()
         
-        # Process responses
-        for response in responses:
-            if response == "EOF":
-                continue
-                
-            parts = response.split(',')
-            for word in parts:
-                if word == "EOF":
-                    eof_received = True
-                    break
-                words.append(word)
-            
-            if eof_received:
-                break
-        
         if eof_received:
             break
             
         offset += batch_size * K
     
-    end_time = time.time()
+    end_time = time.monotonic()
     completion_time = end_time - start_time
     
-    # Count word frequencies
-    word_count = {}
-    for word in words:
-        word_count[word] = word_count.get(word, 0) + 1
-    
-    # Print word frequencies
-    for word, count in word_count.items():
+    # Print word frequencies (counted while downloading)
+    for word, count in counter.items():
         print(f"{word}, {count}")
+    print(f"WORDS:{counter.words} VOCAB:{len(counter)} PEAK_RSS_KB:{peak_rss_kb()}")
     
-    # Save completion time to log file
-    with open(f"logs/{client_id}.log", "w") as f:
-        f.write(f"{completion_time}")
-    
-    return completion_time
+    return counter.result(client_id=client_id, elapsed_ms=completion_time * 1000,
+                          finish_mono=end_time, **(udp.counters() if udp else {}))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--batch-size", type=int, default=1, help="Number of parallel requests")
     parser.add_argument("--client-id", type=str, default="client", help="Client identifier")
+    parser.add_argument("--hist", type=str, default=None,
+                        help="Record per-request RTTs and dump the histogram to this path")
+    parser.add_argument("--transport", choices=["tcp", "udp", "unix"], default=TRANSPORT,
+                        help="Send requests over TCP connections, as UDP datagrams or over "
+                             "connections to the server's Unix socket")
     args = parser.parse_args()
     
-    download_file(args.batch_size, args.client_id)
\ No newline at end of file
+    rtt_hist = hdr.Histogram() if args.hist else None
+    udp = UdpClient.from_config(config) if args.transport == "udp" else None
+    addr = config['unix_socket'] if args.transport == "unix" else (SERVER_IP, PORT)
+    result = download_file(args.batch_size, args.client_id, rtt_hist, udp, addr)
+    result["transport"] = args.transport
+    if rtt_hist is not None:
+        hdr.dump(args.hist, {"rtt": rtt_hist})
+    emit(result)
\ No newline at end of file
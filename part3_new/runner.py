@@ -2,16 +2,32 @@
 
 import json
 import os
-import time
+import sys
 import glob
 import numpy as np
 import argparse
 import matplotlib.pyplot as plt
+from subprocess import PIPE, STDOUT
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.readiness import wait_ready, stop
+from common.results_store import ResultsStore
+from common.adaptive import AdaptiveRepeats
+from common.instrument import summarize, store_samples
+from common.profiling import ProfileCapture
+from common.resultchan import collect, warn_failed
+
+RESULTS_DB = "results.db"
+EXPERIMENT = "part3_new_fcfs"
 
 class Runner:
-    def __init__(self, config_file='config.json'):
+    def __init__(self, config_file='config.json', transport=None, loss=None):
         with open(config_file, 'r') as f:
             self.config = json.load(f)
+        # command-line overrides are stored with the experiment's config
+        if transport is not None:
+            self.config['transport'] = transport
+        if loss is not None:
+            self.config['link_loss_pct'] = loss
         
         self.server_ip = self.config['server_ip']
         self.port = self.config['port']
@@ -19,32 +35,50 @@ class Runner:
         self.c = self.config['c']
         self.p = self.config['p']
         self.k = self.config['k']
+        # "udp": clients send datagrams to udp_port, "unix": they connect to
+        # unix_socket (hosts share the file system); the server serves both too
+        self.transport = self.config.get('transport', 'tcp')
+        self.loss = self.config.get('link_loss_pct', 0)   # random loss (%) on every link
+        if self.transport == 'udp' and not self.config.get('udp_port'):
+            raise SystemExit("transport udp needs udp_port in config.json")
+        if self.transport == 'unix' and not self.config.get('unix_socket'):
+            raise SystemExit("transport unix needs unix_socket in config.json")
         self.num_repetitions = self.config.get('num_repetitions', 2)
+        # fixed num_repetitions unless config sets ci_target_abs / ci_target_rel
+        self.repeats = AdaptiveRepeats.from_config(self.config, self.num_repetitions)
+        self.instrument = int(self.config.get('instrument', 0))
+        # seconds a client may run before it is killed and the run marked failed
+        self.client_timeout = self.config.get('client_timeout_s')
+        self.store = ResultsStore(RESULTS_DB)
+        self.experiment = None
         
-        print(f"Config: {self.num_clients} clients, c={self.c}, p={self.p}, k={self.k}")
+        print(f"Config: {self.num_clients} clients, c={self.c}, p={self.p}, k={self.k}, "
+              f"transport={self.transport}, loss={self.loss}%")
     
     def cleanup_logs(self):
         """Clean old log files"""
-        logs = glob.glob("logs/*.log")
+        logs = glob.glob("logs/*.log") + glob.glob("logs/*.hist.json")
         for log in logs:
             os.remove(log)
         print("Cleaned old logs")
     
-    def parse_logs(self):
-        """Parse log files and return completion times"""
-        completion_times = {'rogue': [], 'normal': []}
+    def parse_results(self, client_results):
+        """Completion times (s) from the clients' results"""
+        completion_times = {'rogue': [], 'normal': [], 'clients': {}, 'words': 0, 'bytes': 0,
+                            'retransmits': 0}
         
-        log_files = glob.glob("logs/*.log")
-        for log_file in log_files:
-            with open(log_file, 'r') as f:
-                try:
-                    time_val = float(f.read().strip())
-                    if 'rogue' in log_file:
-                        completion_times['rogue'].append(time_val)
-                    else:
-                        completion_times['normal'].append(time_val)
-                except ValueError:
-                    print(f"Invalid content in {log_file}")
+        for cid, result in client_results.items():
+            if result.get('error'):
+                continue
+            time_val = result['elapsed_ms'] / 1000.0
+            completion_times['clients'][cid] = time_val
+            if cid == 'rogue':
+                completion_times['rogue'].append(time_val)
+            else:
+                completion_times['normal'].append(time_val)
+            completion_times['words'] += result.get('words', 0)
+            completion_times['bytes'] += result.get('bytes', 0)
+            completion_times['retransmits'] += result.get('retransmits', 0)
         
         return completion_times
     
@@ -63,7 +97,7 @@ class Runner:
         jfi = (sum_throughput ** 2) / (n * sum_squared_throughput)
         return jfi
     
-    def run_experiment(self, c_value):
+    def run_experiment(self, c_value, rep=1):
         """Run single experiment with given c value"""
         print(f"Running experiment with c={c_value}")
         
@@ -72,7 +106,8 @@ class Runner:
         
         # Create network
         from topology import create_network
-        net = create_network(num_clients=self.num_clients)
+        net = create_network(num_clients=self.num_clients, loss=self.loss)
+        client_ids = ['rogue'] + [f'normal_{i+1}' for i in range(1, self.num_clients)]
         
         try:
             # Get hosts
@@ -81,38 +116,50 @@ class Runner:
             
             # Start server
             print("Starting server...")
-            server_proc = server.popen("python3 server.py")
-            time.sleep(3)
+            server_proc = server.popen("python3 server.py", stdout=PIPE, stderr=STDOUT)
+            try:
+                wait_ready(server_proc)
+            except RuntimeError as e:
+                stop(server_proc)
+                print(f"[WARN] c={c_value}, rep={rep} failed: {e}", flush=True)
+                return self.failed_results(client_ids)
+            # config "profile_at": profile the first repetition at this c
+            profile = ProfileCapture.for_run(self.config, server_proc, c_value, rep)
             
-            # Start clients
+            # Start clients, each reporting its result on its stdout pipe
             print("Starting clients...")
-            # Client 1 is rogue (batch size c)
-            rogue_proc = clients[0].popen(f"python3 client.py --batch-size {c_value} --client-id rogue")
-            
-            # Clients 2-N are normal (batch size 1)
-            normal_procs = []
-            for i in range(1, self.num_clients):
-                proc = clients[i].popen(f"python3 client.py --batch-size 1 --client-id normal_{i+1}")
-                normal_procs.append(proc)
+            # Client 1 is rogue (batch size c), clients 2-N are normal (batch size 1)
+            client_cmd = f"python3 client.py --transport {self.transport}"
+            procs = {'rogue': clients[0].popen(
+                f"{client_cmd} --batch-size {c_value} --client-id rogue{self.hist_arg('rogue')}",
+                stdout=PIPE, stderr=STDOUT)}
+            for i, cid in enumerate(client_ids[1:], 1):
+                procs[cid] = clients[i].popen(
+                    f"{client_cmd} --batch-size 1 --client-id {cid}{self.hist_arg(cid)}",
+                    stdout=PIPE, stderr=STDOUT)
             
-            # Wait for all clients
-            rogue_proc.wait()
-            for proc in normal_procs:
-                proc.wait()
+            # Wait for all clients; failed and late ones are reported when detected
+            client_results = collect(procs, timeout=self.client_timeout, on_result=warn_failed)
+            if profile:
+                profile.finish()
             
             # Stop server
-            server_proc.terminate()
-            server_proc.wait()
-            time.sleep(2)
+            stop(server_proc)
             
-            # Parse results
-            time.sleep(1)
-            results = self.parse_logs()
+            # Collect results
+            results = self.parse_results(client_results)
+            results['latency'] = self.latency_metrics() if self.instrument else {}
             
             return results
             
         finally:
             net.stop()
+
+    def failed_results(self, client_ids):
+        """Results of a run that failed before its clients reported: NaN times, nothing counted"""
+        results = self.parse_results({})
+        results['clients'] = dict.fromkeys(client_ids, float('nan'))
+        return results
     
     def run_varying_c(self):
         """Run experiments with c from 1 to 10"""
@@ -122,28 +169,84 @@ class Runner:
         print("Running experiments with varying c values...")
         
         for c in c_values:
-            jfi_sum = 0
-            for rep in range(self.num_repetitions):
-                print(f"\n--- Testing c = {c}, repetition {rep+1}/{self.num_repetitions} ---")
-                results = self.run_experiment(c)
+            jfis = []
+            rep = 0
+            while not self.repeats.done(jfis, attempts=rep):
+                print(f"\n--- Testing c = {c}, repetition {rep+1} (max {self.repeats.max_runs}) ---")
+                results = self.run_experiment(c, rep + 1)
                 
-                # Combine all completion times
+                # Combine all completion times; a run where some client failed
+                # counts as an attempt but gets no JFI
                 all_times = results['rogue'] + results['normal']
-                jfi = self.calculate_jfi(all_times)
-                jfi_sum += jfi
+                if len(all_times) == self.num_clients:
+                    jfi = self.calculate_jfi(all_times)
+                    jfis.append(jfi)
+                else:
+                    print(f"[WARN] Expected {self.num_clients} times, got {len(all_times)}")
+                    jfi = float('nan')
+                self.record_run(c, rep + 1, results, jfi)
+                rep += 1
                 
-                print(f"JFI for c={c}, rep{rep+1}: {jfi:.4f}")
+                print(f"JFI for c={c}, rep{rep}: {jfi:.4f}")
             
-            avg_jfi = jfi_sum / self.num_repetitions
+            avg_jfi = sum(jfis) / len(jfis) if jfis else 0.0
             jfi_results.append(avg_jfi)
-            print(f"Average JFI for c={c}: {avg_jfi:.4f}")
+            print(f"Average JFI for c={c}: {avg_jfi:.4f} ({self.repeats.describe(jfis)})")
             
-            # Save results to CSV
-            with open('results.csv', 'a') as f:
-                f.write(f"{c},{avg_jfi:.4f}\n")
-        
+        self.store.close()
         return c_values, jfi_results
+
+    def record_run(self, c_value, rep, results, jfi):
+        """Store raw per-client times (ms) and JFI for one repetition"""
+        if self.experiment is None:
+            self.experiment = self.store.new_experiment(EXPERIMENT, self.config)
+        run = self.store.add_run(self.experiment, "c", c_value, rep)
+        for name, secs in results['clients'].items():
+            cls = 'rogue' if name == 'rogue' else 'normal'
+            self.store.add_client(run, name, cls, elapsed_ms=secs * 1000.0)
+        self.store.add_metric(run, "jfi", jfi)
+        self.store.add_metric(run, "words", results['words'])
+        self.store.add_metric(run, "bytes", results['bytes'])
+        if self.transport == 'udp':
+            self.store.add_metric(run, "retransmits", results['retransmits'])
+        for name, value in results.get('latency', {}).items():
+            self.store.add_metric(run, name, value)
+        if self.instrument:
+            # every request's RTT and queue wait, for perfmodel.py
+            store_samples(self.store, run, 'logs/server.hist.json', self.hist_paths())
+
+    def hist_arg(self, client_id):
+        return f" --hist logs/{client_id}.hist.json" if self.instrument else ""
+
+    def hist_paths(self):
+        """Each client id's RTT histogram dump"""
+        client_paths = {'rogue': 'logs/rogue.hist.json'}
+        for i in range(2, self.num_clients + 1):
+            client_paths[f'normal_{i}'] = f'logs/normal_{i}.hist.json'
+        return client_paths
+
+    def client_class(self, key):
+        """Class of a client id (rogue/normal_N) or server-side key (client IP)"""
+        return 'rogue' if key in ('rogue', '10.0.0.1') else 'normal'
+
+    def latency_metrics(self):
+        """Per-class p50/p99/p999 (ms) from the client and server histograms"""
+        metrics = summarize('logs/server.hist.json', self.hist_paths(), self.client_class)
+        for name in sorted(metrics):
+            print(f"  {name} = {metrics[name]:.2f} ms")
+        return metrics
     
+    def load_jfi(self):
+        """Mean JFI per c for the latest sweep in the results store"""
+        store = ResultsStore(RESULTS_DB)
+        rows = store.metric_rows(store.latest_experiment(EXPERIMENT), "jfi")
+        store.close()
+        by_c = {}
+        for row in rows:
+            by_c.setdefault(int(row['x']), []).append(row['value'])
+        c_values = sorted(by_c)
+        return c_values, [sum(by_c[c]) / len(by_c[c]) for c in c_values]
+
     def plot_jfi_vs_c(self, c_values, jfi_values):
         """Plot JFI values vs c values"""
         plt.figure(figsize=(8, 6))
@@ -159,9 +262,12 @@ class Runner:
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--single', action='store_true', help='Run single experiment with config c value')
+    parser.add_argument('--transport', choices=['tcp', 'udp', 'unix'],
+                        help='Override the config transport')
+    parser.add_argument('--loss', type=float, help='Random loss (%%) on every link')
     args = parser.parse_args()
     
-    runner = Runner()
+    runner = Runner(transport=args.transport, loss=args.loss)
     
     if args.single:
         # Run single experiment with config c value
@@ -171,11 +277,8 @@ def main():
         print(f"JFI for c={runner.c}: {jfi:.4f}")
     else:
         # Run experiments with varying c values
-        if os.path.exists('results.csv'):
-            os.remove('results.csv')
-            
-        c_values, jfi_results = runner.run_varying_c()
-        runner.plot_jfi_vs_c(c_values, jfi_results)
+        runner.run_varying_c()
+        runner.plot_jfi_vs_c(*runner.load_jfi())
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
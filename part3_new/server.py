@@ -1,35 +1,64 @@
+import os
+import sys
+import time
 import socket
 import threading
 import json
 from collections import deque
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.stats import ServerStats, serve_stats
+from common.instrument import RequestTimer
+from common.profiling import install_profiling
+from common.servicetrace import install_trace
+from common.datagram import serve_udp
+from common.unixsock import listen_config, peer_key
+from common.wordindex import load_words
+
 # Load configuration
 with open('config.json', 'r') as f:
     config = json.load(f)
 
 HOST = config['server_ip']
 PORT = config['port']
+INSTRUMENT = int(config.get('instrument', 0))  # optional per-request latency histograms
+timer = RequestTimer(config.get('hist_path', 'logs/server.hist.json')) if INSTRUMENT else None
 
-# Read words from file
-with open('words.txt', 'r') as f:
-    words = f.read().strip().split(',')
+# Read words from file (or open its sparse index if "word_index" is set)
+words = load_words('words.txt', 1, config)
 
 # Thread-safe queue for requests
 request_queue = deque()
 queue_lock = threading.Lock()
 condition = threading.Condition(queue_lock)
 
+def queue_depth():
+    with condition:
+        per_client = {}
+        for _, _, client_id, _ in request_queue:
+            per_client[client_id] = per_client.get(client_id, 0) + 1
+    return {"total": sum(per_client.values()), "per_client": per_client}
+
+stats = ServerStats(queue_depth)  # live counters, queried via stats_port / stats_socket
+
+def enqueue_request(conn, client_id, data):
+    """Add a request to the queue and wake the worker"""
+    t_enq = time.perf_counter_ns() if INSTRUMENT else 0
+    with condition:
+        request_queue.append((conn, data, client_id, t_enq))
+        condition.notify()
+
 def handle_client(conn, addr):
     print(f"Connected by {addr}")
     try:
         data = conn.recv(1024).decode().strip()
         if not data:
+            conn.close()
+            stats.on_close()
             return
         
         # Add request to queue
-        with condition:
-            request_queue.append((conn, data))
-            condition.notify()
+        enqueue_request(conn, peer_key(conn, addr), data)
             
     except Exception as e:
         print(f"Error handling client {addr}: {e}")
@@ -37,41 +66,45 @@ def handle_client(conn, addr):
         # Note: Connection will be closed by the worker thread
         pass
 
+def build_response(data):
+    """Response line for a request "p,k"; raises ValueError if p or k is not an integer"""
+    # Parse request
+    parts = data.split(',')
+    if len(parts) != 2:
+        return "Invalid request format. Use: p,k\\n"
+        
+    p = int(parts[0])
+    k = int(parts[1])
+    
+    # Check if offset is valid
+    if p >= len(words):
+        return "EOF\n"
+        
+    # Get words starting at offset p
+    end_idx = min(p + k, len(words))
+    response_words = words[p:end_idx]
+    
+    # Add EOF if reached end of file
+    if end_idx == len(words):
+        response_words.append("EOF")
+        
+    return ','.join(response_words) + '\n'
+
 def process_requests():
     while True:
         with condition:
             while not request_queue:
                 condition.wait()
-            conn, data = request_queue.popleft()
+            conn, data, client_id, t_enq = request_queue.popleft()
         
+        nbytes = 0
+        payload = None
+        t_deq = time.perf_counter_ns()
         try:
-            # Parse request
-            parts = data.split(',')
-            if len(parts) != 2:
-                conn.send("Invalid request format. Use: p,k\\n".encode())
-                conn.close()
-                continue
-                
-            p = int(parts[0])
-            k = int(parts[1])
-            
-            # Check if offset is valid
-            if p >= len(words):
-                conn.send("EOF\n".encode())
-                conn.close()
-                continue
-                
-            # Get words starting at offset p
-            end_idx = min(p + k, len(words))
-            response_words = words[p:end_idx]
-            
-            # Add EOF if reached end of file
-            if end_idx == len(words):
-                response_words.append("EOF")
-                
-            # Send response
-            response = ','.join(response_words) + '\n'
-            conn.send(response.encode())
+            payload = build_response(data).encode()
+            nbytes = conn.send(payload)
+            if INSTRUMENT:
+                timer.record(client_id, t_enq, t_deq, time.perf_counter_ns())
             
         except ValueError:
             conn.send("Invalid parameters. Use integers: p,k\\n".encode())
@@ -79,8 +112,20 @@ def process_requests():
             print(f"Error processing request: {e}")
         finally:
             conn.close()
+            stats.on_close()
+            stats.on_served(client_id, nbytes, time.perf_counter_ns() - t_deq, payload=payload)
+
+def accept_loop(s):
+    """Accept connections, one reader thread each"""
+    while True:
+        conn, addr = s.accept()
+        stats.on_accept()
+        client_thread = threading.Thread(target=handle_client, args=(conn, addr))
+        client_thread.start()
 
 def start_server():
+    if INSTRUMENT:
+        timer.dump_at_exit()
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         s.bind((HOST, PORT))
@@ -90,12 +135,17 @@ def start_server():
         # Start worker thread
         worker = threading.Thread(target=process_requests, daemon=True)
         worker.start()
+        serve_stats(stats, config)
+        serve_udp(config, enqueue_request, stats)  # "udp_port": datagram requests, same queue
+        us = listen_config(config)                 # "unix_socket": connections there too
+        if us:
+            threading.Thread(target=accept_loop, args=(us,), daemon=True).start()
+        install_profiling(stats, config)
+        install_trace(stats, config)
+        print("READY", flush=True)
         
         # Accept connections
-        while True:
-            conn, addr = s.accept()
-            client_thread = threading.Thread(target=handle_client, args=(conn, addr))
-            client_thread.start()
+        accept_loop(s)
 
 if __name__ == "__main__":
     start_server()
\ No newline at end of file
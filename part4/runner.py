@@ -2,16 +2,34 @@
 
 import json
 import os
-import time
+import sys
 import glob
 import numpy as np
 import argparse
 import matplotlib.pyplot as plt
+from subprocess import PIPE, STDOUT
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.readiness import wait_ready, stop
+from common.results_store import ResultsStore
+from common.adaptive import AdaptiveRepeats
+from common.instrument import summarize, store_samples
+from common.stats import Sampler, query
+from common.agent import AgentHandle, start_together
+from common.profiling import ProfileCapture
+
+AGENT = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "common", "agent.py")
+RESULTS_DB = "results.db"
+EXPERIMENT = "part4_rr"
 
 class Runner:
-    def __init__(self, config_file='config.json'):
+    def __init__(self, config_file='config.json', transport=None, loss=None):
         with open(config_file, 'r') as f:
             self.config = json.load(f)
+        # command-line overrides are stored with the experiment's config
+        if transport is not None:
+            self.config['transport'] = transport
+        if loss is not None:
+            self.config['link_loss_pct'] = loss
         
         self.server_ip = self.config['server_ip']
         self.port = self.config['port']
@@ -19,32 +37,60 @@ class Runner:
         self.c = self.config['c']
         self.p = self.config['p']
         self.k = self.config['k']
+        # "udp": clients send datagrams to udp_port, "unix": they connect to
+        # unix_socket (hosts share the file system); the server serves both too
+        self.transport = self.config.get('transport', 'tcp')
+        self.loss = self.config.get('link_loss_pct', 0)   # random loss (%) on every link
+        if self.transport == 'udp' and not self.config.get('udp_port'):
+            raise SystemExit("transport udp needs udp_port in config.json")
+        if self.transport == 'unix' and not self.config.get('unix_socket'):
+            raise SystemExit("transport unix needs unix_socket in config.json")
         self.num_repetitions = self.config.get('num_repetitions', 2)
+        # fixed num_repetitions unless config sets ci_target_abs / ci_target_rel
+        self.repeats = AdaptiveRepeats.from_config(self.config, self.num_repetitions)
+        self.instrument = int(self.config.get('instrument', 0))
+        # seconds a client may run before it is killed and the run marked failed
+        self.client_timeout = self.config.get('client_timeout_s')
+        # "classes": {"rogue": {"prio": 0}, "normal": {"prio": 1, "deadline_ms": 20}}
+        # tags each role's requests (use with "scheduler": "prio" or "edf"); with a
+        # "stats_socket" the server's per-class waits are read after every run
+        self.classes = self.config.get('classes', {})
+        self.store = ResultsStore(RESULTS_DB)
+        self.experiment = None
+        self.net = None          # network and client agents are reused across runs
+        self.agents = []
         
-        print(f"Config: {self.num_clients} clients, c={self.c}, p={self.p}, k={self.k}")
+        print(f"Config: {self.num_clients} clients, c={self.c}, p={self.p}, k={self.k}, "
+              f"transport={self.transport}, loss={self.loss}%")
     
     def cleanup_logs(self):
         """Clean old log files"""
-        logs = glob.glob("logs/*.log")
+        logs = glob.glob("logs/*.log") + glob.glob("logs/*.hist.json") + glob.glob("logs/*.jsonl")
         for log in logs:
             os.remove(log)
         print("Cleaned old logs")
     
-    def parse_logs(self):
-        """Parse log files and return completion times"""
-        completion_times = {'rogue': [], 'normal': []}
+    def parse_results(self, client_ids, replies):
+        """Completion times (s) from the clients' results"""
+        completion_times = {'rogue': [], 'normal': [], 'clients': {}, 'words': 0, 'bytes': 0,
+                            'retransmits': 0, 'connects': 0, 'connect_ms': 0.0,
+                            'handshake_saved_ms': 0.0}
         
-        log_files = glob.glob("logs/*.log")
-        for log_file in log_files:
-            with open(log_file, 'r') as f:
-                try:
-                    time_val = float(f.read().strip())
-                    if 'rogue' in log_file:
-                        completion_times['rogue'].append(time_val)
-                    else:
-                        completion_times['normal'].append(time_val)
-                except ValueError:
-                    print(f"Invalid content in {log_file}")
+        for cid, reply in zip(client_ids, replies):
+            result = reply.get('result')
+            if not reply.get('ok') or not result:
+                continue
+            time_val = result['elapsed_ms'] / 1000.0
+            completion_times['clients'][cid] = time_val
+            if cid == 'rogue':
+                completion_times['rogue'].append(time_val)
+            else:
+                completion_times['normal'].append(time_val)
+            completion_times['words'] += result.get('words', 0)
+            completion_times['bytes'] += result.get('bytes', 0)
+            completion_times['retransmits'] += result.get('retransmits', 0)
+            for name in ('connects', 'connect_ms', 'handshake_saved_ms'):
+                completion_times[name] += result.get(name, 0)
         
         return completion_times
     
@@ -63,56 +109,96 @@ class Runner:
         jfi = (sum_throughput ** 2) / (n * sum_squared_throughput)
         return jfi
     
-    def run_experiment(self, c_value):
+    def start_network(self):
+        """Create the topology and one warm client agent per client host"""
+        from topology import create_network
+        self.net = create_network(num_clients=self.num_clients, loss=self.loss)
+        for i in range(self.num_clients):
+            proc = self.net.get(f'client{i+1}').popen(
+                f"python3 {AGENT} client.py", stdin=PIPE, stdout=PIPE, stderr=STDOUT)
+            self.agents.append(AgentHandle(proc, name=f'client{i+1}'))
+        for agent in self.agents:
+            agent.wait_ready()
+
+    def stop_network(self):
+        """Stop the client agents and the network"""
+        for agent in self.agents:
+            agent.close()
+        self.agents = []
+        if self.net is not None:
+            self.net.stop()
+            self.net = None
+
+    def run_experiment(self, c_value, rep=1):
         """Run single experiment with given c value"""
         print(f"Running experiment with c={c_value}")
         
         # Clean logs
         self.cleanup_logs()
         
-        # Create network
-        from topology import create_network
-        net = create_network(num_clients=self.num_clients)
+        # Create network and agents on first use
+        if self.net is None:
+            self.start_network()
+        
+        # Client 1 is rogue (batch size c), clients 2-N are normal (batch size 1)
+        client_ids = ['rogue'] + [f'normal_{i+1}' for i in range(1, self.num_clients)]
         
+        # Start server
+        print("Starting server...")
+        server_proc = self.net.get('server').popen("python3 server.py", stdout=PIPE, stderr=STDOUT)
+        sampler = None
+        failed = None
         try:
-            # Get hosts
-            server = net.get('server')
-            clients = [net.get(f'client{i+1}') for i in range(self.num_clients)]
+            wait_ready(server_proc)
+            sampler = self.start_sampler()
+            # config "profile_at": profile the first repetition at this c
+            profile = ProfileCapture.for_run(self.config, server_proc, c_value, rep)
             
-            # Start server
-            print("Starting server...")
-            server_proc = server.popen("python3 server.py")
-            time.sleep(3)
-            
-            # Start clients
+            # Start clients: all prepare, then start on one signal
             print("Starting clients...")
-            # Client 1 is rogue (batch size c)
-            rogue_proc = clients[0].popen(f"python3 client.py --batch-size {c_value} --client-id rogue")
-            
-            # Clients 2-N are normal (batch size 1)
-            normal_procs = []
-            for i in range(1, self.num_clients):
-                proc = clients[i].popen(f"python3 client.py --batch-size 1 --client-id normal_{i+1}")
-                normal_procs.append(proc)
-            
-            # Wait for all clients
-            rogue_proc.wait()
-            for proc in normal_procs:
-                proc.wait()
-            
-            # Stop server
-            server_proc.terminate()
-            server_proc.wait()
-            time.sleep(2)
-            
-            # Parse results
-            time.sleep(1)
-            results = self.parse_logs()
-            
-            return results
+            jobs = [(["--batch-size", c_value if cid == 'rogue' else 1, "--client-id", cid,
+                      "--transport", self.transport, *self.hist_argv(cid),
+                      *self.class_argv(self.client_class(cid))], None)
+                    for cid in client_ids]
             
+            # Wait for all clients; failures are printed as they happen
+            t_go, replies = start_together(self.agents, jobs, run_timeout=self.client_timeout,
+                                           on_reply=self.warn_failed)
+            starts = [r['start_mono'] for r in replies if r.get('ok')]
+            if starts:
+                print(f"Start skew: max {1000 * (max(starts) - t_go):.3f} ms")
+            if profile:
+                profile.finish()
+            self.stop_sampler(sampler)
+            sampler = None
+            class_stats = self.query_classes()
+        except RuntimeError as e:
+            # server not ready, or an agent failed to prepare or reply
+            failed = e
         finally:
-            net.stop()
+            if sampler is not None:
+                sampler.stop()            # the run failed while it was polling
+            # Stop server
+            stop(server_proc)
+            if failed or not all(agent.alive for agent in self.agents):
+                self.stop_network()       # restart agents (and network) next run
+        
+        if failed:
+            print(f"[WARN] c={c_value}, rep={rep} failed: {failed}", flush=True)
+            return self.failed_results(client_ids)
+        
+        # Collect results
+        results = self.parse_results(client_ids, replies)
+        results['latency'] = self.latency_metrics() if self.instrument else {}
+        results['classes'] = class_stats
+        
+        return results
+
+    def failed_results(self, client_ids):
+        """Results of a run that failed before its clients reported: NaN times, nothing counted"""
+        results = self.parse_results([], [])
+        results['clients'] = dict.fromkeys(client_ids, float('nan'))
+        return results
     
     def run_varying_c(self):
         """Run experiments with c from 1 to 10"""
@@ -121,29 +207,146 @@ class Runner:
         
         print("Running experiments with varying c values...")
         
+        try:
+            self.run_sweep(c_values, jfi_results)
+        finally:
+            self.stop_network()
+            
+        self.store.close()
+        return c_values, jfi_results
+
+    def run_sweep(self, c_values, jfi_results):
+        """Repeat each c until the JFI estimate is settled; append its mean JFI"""
         for c in c_values:
-            jfi_sum = 0
-            for rep in range(self.num_repetitions):
-                print(f"\n--- Testing c = {c}, repetition {rep+1}/{self.num_repetitions} ---")
-                results = self.run_experiment(c)
+            jfis = []
+            rep = 0
+            while not self.repeats.done(jfis, attempts=rep):
+                print(f"\n--- Testing c = {c}, repetition {rep+1} (max {self.repeats.max_runs}) ---")
+                results = self.run_experiment(c, rep + 1)
                 
-                # Combine all completion times
+                # Combine all completion times; a run where some client failed
+                # counts as an attempt but gets no JFI
                 all_times = results['rogue'] + results['normal']
-                jfi = self.calculate_jfi(all_times)
-                jfi_sum += jfi
+                if len(all_times) == self.num_clients:
+                    jfi = self.calculate_jfi(all_times)
+                    jfis.append(jfi)
+                else:
+                    print(f"[WARN] Expected {self.num_clients} times, got {len(all_times)}")
+                    jfi = float('nan')
+                self.record_run(c, rep + 1, results, jfi)
+                rep += 1
                 
-                print(f"JFI for c={c}, rep{rep+1}: {jfi:.4f}")
+                print(f"JFI for c={c}, rep{rep}: {jfi:.4f}")
             
-            avg_jfi = jfi_sum / self.num_repetitions
+            avg_jfi = sum(jfis) / len(jfis) if jfis else 0.0
             jfi_results.append(avg_jfi)
-            print(f"Average JFI for c={c}: {avg_jfi:.4f}")
-            
-            # Save results to CSV
-            with open('results.csv', 'a') as f:
-                f.write(f"{c},{avg_jfi:.4f}\n")
-        
-        return c_values, jfi_results
+            print(f"Average JFI for c={c}: {avg_jfi:.4f} ({self.repeats.describe(jfis)})")
+
+    def warn_failed(self, agent, reply):
+        """Report a failed or late client as soon as it is detected"""
+        if not reply.get('ok'):
+            print(f"[WARN] {agent.name}: {reply.get('error')}", flush=True)
+
+    def start_sampler(self):
+        """Poll the server's stats socket during the run (if configured)"""
+        path = self.config.get('stats_socket')
+        if not path:
+            return None
+        return Sampler(path, int(self.config.get('stats_sample_ms', 500)) / 1000.0).start()
+
+    def stop_sampler(self, sampler):
+        if sampler is None:
+            return
+        snapshots = sampler.stop()
+        with open('logs/stats.jsonl', 'w') as f:
+            for snap in snapshots:
+                f.write(json.dumps(snap) + '\n')
+        if snapshots:
+            last = snapshots[-1]
+            print(f"  queue depth={last['queue_depth']}, service share="
+                  + ", ".join(f"{c}:{s:.2f}" for c, s in sorted(last['share'].items())))
+
+    def class_argv(self, role):
+        cls = self.classes.get(role, {})
+        argv = ["--prio", cls['prio']] if 'prio' in cls else []
+        if 'deadline_ms' in cls:
+            argv += ["--deadline-ms", cls['deadline_ms']]
+        return argv
+
+    def query_classes(self):
+        """The server's per-class queue waits and deadline misses (needs a stats_socket)"""
+        path = self.config.get('stats_socket')
+        if not path:
+            return {}
+        try:
+            classes = query(path, "classes")
+        except (OSError, ValueError):
+            return {}
+        for prio, c in classes.items():
+            print(f"  class {prio}: served={c['served']} wait p50={c['p50_wait_ms']:.2f} "
+                  f"p99={c['p99_wait_ms']:.2f} p999={c['p999_wait_ms']:.2f} "
+                  f"max={c['max_wait_ms']:.2f} ms missed={c['missed']}/{c['deadlines']}")
+        return classes
+
+    def hist_argv(self, client_id):
+        return ["--hist", f"logs/{client_id}.hist.json"] if self.instrument else []
+
+    def hist_paths(self):
+        """Each client id's RTT histogram dump"""
+        client_paths = {'rogue': 'logs/rogue.hist.json'}
+        for i in range(2, self.num_clients + 1):
+            client_paths[f'normal_{i}'] = f'logs/normal_{i}.hist.json'
+        return client_paths
+
+    def client_class(self, key):
+        """Class of a client id (rogue/normal_N) or server-side key (client IP)"""
+        return 'rogue' if key in ('rogue', '10.0.0.1') else 'normal'
+
+    def latency_metrics(self):
+        """Per-class p50/p99/p999 (ms) from the client and server histograms"""
+        metrics = summarize('logs/server.hist.json', self.hist_paths(), self.client_class)
+        for name in sorted(metrics):
+            print(f"  {name} = {metrics[name]:.2f} ms")
+        return metrics
+
+    def record_run(self, c_value, rep, results, jfi):
+        """Store raw per-client times (ms) and JFI for one repetition"""
+        if self.experiment is None:
+            self.experiment = self.store.new_experiment(EXPERIMENT, self.config)
+        run = self.store.add_run(self.experiment, "c", c_value, rep)
+        for name, secs in results['clients'].items():
+            cls = 'rogue' if name == 'rogue' else 'normal'
+            self.store.add_client(run, name, cls, elapsed_ms=secs * 1000.0)
+        self.store.add_metric(run, "jfi", jfi)
+        self.store.add_metric(run, "words", results['words'])
+        self.store.add_metric(run, "bytes", results['bytes'])
+        if self.transport == 'udp':
+            self.store.add_metric(run, "retransmits", results['retransmits'])
+        else:
+            # handshakes paid, and (with keep_alive) the handshake time the pooled connections saved
+            for name in ('connects', 'connect_ms', 'handshake_saved_ms'):
+                self.store.add_metric(run, name, results[name])
+        for name, value in results.get('latency', {}).items():
+            self.store.add_metric(run, name, value)
+        if self.instrument:
+            # every request's RTT and queue wait, for perfmodel.py
+            store_samples(self.store, run, 'logs/server.hist.json', self.hist_paths())
+        for prio, c in results.get('classes', {}).items():
+            for name in ('mean_wait_ms', 'p50_wait_ms', 'p99_wait_ms', 'p999_wait_ms',
+                         'max_wait_ms', 'missed'):
+                self.store.add_metric(run, f"class{prio}_{name}", c[name])
     
+    def load_jfi(self):
+        """Mean JFI per c for the latest sweep in the results store"""
+        store = ResultsStore(RESULTS_DB)
+        rows = store.metric_rows(store.latest_experiment(EXPERIMENT), "jfi")
+        store.close()
+        by_c = {}
+        for row in rows:
+            by_c.setdefault(int(row['x']), []).append(row['value'])
+        c_values = sorted(by_c)
+        return c_values, [sum(by_c[c]) / len(by_c[c]) for c in c_values]
+
     def plot_jfi_vs_c(self, c_values, jfi_values):
         """Plot JFI values vs c values"""
         plt.figure(figsize=(8, 6))
@@ -159,23 +362,26 @@ class Runner:
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--single', action='store_true', help='Run single experiment with config c value')
+    parser.add_argument('--transport', choices=['tcp', 'udp', 'unix'],
+                        help='Override the config transport')
+    parser.add_argument('--loss', type=float, help='Random loss (%%) on every link')
     args = parser.parse_args()
     
-    runner = Runner()
+    runner = Runner(transport=args.transport, loss=args.loss)
     
     if args.single:
         # Run single experiment with config c value
-        results = runner.run_experiment(runner.c)
+        try:
+            results = runner.run_experiment(runner.c)
+        finally:
+            runner.stop_network()
         all_times = results['rogue'] + results['normal']
         jfi = runner.calculate_jfi(all_times)
         print(f"JFI for c={runner.c}: {jfi:.4f}")
     else:
         # Run experiments with varying c values
-        if os.path.exists('results.csv'):
-            os.remove('results.csv')
-            
-        c_values, jfi_results = runner.run_varying_c()
-        runner.plot_jfi_vs_c(c_values, jfi_results)
+        runner.run_varying_c()
+        runner.plot_jfi_vs_c(*runner.load_jfi())
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,7 +1,23 @@
+import os
+import sys
+import time
 import socket
+import selectors
 import threading
 import json
-from collections import deque, defaultdict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.instrument import RequestTimer
+from common.stats import ServerStats, serve_stats
+from common.profiling import install_profiling
+from common.servicetrace import install_trace
+from common.datagram import serve_udp
+from common.unixsock import listen_config, peer_key
+from common.wordindex import load_words
+from common.workerpool import WorkerPool
+from common.scheduling import RequestQueue, split_tags
 
 # Load configuration
 with open('config.json', 'r') as f:
@@ -9,120 +25,259 @@ with open('config.json', 'r') as f:
 
 HOST = config['server_ip']
 PORT = config['port']
+INSTRUMENT = int(config.get('instrument', 0))  # optional per-request latency histograms
+timer = RequestTimer(config.get('hist_path', 'logs/server.hist.json')) if INSTRUMENT else None
+WORKERS = int(config.get('workers', 0))  # >0: serve from a pool of worker processes
+pool = None  # WorkerPool, created in start_server() before any thread starts
+# How accepted connections are read: "thread" (one thread each), "pool"
+# (accept_threads reader threads) or "selector" (the accept loop reads them)
+ACCEPT_MODE = config.get('accept_mode', 'thread')
+ACCEPT_THREADS = int(config.get('accept_threads', 8))
+readers = None  # the reader ThreadPoolExecutor of accept_mode "pool"
+idle = None     # IdleWatcher of accept_mode "pool" with keep_alive
+# Keep a connection open after its response and read the next request from
+# it (clients reuse their connections, see common/connpool.py)
+KEEP_ALIVE = bool(int(config.get('keep_alive', 0)))
+
+# Read words from file (or open its sparse index if "word_index" is set)
+words = load_words('words.txt', 1, config) if not WORKERS else None
+
+# Per-client-IP request queues, served round robin unless config.json sets
+# "scheduler" (fcfs, rr, srpt, prio, edf); created in start_server()
+requests = None
+
+def queue_depth():
+    per_client = requests.depth()
+    return {"total": sum(per_client.values()), "per_client": per_client}
 
-# Read words from file
-with open('words.txt', 'r') as f:
-    words = f.read().strip().split(',')
+stats = ServerStats(queue_depth)  # live counters, queried via stats_port / stats_socket
 
-# Thread-safe client queues for round-robin scheduling
-client_queues = defaultdict(deque)
-active_clients = set()
-queue_lock = threading.Lock()
-condition = threading.Condition(queue_lock)
+def enqueue_request(conn, client_id, data):
+    """Add a request to its client's queue and wake the worker"""
+    t_enq = time.perf_counter_ns() if INSTRUMENT else 0
+    data, prio, deadline_ms = split_tags(data)  # optional ";prio=..;deadline_ms=.."
+    try:
+        p, k = map(int, data.split(','))
+    except ValueError:
+        p, k = None, 1  # answered with an error right away
+    requests.put(client_id, (conn, data, t_enq), p, k, prio, deadline_ms)
 
 def handle_client(conn, addr):
-    print(f"Connected by {addr}")
-    client_id = addr[0]  # Use client IP as identifier
-    
+    if ACCEPT_MODE == 'thread':
+        print(f"Connected by {addr}")
+    client_id = peer_key(conn, addr)  # Use client IP as identifier (unix:<pid> on the Unix socket)
+    read_requests(conn, client_id)
+
+def read_requests(conn, client_id):
+    """Queue the connection's request; with keep_alive in thread mode, every request until it closes"""
     try:
-        data = conn.recv(1024).decode().strip()
-        if not data:
-            return
-        
-        # Add request to the client's queue
-        with condition:
-            client_queues[client_id].append((conn, data))
-            active_clients.add(client_id)
-            condition.notify()
+        while True:
+            data = conn.recv(1024).decode().strip()
+            if not data:
+                conn.close()
+                stats.on_close()
+                return
+            
+            # Add request to the client's queue
+            enqueue_request(conn, client_id, data)
+            if not (KEEP_ALIVE and ACCEPT_MODE == 'thread'):
+                return  # closed by the worker, or read again once it has responded
             
     except Exception as e:
-        print(f"Error handling client {addr}: {e}")
-    finally:
-        # Note: Connection will be closed by the worker thread
-        pass
+        print(f"Error handling client {client_id}: {e}")
 
-def process_requests():
-    # For round-robin, we'll keep track of which clients we've processed
-    current_client_idx = 0
-    client_list = []
+class IdleWatcher:
+    """Hands kept-alive connections back to the reader pool once their next request arrives.
+
+    A reader blocked on an idle connection would keep it from reading new
+    ones, so connections wait here, in one selector, instead.
+    """
+
+    def __init__(self):
+        self.sel = selectors.DefaultSelector()
+        self.pending = deque()  # (conn, client_id) to watch, added by the worker
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.sel.register(self.wake_r, selectors.EVENT_READ, None)
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def watch(self, conn, client_id):
+        self.pending.append((conn, client_id))
+        self.wake_w.send(b'\0')
+
+    def run(self):
+        while True:
+            for key, _ in self.sel.select():
+                if key.data is None:
+                    self.wake_r.recv(4096)
+                    while self.pending:
+                        conn, client_id = self.pending.popleft()
+                        self.sel.register(conn, selectors.EVENT_READ, client_id)
+                else:
+                    self.sel.unregister(key.fileobj)
+                    readers.submit(read_requests, key.fileobj, key.data)
+
+def release(conn, client_id):
+    """The worker is done with a request's connection: close it, or keep it for the next request"""
+    if KEEP_ALIVE and isinstance(conn, socket.socket):
+        if idle is not None:
+            idle.watch(conn, client_id)
+        # thread and selector mode: still watched by its reader
+        return
+    conn.close()
+    stats.on_close()
+
+def accept_ready(sel, s):
+    """Accept every pending connection and watch it for its request line"""
+    while True:
+        try:
+            conn, addr = s.accept()
+        except BlockingIOError:
+            return
+        stats.on_accept()
+        conn.setblocking(False)
+        sel.register(conn, selectors.EVENT_READ, (peer_key(conn, addr), bytearray()))
+
+def read_ready(sel, conn, client_id, buf):
+    """Read a request line without blocking; queue it once it is complete"""
+    try:
+        chunk = conn.recv(1024 - len(buf))
+    except BlockingIOError:
+        return
+    except OSError:
+        chunk = b''
+    buf += chunk
+    if chunk and b'\n' not in buf and len(buf) < 1024:
+        return  # partial line, wait for the rest
+    data = buf.decode(errors='replace').strip()
+    if KEEP_ALIVE and data:
+        del buf[:]  # stay registered for the next request
+    else:
+        sel.unregister(conn)
+    if not data:
+        conn.close()
+        stats.on_close()
+        return
+    # the worker sends with blocking calls
+    conn.setblocking(True)
+    enqueue_request(conn, client_id, data)
+
+def selector_loop(listeners):
+    """Accept and read all connections from this thread, no thread per connection"""
+    sel = selectors.DefaultSelector()
+    for s in listeners:
+        s.setblocking(False)
+        sel.register(s, selectors.EVENT_READ, None)
+    while True:
+        for key, _ in sel.select():
+            if key.data is None:
+                accept_ready(sel, key.fileobj)
+            else:
+                read_ready(sel, key.fileobj, *key.data)
+
+def accept_loop(s, readers):
+    """Accept connections; read each in the reader pool or its own thread"""
+    while True:
+        conn, addr = s.accept()
+        stats.on_accept()
+        if readers:
+            readers.submit(handle_client, conn, addr)
+        else:
+            client_thread = threading.Thread(target=handle_client, args=(conn, addr))
+            client_thread.start()
+
+def build_response(data):
+    """Response line for a request "p,k"; raises ValueError if p or k is not an integer"""
+    # Parse request
+    parts = data.split(',')
+    if len(parts) != 2:
+        return "Invalid request format. Use: p,k\n"
+        
+    p = int(parts[0])
+    k = int(parts[1])
     
+    # Check if offset is valid (same bounds as the worker processes, workerpool.py)
+    if p < 0 or p >= len(words):
+        return "EOF\n"
+        
+    # Get words starting at offset p
+    end_idx = min(p + k, len(words))
+    response_words = words[p:end_idx]
+    
+    # Add EOF if reached end of file
+    if end_idx == len(words):
+        response_words.append("EOF")
+        
+    return ','.join(response_words) + '\n'
+
+def process_requests():
     while True:
-        with condition:
-            # Wait until there's at least one request to process
-            while not active_clients:
-                condition.wait()
-            
-            # Update the client list if it changed
-            if set(client_list) != active_clients:
-                client_list = list(active_clients)
-                
-            # No clients left to process
-            if not client_list:
-                continue
-                
-            # Round-robin: Move to next client with requests
-            attempts = 0
-            while attempts < len(client_list):
-                current_client_idx = (current_client_idx) % len(client_list)
-                client_id = client_list[current_client_idx]
-                
-                if client_queues[client_id]:
-                    # Process one request from this client
-                    conn, data = client_queues[client_id].popleft()
-                    
-                    # If this client has no more requests, remove from active list
-                    if not client_queues[client_id]:
-                        active_clients.remove(client_id)
-                        
-                    # Move to the next client for next time
-                    current_client_idx = (current_client_idx + 1) % len(client_list)
-                    break
-                else:
-                    # This client has no requests, try next client
-                    current_client_idx = (current_client_idx + 1) % len(client_list)
-                    attempts += 1
-            
-            # If we've checked all clients and found no requests, wait
-            if attempts == len(client_list):
-                continue
+        # Wait until there's a request to process
+        client_id, (conn, data, t_enq) = requests.get()
         
+        nbytes = 0
+        payload = None
         try:
-            # Parse request
-            parts = data.split(',')
-            if len(parts) != 2:
-                conn.send("Invalid request format. Use: p,k\\n".encode())
-                conn.close()
-                continue
-                
-            p = int(parts[0])
-            k = int(parts[1])
-            
-            # Check if offset is valid
-            if p >= len(words):
-                conn.send("EOF\n".encode())
-                conn.close()
-                continue
-                
-            # Get words starting at offset p
-            end_idx = min(p + k, len(words))
-            response_words = words[p:end_idx]
-            
-            # Add EOF if reached end of file
-            if end_idx == len(words):
-                response_words.append("EOF")
-                
-            # Send response
-            response = ','.join(response_words) + '\n'
-            conn.send(response.encode())
+            t_deq = time.perf_counter_ns()
+            payload = build_response(data).encode()
+            nbytes = conn.send(payload)
+            if INSTRUMENT:
+                timer.record(client_id, t_enq, t_deq, time.perf_counter_ns())
             
         except ValueError:
-            conn.send("Invalid parameters. Use integers: p,k\\n".encode())
+            conn.send("Invalid parameters. Use integers: p,k\n".encode())
         except Exception as e:
             print(f"Error processing request: {e}")
         finally:
-            conn.close()
+            release(conn, client_id)
+            stats.on_served(client_id, nbytes, time.perf_counter_ns() - t_deq, payload=payload)
+
+def pool_dispatch():
+    """Hand requests to the worker processes in scheduling order; reply in that order"""
+    def next_request():
+        while True:
+            picked = requests.get(block=False)
+            if picked is None:
+                return None
+            client_id, (conn, data, t_enq) = picked
+            t_deq = time.perf_counter_ns()
+            parts = data.split(',')
+            try:
+                if len(parts) == 2:
+                    return (conn, client_id, t_enq, t_deq), int(parts[0]), int(parts[1])
+                conn.send("Invalid request format. Use: p,k\n".encode())
+            except ValueError:
+                conn.send("Invalid parameters. Use integers: p,k\n".encode())
+            except Exception as e:
+                print(f"Error processing request: {e}")
+            # only malformed requests get here
+            release(conn, client_id)
+            stats.on_served(client_id, 0, time.perf_counter_ns() - t_deq)
+
+    def deliver(ctx, data, busy_ns):
+        conn, client_id, t_enq, t_deq = ctx
+        nbytes = 0
+        try:
+            nbytes = conn.send(data)
+            if INSTRUMENT:
+                timer.record(client_id, t_enq, t_deq, time.perf_counter_ns())
+        except Exception as e:
+            print(f"Error processing request: {e}")
+        finally:
+            release(conn, client_id)
+            stats.on_served(client_id, nbytes, busy_ns, payload=data)
+
+    pool.run(next_request, deliver)
 
 def start_server():
+    global pool, requests, readers, idle
+    if INSTRUMENT:
+        timer.dump_at_exit()
+    if WORKERS:
+        # fork the workers before any other thread exists
+        pool = WorkerPool('words.txt', 1, WORKERS)
+        pool.close_at_exit()
+    requests = RequestQueue.from_config(config, len(pool) if WORKERS else len(words), default='rr')
+    stats.commands["classes"] = lambda args: requests.class_stats()
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         s.bind((HOST, PORT))
@@ -130,14 +285,25 @@ def start_server():
         print(f"Server listening on {HOST}:{PORT}")
         
         # Start worker thread
-        worker = threading.Thread(target=process_requests, daemon=True)
+        worker = threading.Thread(target=pool_dispatch if WORKERS else process_requests, daemon=True)
         worker.start()
+        serve_stats(stats, config)
+        serve_udp(config, enqueue_request, stats)  # "udp_port": datagram requests, same queues
+        us = listen_config(config)                 # "unix_socket": connections there too
+        install_profiling(stats, config)
+        install_trace(stats, config)
+        print("READY", flush=True)
+        
+        if ACCEPT_MODE == 'selector':
+            selector_loop([s, us] if us else [s])
+        readers = ThreadPoolExecutor(ACCEPT_THREADS) if ACCEPT_MODE == 'pool' else None
+        if readers and KEEP_ALIVE:
+            idle = IdleWatcher()
         
         # Accept connections
-        while True:
-            conn, addr = s.accept()
-            client_thread = threading.Thread(target=handle_client, args=(conn, addr))
-            client_thread.start()
+        if us:
+            threading.Thread(target=accept_loop, args=(us, readers), daemon=True).start()
+        accept_loop(s, readers)
 
 if __name__ == "__main__":
     start_server()
\ No newline at end of file
@@ -12,8 +12,10 @@ DEFAULT_CLIENTS = 10
 # =============================================================================
 
 class SimpleTopo(Topo):
-    def __init__(self, num_clients=DEFAULT_CLIENTS):
+    def __init__(self, num_clients=DEFAULT_CLIENTS, loss=0):
         Topo.__init__(self)
+        # optional random loss (%) on every link, e.g. to compare TCP and UDP transports
+        link_opts = {'loss': loss} if loss else {}
         
         # Create switch
         switch = self.addSwitch('s1', cls=OVSSwitch)
@@ -28,15 +30,15 @@ class SimpleTopo(Topo):
             clients.append(client)
         
         # Connect server to switch with hardcoded bandwidth=1
-        self.addLink(server, switch, bw=1)
+        self.addLink(server, switch, bw=1, **link_opts)
         
         # Connect all clients to switch with hardcoded bandwidth=1
         for client in clients:
-            self.addLink(client, switch, bw=1)
+            self.addLink(client, switch, bw=1, **link_opts)
 
-def create_network(num_clients=DEFAULT_CLIENTS):
+def create_network(num_clients=DEFAULT_CLIENTS, loss=0):
     """Create and start the network with hardcoded bandwidth=1 for all links"""
-    topo = SimpleTopo(num_clients)
+    topo = SimpleTopo(num_clients, loss)
     net = Mininet(topo=topo, switch=OVSSwitch, link=TCLink)
     net.start()
     return net